@@ -0,0 +1,42 @@
+#!/usr/bin/python
+import sys
+from teexport import openOutput
+from tealerts import HtmlTableWriter, CsvTableWriter, renderTable
+
+"""
+    In this example we render a ThousandEyes XML alert result, such as
+    alerts-xslt/alerts.xml, into the table of alerts-xslt/alerts.xsl without
+    a browser. The document is streamed, so dumps of hundreds of MB are
+    rendered in constant memory.
+
+    Parameters:
+        Alerts file: XML alert result file, '-' reads standard input
+        Output file: (Optional) File name. Names ending with .csv (or
+                     .csv.gz) are written as CSV, any other as HTML. '-'
+                     writes HTML to standard output (Default).
+    Output:
+        Table of Alert ID, Date Start, Scope and Test Name per alert
+"""
+
+""" Parse the input parameters. """
+if len(sys.argv) < 2 or len(sys.argv) > 3:
+    sys.exit('Use: ' + sys.argv[0] + ' <alerts file> [output file]')
+source = sys.stdin if sys.argv[1] == '-' else sys.argv[1]
+fileName = sys.argv[2] if len(sys.argv) == 3 else '-'
+
+output = openOutput(fileName)
+try:
+    if fileName.endswith('.csv') or fileName.endswith('.csv.gz'):
+        writer = CsvTableWriter(output)
+    else:
+        writer = HtmlTableWriter(output)
+    alerts = renderTable(source, writer)
+except (IOError, SyntaxError), e:
+    """ cElementTree reports malformed documents as SyntaxError subclasses """
+    sys.exit('Cannot render alerts: ' + str(e))
+finally:
+    if fileName != '-':
+        output.close()
+
+if fileName != '-':
+    print 'Completed!\nWrote out {} alerts to {}\n'.format(alerts, fileName)
@@ -0,0 +1,39 @@
+#!/usr/bin/python
+import sys
+import json
+from teapi import ThousandEyesApi
+from tealerts import AlertWatcher
+
+"""
+    In this example we watch the alerts of an account and print what changed
+    since the previous poll, instead of the full list of active alerts.
+
+    Parameters:
+        State file: (Optional) JSON file the known alerts are kept in, so a
+                    restarted watcher only reports changes since it stopped
+        Interval:   (Optional) Seconds between polls (Default 60)
+    Output:
+        One JSON line per new, updated or cleared alert, with the agent and
+        monitor transitions
+"""
+
+""" Parse the input parameters. """
+if len(sys.argv) < 3 or len(sys.argv) > 5:
+    sys.exit('Use: ' + sys.argv[0] + ' <email> <apiToken> [state file] [interval]')
+
+username = sys.argv[1]
+apiToken = sys.argv[2]
+stateFile = sys.argv[3] if len(sys.argv) >= 4 else None
+interval = int(sys.argv[4]) if len(sys.argv) >= 5 else 60
+
+""" Establish the API object with credentials. """
+api = ThousandEyesApi(username, apiToken)
+
+try:
+    for event in AlertWatcher(api, stateFile).watch(interval):
+        print json.dumps(event, sort_keys=True)
+        sys.stdout.flush()
+except KeyboardInterrupt:
+    pass
+except Exception, e:
+    sys.exit(str(e))
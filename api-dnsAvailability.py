@@ -0,0 +1,73 @@
+#!/usr/bin/python
+import sys
+import csv
+import time
+from teapi import ThousandEyesApi
+from tedns import ServerAvailability
+
+"""
+    In this example we compute the availability of the DNS servers of one
+    or more DNS server tests over a time window, per test, agent, server and
+    hour or day, for SLA reporting. Only complete rounds are counted.
+
+    With a state file, the counters are kept between runs and each run only
+    fetches the rounds since the previous one, so the history can grow
+    beyond the time window the API returns.
+
+    Parameters:
+        Test ID:     DNS server test ID, comma separated IDs, or @<file> with
+                     one ID per line.
+        Time window: (Optional) Time window fetched for tests not counted
+                     before, in days (Default 2)
+        State file:  (Optional) JSON file the counters are kept in
+        Resolution:  (Optional) --daily reports days instead of hours
+        Grouping:    (Optional) --by=<dimensions> reports the comma separated
+                     dimensions out of testId, agentName and server, summing
+                     the others (Default testId,agentName,server)
+    Output:
+        CSV rows on the standard output
+"""
+
+""" Parse the input parameters. """
+resolution = 'daily' if '--daily' in sys.argv else 'hourly'
+groupBy = ('testId', 'agentName', 'server')
+for argument in sys.argv[1:]:
+    if argument.startswith('--by='):
+        groupBy = tuple(name for name in argument[5:].split(',') if name)
+sys.argv = [argument for argument in sys.argv if argument != '--daily' and not argument.startswith('--by=')]
+if len(sys.argv) < 4 or len(sys.argv) > 6:
+    sys.exit('Use: ' + sys.argv[0] + ' <email> <apiToken> <test ID[,test ID...] | @file> [time window] [state file]' +
+             ' [--daily] [--by=testId,agentName,server]')
+
+username = sys.argv[1]
+apiToken = sys.argv[2]
+if sys.argv[3].startswith('@'):
+    f = open(sys.argv[3][1:])
+    testIds = [line.strip() for line in f if line.strip()]
+    f.close()
+else:
+    testIds = [testId.strip() for testId in sys.argv[3].split(',') if testId.strip()]
+timeWindow = sys.argv[4] if len(sys.argv) >= 5 else '2'
+stateFile = sys.argv[5] if len(sys.argv) >= 6 else None
+
+""" Establish the API object with credentials. """
+api = ThousandEyesApi(username, apiToken)
+availability = ServerAvailability(stateFile)
+
+failed = []
+for result in availability.update(api, testIds, int(timeWindow) * 24 * 60 * 60):
+    if result['error'] is not None:
+        sys.stderr.write('Test ' + str(result['testId']) + ': ' + result['error'] + '\n')
+        failed.append(result)
+
+""" Print the availability of the requested tests only, the state file may hold others. """
+names = [name for name in ServerAvailability.dimensions if name in groupBy]
+csvWriter = csv.writer(sys.stdout)
+csvWriter.writerow(names + ['Start', 'Queries', 'Successful', 'Availability'])
+for row in availability.query(testIds, resolution=resolution, groupBy=groupBy):
+    csvWriter.writerow([unicode(row[name]).encode('utf-8') for name in names] +
+                       [time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(row['start'])), row['queries'],
+                        row['successful'], '{0:.4f}'.format(row['availability'])])
+
+if failed:
+    sys.exit('{} of {} tests failed'.format(len(failed), len(testIds)))
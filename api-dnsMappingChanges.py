@@ -0,0 +1,68 @@
+#!/usr/bin/python
+import sys
+import time
+import json
+from teapi import ThousandEyesApi
+from tedns import iterTestData, MappingChangeDetector
+from terecords import DnsTrace
+
+"""
+    In this example we follow the mappings the agents of a DNS trace test
+    get, and print every change as it is found, instead of aggregating the
+    mappings in time periods. Traces are processed as the pages arrive, so
+    long time windows take little memory.
+
+    Use case: Spot geo load balancing decisions and flapping agents
+
+    Parameters:
+        Test ID:     DNS trace test ID.
+        Time window: (Optional) Time window to analyze in days (Default 2)
+        Interval:    (Optional) --follow=<seconds> keeps polling for new
+                     rounds after the time window, until interrupted
+    Output:
+        One JSON line per mapping change, followed by a table with the
+        number of changes, flip rate and mapping entropy per agent
+"""
+
+""" Parse the input parameters. """
+interval = None
+for argument in sys.argv[1:]:
+    if argument.startswith('--follow'):
+        interval = int(argument[9:]) if argument.startswith('--follow=') else 60
+sys.argv = [argument for argument in sys.argv if not argument.startswith('--follow')]
+if len(sys.argv) < 4 or len(sys.argv) > 5:
+    sys.exit('Use: ' + sys.argv[0] + ' <email> <apiToken> <test ID> [time window] [--follow[=<seconds>]]')
+
+username = sys.argv[1]
+apiToken = sys.argv[2]
+testId = sys.argv[3]
+timeWindow = sys.argv[4] if len(sys.argv) >= 5 else '2'
+
+""" Establish the API object with credentials. """
+api = ThousandEyesApi(username, apiToken)
+detector = MappingChangeDetector()
+
+def printEvents(uriParameters):
+    for event in detector.process(iterTestData(api, testId, uriParameters, False, DnsTrace)):
+        print json.dumps(event, sort_keys=True)
+        sys.stdout.flush()
+
+try:
+    printEvents({'window': timeWindow + 'd'})
+    while interval is not None:
+        time.sleep(interval)
+        """ Rounds already seen are skipped by the detector """
+        since = detector.lastEpoch if detector.lastEpoch is not None else time.time() - interval
+        printEvents({'from': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(since))})
+except KeyboardInterrupt:
+    pass
+except Exception, e:
+    sys.exit(str(e))
+
+""" Print the summary per agent. """
+print '{0:<40} {1:>12} {2:>7} {3:>8} {4:>9} {5:>12} {6:>8}'.format(
+    'Agent', 'Observations', 'Errors', 'Changes', 'Flip rate', 'Flips/hour', 'Entropy')
+for agent, stats in sorted(detector.stats().items()):
+    print u'{0:<40} {1:>12} {2:>7} {3:>8} {4:>9.3f} {5:>12.3f} {6:>8.3f}'.format(
+        agent, stats['observations'], stats['errors'], stats['changes'], stats['flipRate'],
+        stats['flipsPerHour'], stats['entropy']).encode('utf-8')
@@ -1,242 +1,15 @@
 #!/usr/bin/python
 
 import sys
-import urllib, urllib2
-import json
+import os
 import datetime
-import httplib
-import time
-import calendar
-import csv
+from teapi import ThousandEyesApi, ResponseCache
 
 """
-
- ThousandEyesApi class.
-
+ Agent inventory changes rarely, so /agents responses are cached on disk for
+ an hour and shared between script runs.
 """
-
-class ThousandEyesApi:
-    """
-    ThousandEyesApi class provides methods to interact with the ThousandEyes API
-
-    Attributes
-    ----------
-    email : str
-        ThousandEyes platform user account
-
-    authToken : str
-        ThousandEyes platform user API token
-
-    accountGroupId : str, optional
-        ThousandEyes platform account group ID. If not set, user's default
-        account group is used.
-
-    Methods
-    -------
-    getRequest(endpoint, uriParameters = {})
-        Performs GET HTTP request to desired API endpoint and returns JSON data
-    postRequest(endpoint, parameters, uriParameters = {}):
-        Performs POST HTTP request to desired API endpoint and returns JSON data
-    """
-
-    apiUri = 'https://api.thousandeyes.com'
-
-
-    def __init__(self, email, authToken, accountGroupId=None):
-
-        self.email = email
-        self.authToken = authToken
-        self.accountGroupId = accountGroupId
-
-
-    def getRequest(self, endpoint, uriParameters = {}):
-        """
-        Performs GET HTTP request to desired API endpoint and returns JSON data
-
-        Parameters
-        ----------
-        endpoint : str
-            ThousandEyes API endpoint URL, such as '/agents'. Refer to
-            http://developer.thousandeyes.com for the list of available endpoints.
-        uriParameters : dict
-            Dictionary of additional URL parameters, such as 'window'. Refer to the
-            API endpoint documentation for the list of available parameters.
-
-        Returns
-        -------
-        object
-            ThousandEyes API result object. Refer to the API endpoint documentation
-            for return object description.
-        """
-
-        """ Request JSON format in return """
-        uriParameters['format'] = 'json'
-
-        uri = self.apiUri.strip('/') + '/' + endpoint.strip('/') + '?' + urllib.urlencode(uriParameters)
-        #print(uri)
-
-        passwordManager = urllib2.HTTPPasswordMgrWithDefaultRealm()
-        passwordManager.add_password(None, self.apiUri, self.email, self.authToken)
-        handler = urllib2.HTTPBasicAuthHandler(passwordManager)
-
-        director = urllib2.build_opener(handler)
-
-        req = urllib2.Request(uri)
-
-        """
-        The ThousandEyes API throttles inbound API requests using a 240 request
-        per minute, per organization limit.
-        API request is encompassed with a for loop. If request returns a 429
-        response code (Too many requests), it is repeated 10 seconds later, up
-        to 10 times.
-        """
-        for n in range(0,10):
-            try:
-                """ Issue the API request """
-                result = director.open(req)
-            except urllib2.HTTPError, e:
-                if 429 == e.code:
-                    """ Issuing too many requests. Sleep 10 seconds and retry. """
-                    time.sleep(10)
-                    continue
-                """ We cannot handle other HTTP errors """
-                raise Exception("API HTTP error: " + str(e.code) + " " + str(e.reason))
-            except urllib2.URLError, e:
-                raise Exception("API URL error: " + str(e.reason))
-            except httplib.HTTPException, e:
-                raise Exception("API HTTP exception: " + str(e.reason))
-            # result.read() will contain the data
-            # result.info() will contain the HTTP headers
-
-            return json.loads(result.read())
-
-        return
-
-
-    def getPureUrlRequest(self, uri):
-        """
-        Performs GET HTTP request to desired API URL and returns JSON data
-        Does not manage parameters. Use for pagination
-
-        Parameters
-        ----------
-        url : str
-            ThousandEyes API endpoint URL
-
-        Returns
-        -------
-        object
-            ThousandEyes API result object. Refer to the API endpoint documentation
-            for return object description.
-        """
-
-        #print(uri)
-
-        passwordManager = urllib2.HTTPPasswordMgrWithDefaultRealm()
-        passwordManager.add_password(None, self.apiUri, self.email, self.authToken)
-        handler = urllib2.HTTPBasicAuthHandler(passwordManager)
-
-        director = urllib2.build_opener(handler)
-
-        req = urllib2.Request(uri)
-
-        """
-        The ThousandEyes API throttles inbound API requests using a 240 request
-        per minute, per organization limit.
-        API request is encompassed with a for loop. If request returns a 429
-        response code (Too many requests), it is repeated 10 seconds later, up
-        to 10 times.
-        """
-        for n in range(0,10):
-            try:
-                """ Issue the API request """
-                result = director.open(req)
-            except urllib2.HTTPError, e:
-                if 429 == e.code:
-                    """ Issuing too many requests. Sleep 10 seconds and retry. """
-                    time.sleep(10)
-                    continue
-                """ We cannot handle other HTTP errors """
-                raise Exception("API HTTP error: " + str(e.code) + " " + str(e.reason))
-            except urllib2.URLError, e:
-                raise Exception("API URL error: " + str(e.reason))
-            except httplib.HTTPException, e:
-                raise Exception("API HTTP exception: " + str(e.reason))
-            # result.read() will contain the data
-            # result.info() will contain the HTTP headers
-
-            return json.loads(result.read())
-
-        return
-
-
-    def postRequest(self, endpoint, properties, uriParameters = {}):
-        """
-        Performs POST HTTP request to desired API endpoint and returns JSON data
-
-        Parameters
-        ----------
-        endpoint : str
-            ThousandEyes API endpoint URL, such as '/agents'. Refer to
-            http://developer.thousandeyes.com for the list of available endpoints.
-        properties : dict
-            ThousandEyes API endpoint properties that will be sent as POST payload.
-            Refer to the API endpoint documentation for the list of available properties.
-        uriParameters : dict
-            Dictionary of additional URL parameters, such as 'window'. Refer to the
-            API endpoint documentation for the list of available parameters.
-
-        Returns
-        -------
-        object
-            ThousandEyes API result object. Refer to the API endpoint documentation
-            for return object description.
-        """
-
-        """ Request JSON format in return """
-        uriParameters['format'] = 'json'
-
-        uri = self.apiUri.strip('/') + '/' + endpoint.strip('/') + '?' + urllib.urlencode(uriParameters)
-        #print(uri)
-
-        passwordManager = urllib2.HTTPPasswordMgrWithDefaultRealm()
-        passwordManager.add_password(None, self.apiUri, self.email, self.authToken)
-        handler = urllib2.HTTPBasicAuthHandler(passwordManager)
-
-        director = urllib2.build_opener(handler)
-
-        headers = { 'Content-Type': 'application/json'}
-        postData = json.dumps(properties)
-
-        req = urllib2.Request(uri, postData, headers)
-
-        """
-        The ThousandEyes API throttles inbound API requests using a 240 request
-        per minute, per organization limit.
-        API request is encompassed with a for loop. If request returns a 429
-        response code (Too many requests), it is repeated 10 seconds later, up
-        to 10 times.
-        """
-        for n in range(0,10):
-            try:
-                """ Issue the API request """
-                result = director.open(req)
-            except urllib2.HTTPError, e:
-                if 429 == e.code:
-                    """ Issuing too many requests. Sleep 10 seconds and retry. """
-                    time.sleep(10)
-                    continue
-                raise Exception("API HTTP error: " + str(e.code) + " " + str(e.reason))
-            except urllib2.URLError, e:
-                raise Exception("API URL error: " + str(e.reason))
-            except httplib.HTTPException, e:
-                raise Exception("API HTTP exception: " + str(e.reason))
-            # result.read() will contain the data
-            # result.info() will contain the HTTP headers
-
-            return json.loads(result.read())
-
-        return
+cache = ResponseCache(ttls={'/agents': 3600}, directory=os.path.join(os.path.expanduser('~'), '.teapi', 'cache'))
 
 
 """
@@ -272,7 +45,7 @@ else:
 if exampleNo == 1:
 
     """ Establish connection with the API, use your email and API token """
-    api = ThousandEyesApi(username, apiToken)
+    api = ThousandEyesApi(username, apiToken, cache=cache)
 
     """ Get all agent data from the /agents API endpoint """
     try:
@@ -300,7 +73,7 @@ if exampleNo == 1:
 if exampleNo == 2:
 
     """ Establish connection with the API, use your email and API token """
-    api = ThousandEyesApi(username, apiToken)
+    api = ThousandEyesApi(username, apiToken, cache=cache)
 
     """ Get all agent data from the /agents API endpoint """
     try:
@@ -355,6 +128,8 @@ if exampleNo == 2:
     the availability for the given test across all servers and agents.
     NOTE: Only gets the data for the last round of testing!
     NOTE: If the test is still in progress, it will return partial data.
+    For availability over time windows, counting complete rounds only, refer
+    to api-dnsAvailability.py.
 """
 if exampleNo == 3:
     if not len(sys.argv) == 5:
@@ -363,7 +138,7 @@ if exampleNo == 3:
 
     """ Establish the API object with credentials
         Get the test data for the testId. """
-    api = ThousandEyesApi(username, apiToken)
+    api = ThousandEyesApi(username, apiToken, cache=cache)
     testData = api.getRequest('/dns/server/' + str(testId) + '.json')
 
     """ Check if we have a DNS test on our hands otherwise we exit """
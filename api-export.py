@@ -0,0 +1,61 @@
+#!/usr/bin/python
+import sys
+from teapi import ThousandEyesApi
+from teexport import Exporter, openSink
+
+"""
+    In this example we export the items of one or more API endpoints into a
+    single file. Endpoints are fetched concurrently within the API rate limit
+    and items are streamed into the output as they arrive.
+
+    Parameters:
+        Output file: File name. The extension selects the format: .csv (or
+                     .csv.gz), .jsonl (or .jsonl.gz), .parquet (requires
+                     pyarrow) or .db/.sqlite. '-' writes CSV to standard output.
+        Endpoint:    One or more endpoints with the path of the exported list,
+                     separated by a colon, such as /agents:agents or
+                     /dns/trace/1234:dns.trace
+        Time window: (Optional) --window=<window> time window of every
+                     endpoint, such as 2d
+    Output:
+        Output file with one row per item and an endpoint column
+"""
+
+""" Parse the input parameters. """
+arguments = [argument for argument in sys.argv[1:] if not argument.startswith('--window=')]
+windows = [argument[9:] for argument in sys.argv[1:] if argument.startswith('--window=')]
+if len(arguments) < 4:
+    sys.exit('Use: ' + sys.argv[0] + ' <email> <apiToken> <output file> <endpoint:itemKey> [endpoint:itemKey ...] [--window=<window>]')
+
+username = arguments[0]
+apiToken = arguments[1]
+fileName = arguments[2]
+
+uriParameters = {}
+if windows:
+    uriParameters['window'] = windows[-1]
+
+""" Build the list of (endpoint, uriParameters, itemKey) jobs. """
+jobs = []
+for argument in arguments[3:]:
+    if ':' not in argument:
+        sys.exit('Endpoint ' + argument + ' is missing the item path, such as /agents:agents')
+    endpoint, itemKey = argument.rsplit(':', 1)
+    jobs.append((endpoint, dict(uriParameters), itemKey))
+
+""" Establish the API object with credentials. """
+api = ThousandEyesApi(username, apiToken)
+
+try:
+    sink = openSink(fileName)
+except Exception, e:
+    sys.exit(str(e))
+try:
+    records = Exporter(api, sink, sourceColumn='endpoint').run(jobs)
+except Exception, e:
+    sys.exit(str(e))
+finally:
+    sink.close()
+
+if fileName != '-':
+    print 'Completed!\nWrote out {} records to {}\n'.format(records, fileName)
@@ -1,15 +1,18 @@
 #!/usr/bin/python
 import sys
+import os
 import time
 import calendar
-import csv
-from teapi import ThousandEyesApi
+from teapi import ThousandEyesApi, windowSeconds
+from tedns import loadTestData, iterTestData, processTracesBatch, processTracesParallel, generateCSV, streamLongRows, writeCSV, TraceSync, TraceStore
+from tedns import processTests, periodGrid, testRows
+from terecords import DnsTrace
 
 """
     In this example we take the DNS Trace test data in a time window (parameter)
     and aggregate the mappings per agent over time (in time periods - parameter)
     in a form of an CSV file which gets created in working directory.
-    The test in question has to be configured to get only A records.
+    The test can query any record type (A, AAAA, CNAME, MX...).
     Agents are specified in first column, then for each time period a column is created
     and all of the mappings are semicolon separated in the cell.
 
@@ -17,186 +20,67 @@ from teapi import ThousandEyesApi
     to verify geo load balancing
 
     Parameters:
-        Test ID:     DNS trace test ID.
+        Test ID:     DNS trace test ID. Several tests can be processed in one
+                     run, as comma separated IDs or as @<file> with one ID
+                     per line. They are fetched concurrently and written
+                     into one CSV file, with the test ID and domain in the
+                     first columns. A state directory is not supported
+                     with several tests.
         Time window: (Optional) Time window for which we generate the CSV file in days (Default 2)
-        Time period: (Optional) Time period for mapping aggregation in hours (Default 1 hour).
+        Time period: (Optional) Time period for mapping aggregation in hours, or
+                     with a unit, such as 5m (Default 1 hour).
+        State directory: (Optional) Directory holding the aggregate of previous
+                     runs. If set, only the rounds since the previous run are
+                     fetched and periods are aligned to whole hours. All
+                     fetched traces are kept in a columnar store in the
+                     traces subdirectory.
+        Long format: (Optional) --long writes one agent, time period, mapping
+                     row per mapping instead of a column per time period.
+                     Without a state directory, rows are written as the
+                     time periods complete, in constant memory.
+        Workers:     (Optional) --workers=<n> aggregates the traces of a single
+                     test in n processes, for long time windows over many
+                     agents.
     Output:
         Output*.csv file in working directory
 """
 
-def loadTestData(api, testId):
-    """ Get the test data from the API for the test ID and given parameters. """
-    testData = api.getRequest('/dns/trace/' + str(testId) + '.json', uriParameters)
-
-    """ Check if we have a DNS trace test on our hands otherwise we exit. """
-    if not (testData['dns']['test']['type'] == 'dns-trace'):
-        sys.exit('This example requires a DNS trace test.')
-    """
-    Check if results have an A record test on our hands otherwise we exit.
-    The domain field specifies domain under test and record type.
-    """
-    if not (testData['dns']['test']['domain'][-2:] == ' A'):
-        sys.exit('This example requires a DNS trace test for A record.')
-
-    """ Build a list of all traces for the test in the time window. """
-    traces = list()
-    traces.extend(testData['dns']['trace'])
-
-    """
-    Now check if have multiple pages and add all of them to traces.
-    If a "next" field is present in "pages" we have another page and the "next"
-    field provides a full URL for it.
-    """
-    while 'next' in testData['pages'].keys():
-        """ Show progress. """
-        sys.stdout.write('.')
-        sys.stdout.flush()
-        """ Call the API again with next page URL provided in the response. """
-        testData = api.getPureUrlRequest(testData['pages']['next'])
-        traces.extend(testData['dns']['trace'])
-    print '\n'
-    return traces
-
-def processTraces(traces):
-    """
-        Processes the trace elements from the test results in the time
-        window.
-        Go over the traces and split them into a new multi dimensional map where:
-        -agentName defines the key for map of agents.
-        -timeperiod defines the the key for a map containing list of mappings.
-        -mappings list will contain all the mappings received by the agent in the
-            traces that fall into a time period.
-
-        Time period is calculated in the following way:
-        (traceEpoch - startWindowTimeEpoch) / timeWindowSec
-
-        Parameters
-        ----------
-        traces : list
-            List of trace elements from the API response
-
-        Return
-        -------
-        data : map
-            Map of DNS trace mappings split by agent and time period
-    """
-    """ Create a data map which holds the aggregated trace data. """
-    data = {}
-
-    for trace in traces:
-
-        """ Get the date from the trace date/time in epoch. """
-        traceEpoch = calendar.timegm(time.strptime (trace['date'], '%Y-%m-%d %H:%M:%S'))
-
-        """ Calculated time period ID. """
-        timePeriodId = (traceEpoch - startWindowTimeEpoch) / timePeriodSec
-        if timePeriodId == -1:
-            """
-            Because the API returns all the rounds that are within the window, we
-            can possiblly get a round which is before our calculated window.
-            In this case we get a -1 time period ID, which we add to the first
-            period (timePeriodId = 0) for simplification.
-            """
-            timePeriodId = 0
-        """
-        Check if the agent is in the data map already and add an empty list
-        for the key if not.
-        """
-        if trace['agentName'] not in data.keys():
-            data[trace['agentName']] = {}
-        """
-        Check if the time period exists for the agent and add the current
-        mapping into a map for the period. It's a simple way to avoid duplication
-        of the mappings and avoid a flood of data if we specify larger time
-        windows.
-        """
-        if timePeriodId not in data[trace['agentName']].keys():
-            data[trace['agentName']][timePeriodId] = {}
-        """ If a trace fails, we get an errorDetails field in the JSON. """
-        if not 'errorDetails' in trace.keys():
-            data[trace['agentName']][timePeriodId][trace['mappings']] = ''
-        else:
-            """ To make it clear there was an error lets put a key in the map. """
-            data[trace['agentName']][timePeriodId]['ERROR'] = ''
-    return data
-
-def generateCSV(fName, data):
-
-    """
-        Build the output CSV file.
-        Agents are listed in first column.
-        Each time period for each agent has column as well.
-        Each cell gets the mappings for a particular time period.
-
-        Go over the agents and then for each agent/time period put the mappings
-        into a row.
-
-        Parameters
-        ----------
-        fName : String
-            File name of CSV to be generated.
-        data : map
-            Map containing trace data to be written to the file
-
-        Return
-        ------
-        null
-
-    """
-
-    """ Open the file """
-    f = open(fName, 'wt')
-    try:
-        csvWriter = csv.writer(f)
-        csvWriter.writerow(['Output'])
-        """ Handle the labels for the columns and tag them with start time. """
-        isFirstRow = True
-        firstRow = ['']
-        for agent in data:
-            """ Build a row to be written. """
-            row = []
-            row.extend([agent])
-            for period in data[agent]:
-                """ Gather the start times for the periods and format. """
-                if isFirstRow:
-                    firstRow.extend([time.strftime('%x %X', time.gmtime(startWindowTimeEpoch + period * timePeriodSec))])
-
-                """ For each period, go through all the mappings and add to row. """
-                mapjoin=''
-                for mapping in data[agent][period].keys():
-                    """ Concat mappings and ; separate. """
-                    mapjoin += mapping + ';'
-                """ Remove the last ;. """
-                mapjoin = mapjoin[:-1]
-                row.extend([mapjoin])
-
-
-            """ Handle the first row. """
-            if isFirstRow:
-                csvWriter.writerow(firstRow)
-                isFirstRow = False
-            """ Write the row. """
-            csvWriter.writerow(row)
-    finally:
-        f.close()
-
 """ Parse the input parameters. """
-if   len(sys.argv) < 4 or len(sys.argv) > 6 :
-    sys.exit('Use: ' + sys.argv[0] + ' <email> <apiToken> <test ID> [time window] [time period]')
+longFormat = '--long' in sys.argv
+workers = 1
+for argument in sys.argv[1:]:
+    if argument.startswith('--workers='):
+        workers = int(argument[10:])
+sys.argv = [argument for argument in sys.argv if argument != '--long' and not argument.startswith('--workers=')]
+if   len(sys.argv) < 4 or len(sys.argv) > 7 :
+    sys.exit('Use: ' + sys.argv[0] + ' <email> <apiToken> <test ID[,test ID...] | @file> [time window] [time period] [state directory] [--long] [--workers=<n>]')
 
 """ Set parameters """
 username = sys.argv[1]
 apiToken = sys.argv[2]
-testId  = sys.argv[3]
+if sys.argv[3].startswith('@'):
+    f = open(sys.argv[3][1:])
+    testIds = [line.strip() for line in f if line.strip()]
+    f.close()
+else:
+    testIds = [testId.strip() for testId in sys.argv[3].split(',') if testId.strip()]
+if not testIds:
+    sys.exit('No test ID given')
+testId = testIds[0] if len(testIds) == 1 else None
 if len(sys.argv) >= 5:
     timeWindow = sys.argv[4]
 else:
     timeWindow = '2'
-if len(sys.argv) == 6:
-    timePeriod = int(sys.argv[5])
+if len(sys.argv) >= 6:
+    timePeriod = sys.argv[5]
 else:
-    timePeriod = 1
-
+    timePeriod = '1'
+if len(sys.argv) == 7:
+    stateDirectory = sys.argv[6]
+else:
+    stateDirectory = None
+if testId is None and stateDirectory is not None:
+    sys.exit('A state directory can only be used with a single test ID')
 
 
 """ Set the window parameter. """
@@ -214,16 +98,44 @@ Define a start time and end time data set in epoch:
 endWindowTimeEpoch = calendar.timegm (time.gmtime ())
 timeWindowSec = int(timeWindow) * 24 * 60 * 60
 startWindowTimeEpoch = endWindowTimeEpoch - timeWindowSec
-timePeriodSec = timePeriod * 60 * 60
-
-""" Get the data from the API and process it """
-data = processTraces(loadTestData(api, testId))
-
+timePeriodSec = windowSeconds(timePeriod + 'h' if timePeriod.isdigit() else timePeriod)
 
 """ Build unique file name. """
 fName = 'output'+str(endWindowTimeEpoch)+'.csv'
 
+""" Get the data from the API and process it """
+try:
+    if testId is None:
+        """ All tests share the connections and rate limit of the API object """
+        results = processTests(api, testIds, uriParameters, startWindowTimeEpoch, timePeriodSec)
+        failed = [result for result in results if result['error'] is not None]
+        for result in failed:
+            sys.stderr.write('Test ' + str(result['testId']) + ': ' + result['error'] + '\n')
+        grid = periodGrid(startWindowTimeEpoch, endWindowTimeEpoch, timePeriodSec)
+        writeCSV(fName, testRows(results, grid, longFormat))
+        data = None
+    elif stateDirectory is None and longFormat:
+        """ Nothing is aggregated, rows are written as each time period completes """
+        traces = iterTestData(api, testId, uriParameters, itemType=DnsTrace)
+        writeCSV(fName, streamLongRows(traces, startWindowTimeEpoch, endWindowTimeEpoch, timePeriodSec))
+        data = None
+    elif stateDirectory is None:
+        traces = loadTestData(api, testId, uriParameters, itemType=DnsTrace)
+        if workers > 1:
+            data = processTracesParallel(traces, startWindowTimeEpoch, timePeriodSec, workers)
+        else:
+            data = processTracesBatch(traces, startWindowTimeEpoch, timePeriodSec)
+    else:
+        """ Traces are kept in a columnar store next to the state for later analysis """
+        store = TraceStore(os.path.join(stateDirectory, 'traces'))
+        startWindowTimeEpoch, data = TraceSync(stateDirectory, store).sync(api, testId, timeWindowSec, timePeriodSec)
+except Exception, e:
+    sys.exit(str(e))
+
 """ Dump the the data into the CSV file """
-generateCSV(fName, data)
+if data is not None:
+    generateCSV(fName, data, startWindowTimeEpoch, timePeriodSec, endWindowTimeEpoch, longFormat)
 
 print 'Completed!\nWrote out {}\n'.format(fName)
+if testId is None and failed:
+    sys.exit('{} of {} tests failed'.format(len(failed), len(testIds)))
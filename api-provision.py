@@ -0,0 +1,72 @@
+#!/usr/bin/python
+import sys
+import json
+from teapi import ThousandEyesApi
+from teprovision import TestProvisioner
+
+"""
+    In this example we provision tests from a file of test definitions. The
+    definitions are compared with the tests in the account and only the
+    creates, updates and deletes that are needed are sent, concurrently
+    within the API rate limit.
+
+    Parameters:
+        Definitions: JSON file with a list of test definitions, such as
+                     [{"type": "http-server", "testName": "Example HTTP test",
+                       "url": "https://www.example.com", "interval": 300,
+                       "agents": [{"agentId": 4492}]}]
+        Delete:      (Optional) --delete removes tests without a definition
+        Prefix:      (Optional) --prefix=<prefix> only removes tests with names
+                     starting with the prefix
+        Dry run:     (Optional) --dry-run only prints the needed changes
+    Output:
+        One line per test with the action taken and its result
+"""
+
+""" Parse the input parameters. """
+arguments = [argument for argument in sys.argv[1:] if not argument.startswith('--')]
+options = [argument for argument in sys.argv[1:] if argument.startswith('--')]
+if len(arguments) != 3:
+    sys.exit('Use: ' + sys.argv[0] + ' <email> <apiToken> <definitions file> [--delete] [--prefix=<prefix>] [--dry-run]')
+
+username = arguments[0]
+apiToken = arguments[1]
+deleteMissing = '--delete' in options
+dryRun = '--dry-run' in options
+managedPrefix = None
+for option in options:
+    if option.startswith('--prefix='):
+        managedPrefix = option[9:]
+
+try:
+    f = open(arguments[2])
+    try:
+        definitions = json.load(f)
+    finally:
+        f.close()
+except (IOError, ValueError), e:
+    sys.exit('Cannot read test definitions: ' + str(e))
+
+""" Establish the API object with credentials. """
+api = ThousandEyesApi(username, apiToken)
+provisioner = TestProvisioner(api)
+
+try:
+    actions = provisioner.plan(definitions, deleteMissing, managedPrefix)
+    if dryRun:
+        report = [dict(action, status='error' if action['action'] == 'duplicate' else 'planned') for action in actions]
+    else:
+        report = provisioner.apply(actions)
+except Exception, e:
+    sys.exit(str(e))
+
+failed = 0
+for item in report:
+    line = u'{0:<9} {1:<7} {2} ({3})'.format(item['action'], item['status'], item['testName'], item['testId'])
+    if item['status'] == 'error':
+        failed += 1
+        line += u': ' + item['error']
+    print line.encode('utf-8')
+
+if failed:
+    sys.exit('{} of {} changes failed'.format(failed, len(report)))
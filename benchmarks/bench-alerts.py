@@ -0,0 +1,110 @@
+#!/usr/bin/python
+import sys
+import os
+import time
+import resource
+import tempfile
+import multiprocessing
+import xml.dom.minidom
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from tealerts import HtmlTableWriter, CsvTableWriter, renderTable, tableColumns
+import synthetic
+
+"""
+    Benchmark of rendering a large XML alert result into the alerts.xsl table.
+
+    A synthetic alert dump is written to a temporary file and rendered by
+    every stage in its own process, so the peak RSS reported for a stage only
+    covers that stage.
+
+    Stages:
+        stream-html: tealerts streaming parser to HTML
+        stream-csv:  tealerts streaming parser to CSV
+        dom:         Whole document DOM, walked like the alerts.xsl for-each
+        xslt:        alerts.xsl applied with lxml (only if lxml is installed)
+
+    Parameters:
+        Alerts:           (Optional) Number of alerts (Default 2000)
+        Agents per alert: (Optional) Number of agents in each alert (Default 20)
+    Output:
+        Throughput and peak RSS per stage
+"""
+
+xslFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'alerts-xslt', 'alerts.xsl')
+
+def streamHtml(fileName, output):
+    return renderTable(fileName, HtmlTableWriter(output))
+
+def streamCsv(fileName, output):
+    return renderTable(fileName, CsvTableWriter(output))
+
+def dom(fileName, output):
+    """ Loads the whole document, as the browser XSLT does. """
+    document = xml.dom.minidom.parse(fileName)
+    writer = HtmlTableWriter(output)
+    count = 0
+    for alert in document.documentElement.getElementsByTagName('alert'):
+        record = {}
+        for heading, key in tableColumns:
+            nodes = [node for node in alert.childNodes if node.nodeName == key]
+            record[key] = ''.join(text.data for node in nodes for text in node.childNodes)
+        writer.writerecord(record)
+        count += 1
+    writer.close()
+    return count
+
+def xslt(fileName, output):
+    from lxml import etree
+    transform = etree.XSLT(etree.parse(xslFile))
+    result = transform(etree.parse(fileName))
+    output.write(str(result))
+    return int(result.xpath('count(//tr)')) - 1
+
+def runStage(function, fileName, queue):
+    """ Runs the stage in a child process and reports its figures through the queue. """
+    output = open(os.devnull, 'w')
+    start = time.time()
+    alerts = function(fileName, output)
+    elapsed = time.time() - start
+    output.close()
+    """ ru_maxrss is in kilobytes on Linux """
+    queue.put({'alerts': alerts, 'seconds': elapsed, 'peakRssKb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss})
+
+
+stages = [
+    ('stream-html', streamHtml),
+    ('stream-csv', streamCsv),
+    ('dom', dom),
+]
+try:
+    import lxml
+    stages.append(('xslt', xslt))
+except ImportError:
+    print 'lxml is not installed, skipping the xslt stage'
+
+if len(sys.argv) > 3:
+    sys.exit('Use: ' + sys.argv[0] + ' [alerts] [agents per alert]')
+alertCount = int(sys.argv[1]) if len(sys.argv) >= 2 else 2000
+agentsPerAlert = int(sys.argv[2]) if len(sys.argv) >= 3 else 20
+
+fileName = tempfile.mktemp('.xml')
+f = open(fileName, 'wb')
+try:
+    synthetic.alertsXml(f, alertCount, agentsPerAlert)
+finally:
+    f.close()
+size = os.path.getsize(fileName)
+print 'Alert dump of {0} alerts, {1:.1f} MB'.format(alertCount, size / 1048576.0)
+
+try:
+    for name, function in stages:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=runStage, args=(function, fileName, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        print '{0:<12} {1:10.0f} alerts/s {2:8.1f} MB/s  peak RSS {3} kB'.format(
+            name, result['alerts'] / result['seconds'], size / 1048576.0 / result['seconds'], result['peakRssKb'])
+finally:
+    os.remove(fileName)
@@ -0,0 +1,65 @@
+#!/usr/bin/python
+import sys
+import os
+import time
+import json
+import urllib2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from teapi import ThousandEyesApi, RateLimiter
+from fakeserver import FakeThousandEyes
+
+"""
+    Benchmark of the per request latency of ThousandEyesApi before and after
+    introduction of the keep-alive connection pool.
+
+    A local fake ThousandEyes API server is started on a random port. The
+    same number of GET requests is then issued with a new urllib2 opener per
+    request (previous behaviour) and over the ConnectionPool.
+
+    Parameters:
+        Requests:   (Optional) Number of requests per run (Default 500)
+    Output:
+        Mean and median latency per request for each run
+"""
+
+def urllib2Request(api, uri):
+    """ Issues the request the way ThousandEyesApi did before the connection pool. """
+    passwordManager = urllib2.HTTPPasswordMgrWithDefaultRealm()
+    passwordManager.add_password(None, api.apiUri, api.email, api.authToken)
+    handler = urllib2.HTTPBasicAuthHandler(passwordManager)
+    director = urllib2.build_opener(handler)
+    return json.loads(director.open(urllib2.Request(uri)).read())
+
+
+def run(name, requestCount, request):
+    """ Times requestCount calls of request and prints the latency figures. """
+    latencies = []
+    for n in range(0, requestCount):
+        start = time.time()
+        request()
+        latencies.append(time.time() - start)
+    latencies.sort()
+    print '{0:<10} mean {1:8.3f} ms   median {2:8.3f} ms'.format(
+        name, 1000 * sum(latencies) / len(latencies), 1000 * latencies[len(latencies) / 2])
+
+
+if len(sys.argv) > 2:
+    sys.exit('Use: ' + sys.argv[0] + ' [requests]')
+if len(sys.argv) == 2:
+    requestCount = int(sys.argv[1])
+else:
+    requestCount = 500
+
+fake = FakeThousandEyes(agentCount=20).start()
+
+""" Stub server does not throttle, lift the client side limit as well """
+api = ThousandEyesApi('user@example.com', 'token', rateLimiter=RateLimiter(rate=1000000, period=1))
+api.apiUri = fake.uri
+uri = api.apiUri + '/agents?format=json'
+
+run('urllib2', requestCount, lambda: urllib2Request(api, uri))
+run('pool', requestCount, lambda: api.getRequest('/agents'))
+
+api.connectionPool.close()
+fake.stop()
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+import sys
+import os
+import time
+import tempfile
+import shutil
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from tedns import processTracesBatch, processTracesParallel, processColumns, processColumnsParallel, TraceStore
+import synthetic
+
+"""
+    Scaling benchmark of the parallel DNS trace aggregation. Synthetic
+    traces are aggregated with processTracesParallel, and the same traces
+    kept in a TraceStore with processColumnsParallel, at 1, 2, 4 and 8
+    workers. Every output is compared with the serial one
+    (processTracesBatch and processColumns).
+
+    Parameters:
+        Traces: (Optional) Number of synthetic traces (Default 30 days of 100 agents, 4320000)
+        Agents: (Optional) Number of agents (Default 100)
+    Output:
+        Run time, traces per second and speedup over 1 worker for each
+        input and worker count
+"""
+
+if len(sys.argv) > 3:
+    sys.exit('Use: ' + sys.argv[0] + ' [traces] [agents]')
+traceCount = int(sys.argv[1]) if len(sys.argv) >= 2 else 30 * 1440 * 100
+agentCount = int(sys.argv[2]) if len(sys.argv) >= 3 else 100
+
+timePeriodSec = 3600
+endWindowTimeEpoch = 1517875200
+startWindowTimeEpoch = endWindowTimeEpoch - traceCount / agentCount * 60
+traces = list(synthetic.dnsTraces(startWindowTimeEpoch, endWindowTimeEpoch, agentCount))
+directory = tempfile.mkdtemp()
+try:
+    store = TraceStore(directory)
+    store.append(1, traces)
+    columns = store.columns(1)
+finally:
+    shutil.rmtree(directory)
+
+print '{0} traces, {1} agents, {2} CPUs'.format(len(traces), agentCount, multiprocessing.cpu_count())
+for name, serial, parallel, source in (
+        ('traces', processTracesBatch, processTracesParallel, traces),
+        ('columns', processColumns, processColumnsParallel, columns)):
+    start = time.time()
+    expected = serial(source, startWindowTimeEpoch, timePeriodSec)
+    print '{0:<8} serial    {1:8.2f} s  {2:10.0f} traces/s'.format(
+        name, time.time() - start, len(traces) / (time.time() - start))
+    baseline = None
+    for workers in (1, 2, 4, 8):
+        start = time.time()
+        data = parallel(source, startWindowTimeEpoch, timePeriodSec, workers)
+        elapsed = time.time() - start
+        baseline = baseline or elapsed
+        print '{0:<8} {1} workers {2:8.2f} s  {3:10.0f} traces/s  {4:5.2f}x'.format(
+            name, workers, elapsed, len(traces) / elapsed, baseline / elapsed)
+        if data != expected:
+            sys.exit('Output of ' + str(workers) + ' workers differs from the serial output')
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+import sys
+import os
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from tedns import processTraces, processTracesBatch
+
+"""
+    Benchmark of the DNS trace aggregation. A synthetic list of one minute
+    traces from many agents is aggregated with processTraces and with
+    processTracesBatch, and the outputs are compared.
+
+    Parameters:
+        Traces:     (Optional) Number of synthetic traces (Default 1000000)
+        Agents:     (Optional) Number of agents (Default 100)
+    Output:
+        Run time and traces per second of each implementation
+"""
+
+def syntheticTraces(traceCount, agentCount, startEpoch):
+    """ Generates one trace per agent per minute, with a few mappings and errors. """
+    traces = []
+    agents = ['Agent ' + str(n) for n in range(0, agentCount)]
+    mappings = ['192.0.2.' + str(n) for n in range(1, 9)]
+    rounds = traceCount / agentCount + 1
+    for n in range(0, rounds):
+        date = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(startEpoch + 60 * n))
+        for agent in agents:
+            if len(traces) == traceCount:
+                return traces
+            trace = {'date': date, 'agentName': agent, 'mappings': random.choice(mappings)}
+            if random.random() < 0.01:
+                trace['errorDetails'] = 'Timeout'
+            traces.append(trace)
+    return traces
+
+
+if len(sys.argv) > 3:
+    sys.exit('Use: ' + sys.argv[0] + ' [traces] [agents]')
+traceCount = int(sys.argv[1]) if len(sys.argv) >= 2 else 1000000
+agentCount = int(sys.argv[2]) if len(sys.argv) >= 3 else 100
+
+timePeriodSec = 3600
+startWindowTimeEpoch = int(time.time()) - traceCount / agentCount * 60
+traces = syntheticTraces(traceCount, agentCount, startWindowTimeEpoch)
+
+results = {}
+for name, function in (('serial', processTraces), ('batch', processTracesBatch)):
+    start = time.time()
+    results[name] = function(traces, startWindowTimeEpoch, timePeriodSec)
+    elapsed = time.time() - start
+    print '{0:<8} {1:8.2f} s  {2:10.0f} traces/s'.format(name, elapsed, len(traces) / elapsed)
+
+if results['serial'] != results['batch']:
+    sys.exit('Outputs differ')
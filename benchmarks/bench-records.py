@@ -0,0 +1,89 @@
+#!/usr/bin/python
+import sys
+import os
+import time
+import json
+import resource
+import StringIO
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from teapi import JsonStream
+from terecords import DnsTrace, Agent
+from tedns import processTracesBatch
+import synthetic
+
+"""
+    Memory benchmark of decoded API results kept as dictionaries versus
+    compact records.
+
+    A page of synthetic DNS traces and a page of agents are decoded with
+    JsonStream, into dictionaries and into records, each in its own process.
+    The resident memory growth of holding the decoded result is reported.
+    processTracesBatch output over both forms is compared first.
+
+    Parameters:
+        Traces: (Optional) Number of DNS traces (Default 7 days of 100 agents, 1008000)
+        Agents: (Optional) Number of agents (Default 100000)
+    Output:
+        Decode throughput, resident memory growth and bytes per element
+"""
+
+class Response(StringIO.StringIO):
+    """ In-memory stand-in of a pooled response. """
+    pass
+
+def rssKb():
+    """ Returns the current resident set size in kilobytes. """
+    f = open('/proc/self/statm')
+    try:
+        return int(f.read().split()[1]) * resource.getpagesize() / 1024
+    finally:
+        f.close()
+
+def tracePage(traceCount):
+    end = 1517875200
+    start = end - traceCount / 100 * 60
+    return json.dumps({'dns': {'test': {'testId': 1}, 'trace': list(synthetic.dnsTraces(start, end, 100))}})
+
+def agentPage(agentCount):
+    return json.dumps({'agents': synthetic.agents(agentCount)})
+
+def decode(page, itemKey, itemType, queue):
+    """ Decodes the page in a child process and reports the memory held by the result. """
+    before = rssKb()
+    start = time.time()
+    items = list(JsonStream(Response(page), itemKey, itemType=itemType))
+    elapsed = time.time() - start
+    queue.put({'items': len(items), 'seconds': elapsed, 'growthKb': rssKb() - before})
+
+
+if len(sys.argv) > 3:
+    sys.exit('Use: ' + sys.argv[0] + ' [traces] [agents]')
+traceCount = int(sys.argv[1]) if len(sys.argv) >= 2 else 7 * 1440 * 100
+agentCount = int(sys.argv[2]) if len(sys.argv) >= 3 else 100000
+
+""" Records must aggregate exactly like dictionaries """
+page = tracePage(10000)
+dictionaries = list(JsonStream(Response(page), 'dns.trace'))
+records = list(JsonStream(Response(page), 'dns.trace', itemType=DnsTrace))
+start = 1517875200 - 100 * 60
+if processTracesBatch(dictionaries, start, 3600) != processTracesBatch(records, start, 3600):
+    sys.exit('processTracesBatch output differs between dictionaries and records')
+del page, dictionaries, records
+
+for name, itemKey, page, itemType in [
+        ('trace-dict', 'dns.trace', tracePage(traceCount), None),
+        ('trace-record', 'dns.trace', None, DnsTrace),
+        ('agent-dict', 'agents', agentPage(agentCount), None),
+        ('agent-record', 'agents', None, Agent)]:
+    if page is not None:
+        current = page
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=decode, args=(current, itemKey, itemType, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    print '{0:<13} {1:9} items {2:10.0f} items/s  memory {3:9} kB  {4:6.0f} B/item'.format(
+        name, result['items'], result['items'] / result['seconds'], result['growthKb'],
+        1024.0 * result['growthKb'] / result['items'])
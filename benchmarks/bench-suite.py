@@ -0,0 +1,197 @@
+#!/usr/bin/python
+import sys
+import os
+import time
+import json
+import resource
+import runpy
+import subprocess
+import tempfile
+import multiprocessing
+import traceback
+import Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import teapi
+from teapi import ThousandEyesApi, RateLimiter
+from tedns import processTraces, processTracesBatch, generateCSV
+from fakeserver import FakeThousandEyes
+import synthetic
+
+"""
+    Offline benchmark suite of the API client and the processing scripts.
+
+    A local fake ThousandEyes API server is started, and every stage is run
+    in its own process, so the peak RSS reported for a stage only covers that
+    stage. Every 50th request to the fake server is throttled with a 429.
+    Results are printed and saved as JSON, to be compared between commits.
+
+    Stages:
+        client-get:     Repeated /agents requests
+        paginate-trace: Paginated DNS trace window with prefetching
+        process-serial: processTraces over synthetic traces
+        process-batch:  processTracesBatch over the same traces
+        generate-csv:   generateCSV of the aggregated traces
+        api-to-csv:     api-to-csv.py export against the fake server
+
+    Parameters:
+        Output file: (Optional) JSON results file (Default bench-results-<epoch>.json)
+        Scale:       (Optional) Multiplier of the synthetic data sizes (Default 1)
+    Output:
+        Throughput, p50/p99 request latency and peak RSS per stage
+"""
+
+def percentile(values, fraction):
+    """ Returns the value below which the fraction of the sorted values falls. """
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def unlimitedApi(fake):
+    """ Returns an API object pointed at the fake server, without client side rate limiting. """
+    api = ThousandEyesApi('user@example.com', 'token', rateLimiter=RateLimiter(rate=1000000, period=1))
+    api.apiUri = fake.uri
+    return api
+
+def clientGet(fake, scale):
+    api = unlimitedApi(fake)
+    latencies = []
+    for n in range(0, 500 * scale):
+        start = time.time()
+        api.getRequest('/agents')
+        latencies.append(time.time() - start)
+    return {'operations': len(latencies), 'unit': 'requests', 'latencies': latencies}
+
+def paginateTrace(fake, scale):
+    api = unlimitedApi(fake)
+    items = 0
+    for trace in api.paginate('/dns/trace/1', {'window': str(scale) + 'd'}, 'dns.trace', windowSplit=6 * 3600):
+        items += 1
+    return {'operations': items, 'unit': 'traces'}
+
+def traces(scale):
+    end = int(time.time())
+    start = end - scale * 86400
+    return start, list(synthetic.dnsTraces(start, end, 100))
+
+def processSerial(fake, scale):
+    start, data = traces(scale)
+    begin = time.time()
+    processTraces(data, start, 3600)
+    return {'operations': len(data), 'unit': 'traces', 'elapsed': time.time() - begin}
+
+def processBatch(fake, scale):
+    start, data = traces(scale)
+    begin = time.time()
+    processTracesBatch(data, start, 3600)
+    return {'operations': len(data), 'unit': 'traces', 'elapsed': time.time() - begin}
+
+def csvExport(fake, scale):
+    start, data = traces(scale)
+    aggregated = processTracesBatch(data, start, 3600)
+    fileName = tempfile.mktemp('.csv')
+    begin = time.time()
+    generateCSV(fileName, aggregated, start, 3600)
+    elapsed = time.time() - begin
+    os.remove(fileName)
+    return {'operations': len(aggregated), 'unit': 'rows', 'elapsed': elapsed}
+
+def apiToCsv(fake, scale):
+    """ Runs the script with the API pointed at the fake server and output discarded. """
+    teapi.ThousandEyesApi.apiUri = fake.uri
+    """ Keep the script's disk cache out of the user's home directory """
+    os.environ['HOME'] = tempfile.mkdtemp()
+    sys.argv = ['api-to-csv.py', 'user@example.com', 'token']
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        runpy.run_path(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api-to-csv.py'))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    return {'operations': fake.agentCount, 'unit': 'agents'}
+
+def runStage(function, fake, scale, queue):
+    """ Runs the stage in a child process and reports its figures, or its error, through the queue. """
+    try:
+        queue.put(measureStage(function, fake, scale))
+    except BaseException:
+        queue.put({'error': traceback.format_exc()})
+
+def measureStage(function, fake, scale):
+    start = time.time()
+    result = function(fake, scale)
+    elapsed = result.pop('elapsed', time.time() - start)
+    latencies = result.pop('latencies', [])
+    result['seconds'] = elapsed
+    result['throughput'] = result['operations'] / elapsed
+    result['p50LatencyMs'] = percentile(latencies, 0.50) and 1000 * percentile(latencies, 0.50)
+    result['p99LatencyMs'] = percentile(latencies, 0.99) and 1000 * percentile(latencies, 0.99)
+    """ ru_maxrss is in kilobytes on Linux """
+    result['peakRssKb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+def stageResult(process, queue):
+    """ Waits for the result of the stage, or for the child process to end without one. """
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except Queue.Empty:
+            if not process.is_alive():
+                """ The result may have arrived just before the process ended """
+                try:
+                    return queue.get(timeout=1)
+                except Queue.Empty:
+                    return {'error': 'Stage process ended with exit code ' + str(process.exitcode)}
+
+
+stages = [
+    ('client-get', clientGet),
+    ('paginate-trace', paginateTrace),
+    ('process-serial', processSerial),
+    ('process-batch', processBatch),
+    ('generate-csv', csvExport),
+    ('api-to-csv', apiToCsv),
+]
+
+if len(sys.argv) > 3:
+    sys.exit('Use: ' + sys.argv[0] + ' [output file] [scale]')
+fileName = sys.argv[1] if len(sys.argv) >= 2 else 'bench-results-' + str(int(time.time())) + '.json'
+scale = int(sys.argv[2]) if len(sys.argv) >= 3 else 1
+
+try:
+    commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=open(os.devnull, 'w')).strip()
+except (OSError, subprocess.CalledProcessError):
+    commit = None
+
+""" Every 50th request is throttled and asked to retry right away """
+fake = FakeThousandEyes(agentCount=100, pageSize=1000, throttleEvery=50, retryAfter=0).start()
+failed = []
+results = {'commit': commit, 'date': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()), 'scale': scale, 'stages': {}}
+for name, function in stages:
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=runStage, args=(function, fake, scale, queue))
+    process.start()
+    result = stageResult(process, queue)
+    process.join()
+    results['stages'][name] = result
+    if 'error' in result:
+        failed.append(name)
+        print '{0:<15} failed\n{1}'.format(name, result['error'])
+        continue
+    latency = ''
+    if result['p50LatencyMs'] is not None:
+        latency = '  p50 {0:7.3f} ms  p99 {1:7.3f} ms'.format(result['p50LatencyMs'], result['p99LatencyMs'])
+    print '{0:<15} {1:12.0f} {2}/s{3}  peak RSS {4} kB'.format(
+        name, result['throughput'], result['unit'], latency, result['peakRssKb'])
+fake.stop()
+
+f = open(fileName, 'w')
+try:
+    json.dump(results, f, indent=2, sort_keys=True)
+finally:
+    f.close()
+print 'Wrote out {}'.format(fileName)
+if failed:
+    sys.exit('Failed stages: ' + ', '.join(failed))
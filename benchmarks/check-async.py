@@ -0,0 +1,74 @@
+#!/usr/bin/python
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from teapi import ThousandEyesApi, RateLimiter
+from teasync import AsyncThousandEyesApi
+from fakeserver import FakeThousandEyes
+
+"""
+    Check of the non-blocking client against a throttling API. The DNS
+    traces of several tests and the agents are fetched with
+    AsyncThousandEyesApi from a fake server that answers every 5th request
+    with 429 and a Retry-After of 1 second. The results must be the same as
+    from a fake server that does not throttle, and the request records must
+    show retries and time spent backing off.
+
+    Output:
+        Number of requests, throttled requests and retries. Exits with an
+        error message if a check fails.
+"""
+
+testIds = [1, 2, 3, 4]
+""" Fixed time window, so both servers return the same rounds """
+uriParameters = {'from': '2018-02-05T00:00:00', 'to': '2018-02-05T01:59:59'}
+
+def fetch(fake, records=None):
+    client = AsyncThousandEyesApi('user@example.com', 'token', concurrency=4,
+                                  rateLimiter=RateLimiter(rate=1000000, period=1), maxRetries=5)
+    client.api.apiUri = fake.uri
+    if records is not None:
+        client.api.hooks.append(records.append)
+    try:
+        agents = client.getRequest('/agents')
+        traces = client.gatherTests(testIds, '/dns/trace/{testId}', uriParameters, 'dns.trace')
+        return agents.get()['agents'], traces
+    finally:
+        client.close()
+
+reference = FakeThousandEyes(agentCount=20, pageSize=100).start()
+try:
+    expectedAgents, expectedTraces = fetch(reference)
+finally:
+    reference.stop()
+
+throttling = FakeThousandEyes(agentCount=20, pageSize=100, throttleEvery=5, retryAfter=1).start()
+records = []
+try:
+    agents, traces = fetch(throttling, records)
+finally:
+    throttling.stop()
+
+failures = []
+if not throttling.throttled:
+    failures.append('the fake server throttled no request')
+if agents != expectedAgents:
+    failures.append('agents differ from the unthrottled result')
+for testId, expected, items in zip(testIds, expectedTraces, traces):
+    if len(items) != 20 * 120 or items != expected:
+        failures.append('test ' + str(testId) + ' returned ' + str(len(items)) + ' of ' +
+                        str(len(expected)) + ' traces, or different traces')
+retried = [record for record in records if record['retries'] > 0]
+if sum(record['retries'] for record in records) != throttling.throttled:
+    failures.append('retries do not match the throttled requests')
+if not retried or min(record['throttleSeconds'] for record in retried) < 0.9:
+    failures.append('retried requests did not back off for the Retry-After time')
+if any(record['error'] is not None for record in records):
+    failures.append('requests failed')
+
+print '{0} requests, {1} throttled, {2} retried requests'.format(throttling.requests, throttling.throttled,
+                                                                len(retried))
+if failures:
+    sys.exit('\n'.join(failures))
+print 'OK'
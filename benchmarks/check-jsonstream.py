@@ -0,0 +1,66 @@
+#!/usr/bin/python
+import sys
+import os
+import json
+import io
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from teapi import JsonStream
+from terecords import DnsTrace
+
+"""
+    Check of the streaming JSON decoder. The same documents are decoded by
+    JsonStream with every chunk size from 1 byte to the whole document, so
+    every value is cut by a chunk boundary at every position, and the
+    elements and metadata must equal the json.loads result.
+
+    Output:
+        Number of decoded documents. Exits with an error message if a check
+        fails.
+"""
+
+documents = [
+    ('items', {'items': [203.6, 1, -0.5e-3, 20, True, None, 'a,]}', {'b': [1.25E+2, False]}, [], {}],
+                     'total': 203.6, 'pages': {'next': 'https://api.thousandeyes.com/items?page=2'}, 'count': -12}),
+    ('dns.trace', {'dns': {'test': {'testId': 1234, 'interval': 120.0},
+                                 'trace': [{'agentId': 10 + n, 'agentName': u'Agent \xe9 ' + str(n), 'roundId': 1517788800 + n * 120,
+                                            'date': '2018-02-05 00:00:00', 'mappings': '203.0.113.' + str(n),
+                                            'errorDetails': ''} for n in range(5)]},
+                         'pages': {'current': 1}}),
+    ('items', {'items': [], 'total': 0}),
+]
+
+def decode(text, itemKey, chunkSize, itemType=None):
+    stream = JsonStream(io.BytesIO(text), itemKey, chunkSize, itemType)
+    items = list(stream)
+    return items, stream.metadata
+
+failures = []
+decoded = 0
+for itemKey, document in documents:
+    for text in (json.dumps(document), json.dumps(document, indent=1), json.dumps(document, separators=(',', ':'))):
+        expected = json.loads(text)
+        path = itemKey.split('.')
+        expectedItems = reduce(lambda value, key: value[key], path, expected)
+        expectedMetadata = json.loads(text)
+        reduce(lambda value, key: value[key], path[:-1], expectedMetadata).pop(path[-1])
+        for chunkSize in range(1, len(text) + 1):
+            try:
+                items, metadata = decode(text, itemKey, chunkSize)
+            except ValueError, e:
+                failures.append('{0} bytes per chunk: {1}'.format(chunkSize, e))
+                continue
+            decoded += 1
+            if items != expectedItems or metadata != expectedMetadata:
+                failures.append('{0} bytes per chunk: decoded {1!r}'.format(chunkSize, (items, metadata))[:200])
+        if itemKey == 'dns.trace':
+            for chunkSize in range(1, len(text) + 1):
+                items, metadata = decode(text, itemKey, chunkSize, DnsTrace)
+                decoded += 1
+                if [item.toDict() for item in items] != expectedItems:
+                    failures.append('{0} bytes per chunk: records differ'.format(chunkSize))
+
+print '{0} documents decoded'.format(decoded)
+if failures:
+    sys.exit('\n'.join(failures[:20]))
+print 'OK'
@@ -0,0 +1,261 @@
+#!/usr/bin/python
+import time
+import calendar
+""" Imported up front, as the first time.strptime call is not thread safe on Python 2 """
+import _strptime
+import json
+import re
+import threading
+import socket
+import urllib
+import urlparse
+import BaseHTTPServer
+import SocketServer
+
+import synthetic
+
+"""
+
+ FakeThousandEyes class.
+
+"""
+
+class FakeThousandEyes:
+    """
+    FakeThousandEyes class runs a local HTTP server imitating the parts of
+    the ThousandEyes API used by the scripts in this repository, so the
+    client and processing code can be benchmarked offline.
+
+    Served endpoints: /agents, /account-groups, /dns/trace/{testId},
+    /dns/server/{testId} and /alerts, with or without the .json suffix. Time window results accept
+    'window' or 'from'/'to' parameters and are paginated. Tests are kept in
+    memory: /tests and /tests/{testId} list them, and POST requests to
+    /tests/{type}/new, /tests/{type}/{testId}/update and
+    /tests/{type}/{testId}/delete change them.
+
+    Attributes
+    ----------
+    latency : float
+        Seconds every response is delayed, imitating server time.
+
+    pageSize : int
+        Number of elements in a page of a paginated result.
+
+    throttleEvery : int
+        If set, every throttleEvery-th request is answered with 429.
+
+    retryAfter : int
+        Retry-After value sent with 429 responses.
+
+    agentCount : int
+        Number of agents in /agents and in test results.
+
+    alertCount : int
+        Number of alerts in /alerts.
+
+    accountGroupCount : int
+        Number of account groups in /account-groups.
+
+    uri : str
+        Base URL of the running server, to be used as ThousandEyesApi.apiUri.
+
+    requests : int
+        Number of requests received.
+
+    throttled : int
+        Number of requests answered with 429.
+
+    Methods
+    -------
+    start()
+        Starts the server on a random local port
+    stop()
+        Stops the server
+    respond(path, query, body = None)
+        Returns the response to a GET request, or to a POST request with body
+    """
+
+    def __init__(self, latency=0.0, pageSize=1000, throttleEvery=0, retryAfter=0, agentCount=100,
+                 alertCount=1000, roundInterval=60, accountGroupCount=3):
+
+        self.latency = latency
+        self.pageSize = pageSize
+        self.throttleEvery = throttleEvery
+        self.retryAfter = retryAfter
+        self.agentCount = agentCount
+        self.alertCount = alertCount
+        self.roundInterval = roundInterval
+        self.accountGroupCount = accountGroupCount
+
+        self.uri = None
+        self.requests = 0
+        self.throttled = 0
+
+        self._lock = threading.Lock()
+        self._server = None
+        self._agents = None
+        self._alerts = None
+        self._tests = {}
+        self._nextTestId = 1
+
+
+    def start(self):
+        self._server = FakeServer(('127.0.0.1', 0), FakeHandler)
+        self._server.fake = self
+        thread = threading.Thread(target=self._server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.uri = 'http://127.0.0.1:' + str(self._server.server_address[1])
+        return self
+
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+    def respond(self, path, query, body=None):
+        """ Returns a (status, headers, body) tuple for a GET, or with body for a POST request. """
+
+        with self._lock:
+            self.requests += 1
+            throttle = self.throttleEvery and self.requests % self.throttleEvery == 0
+            if throttle:
+                self.throttled += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if throttle:
+            return 429, {'Retry-After': str(self.retryAfter)}, '{"errorMessage": "Too many requests"}'
+
+        path = '/' + path.strip('/')
+        if path.endswith('.json'):
+            path = path[:-5]
+        page = int(query.get('page', '1'))
+
+        if path == '/agents':
+            if self._agents is None:
+                self._agents = json.dumps({'agents': synthetic.agents(self.agentCount)})
+            return 200, {}, self._agents
+
+        if path == '/account-groups':
+            groups = [{'aid': n + 1, 'accountGroupName': 'Account group ' + str(n + 1)}
+                      for n in range(0, self.accountGroupCount)]
+            return 200, {}, json.dumps({'accountGroups': groups})
+
+        if path == '/alerts':
+            if self._alerts is None:
+                self._alerts = synthetic.alerts(self.alertCount, min(self.agentCount, 20))
+            items = self._alerts[(page - 1) * self.pageSize:page * self.pageSize]
+            return 200, {}, json.dumps({'alert': items, 'pages': self._pages(path, query, page, len(self._alerts))})
+
+        if path == '/tests' or path.startswith('/tests/'):
+            return self._test(path, body)
+
+        match = re.match(r'^/dns/(trace|server)/(\d+)$', path)
+        if match:
+            start, end = self._window(query)
+            rounds = (end - start) / self.roundInterval
+            """ Pages hold whole rounds """
+            roundsPerPage = max(1, self.pageSize / self.agentCount)
+            pageStart = start + (page - 1) * roundsPerPage * self.roundInterval
+            pageEnd = min(end, pageStart + roundsPerPage * self.roundInterval)
+            items = list(synthetic.dnsTraces(pageStart, pageEnd, self.agentCount, self.roundInterval,
+                                             seed=int(match.group(2)) + page))
+            test = {'testId': int(match.group(2)), 'testName': 'Synthetic DNS test',
+                    'domain': 'example.com A', 'type': 'dns-' + match.group(1)}
+            if match.group(1) == 'server':
+                """ Server results carry resolution time for successful queries """
+                for item in items:
+                    item['server'] = 'ns' + str(item['agentId'] % 2 + 1) + '.example.com'
+                    if 'errorDetails' not in item:
+                        item['resolutionTime'] = 20
+            return 200, {}, json.dumps({'dns': {'test': test, match.group(1): items},
+                                        'pages': self._pages(path, query, page, rounds, roundsPerPage)})
+
+        return 404, {}, '{"errorMessage": "Not found"}'
+
+
+    def _test(self, path, body):
+        """ Lists, creates, updates and deletes in memory tests. """
+        with self._lock:
+            if body is None:
+                if path == '/tests':
+                    return 200, {}, json.dumps({'test': sorted(self._tests.values(), key=lambda test: test['testId'])})
+                match = re.match(r'^/tests/(\d+)$', path)
+                if match and int(match.group(1)) in self._tests:
+                    return 200, {}, json.dumps({'test': [self._tests[int(match.group(1))]]})
+                return 404, {}, '{"errorMessage": "Not found"}'
+
+            properties = json.loads(body or '{}')
+            match = re.match(r'^/tests/([a-z-]+)/new$', path)
+            if match:
+                test = dict(properties, testId=self._nextTestId, type=match.group(1))
+                self._nextTestId += 1
+                self._tests[test['testId']] = test
+                return 201, {}, json.dumps({'test': [test]})
+            match = re.match(r'^/tests/([a-z-]+)/(\d+)/(update|delete)$', path)
+            if not match or int(match.group(2)) not in self._tests:
+                return 404, {}, '{"errorMessage": "Not found"}'
+            if match.group(3) == 'delete':
+                del self._tests[int(match.group(2))]
+                return 204, {}, ''
+            self._tests[int(match.group(2))].update(properties)
+            return 200, {}, json.dumps({'test': [self._tests[int(match.group(2))]]})
+
+
+    def _window(self, query):
+        """ Returns the (start, end) epoch of the requested time window. """
+        end = int(time.time())
+        if 'from' in query:
+            start = calendar.timegm(time.strptime(query['from'], '%Y-%m-%dT%H:%M:%S'))
+            if 'to' in query:
+                end = calendar.timegm(time.strptime(query['to'], '%Y-%m-%dT%H:%M:%S')) + 1
+            return start, end
+        units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+        window = query.get('window', str(self.roundInterval) + 's')
+        return end - int(window[:-1]) * units[window[-1]], end
+
+
+    def _pages(self, path, query, page, total, pageSize=None):
+        """ Returns the 'pages' element, with a 'next' URL if there are more pages. """
+        pages = {'current': page}
+        if page * (pageSize or self.pageSize) < total:
+            query = dict(query)
+            query['page'] = str(page + 1)
+            pages['next'] = self.uri + path + '?' + urllib.urlencode(sorted(query.items()))
+        return pages
+
+
+class FakeServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class FakeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """ Keep-alive handler forwarding GET and POST requests to the FakeThousandEyes object. """
+
+    protocol_version = 'HTTP/1.1'
+    """ Buffer the response so headers and body leave in a single segment """
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        """ Large bodies are flushed in several writes, do not hold back the last one """
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self, body=None):
+        parsed = urlparse.urlsplit(self.path)
+        status, headers, body = self.server.fake.respond(parsed.path, dict(urlparse.parse_qsl(parsed.query)), body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.do_GET(self.rfile.read(int(self.headers.getheader('Content-Length') or 0)))
+
+    def log_message(self, format, *args):
+        pass
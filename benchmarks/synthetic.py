@@ -0,0 +1,180 @@
+#!/usr/bin/python
+import time
+import random
+import xml.etree.cElementTree as ElementTree
+
+"""
+
+ Synthetic ThousandEyes API payload generators used by the benchmarks.
+ All generators are deterministic for the same seed.
+
+"""
+
+def agents(agentCount, seed=0):
+    """
+    Generates /agents elements
+
+    Parameters
+    ----------
+    agentCount : int
+        Number of agents. Roughly a third of them are Cloud agents.
+    seed : int
+        Random generator seed
+
+    Return
+    ------
+    agents : list
+        List of agent elements as returned by the /agents endpoint
+    """
+    generator = random.Random(seed)
+    result = []
+    for n in range(0, agentCount):
+        agent = {
+            'agentId': n + 1,
+            'agentName': 'Agent ' + str(n + 1) + ', Synthetic',
+            'agentType': 'Cloud' if n % 3 == 0 else 'Enterprise',
+            'countryId': generator.choice(['US', 'DE', 'SG', 'BR', 'JP']),
+            'location': 'Location ' + str(n % 50),
+            'ipAddresses': ['198.51.100.' + str(n % 250 + 1), '2001:db8::' + hex(n)[2:]],
+            'agentState': 'Online' if generator.random() < 0.9 else 'Offline',
+            'enabled': 1
+        }
+        if agent['agentType'] == 'Enterprise':
+            agent['hostname'] = 'agent-' + str(n + 1) + '.example.com'
+            agent['lastSeen'] = '2018-02-06 10:00:00'
+            agent['utilization'] = generator.randint(0, 100)
+        result.append(agent)
+    return result
+
+def dnsTraces(startEpoch, endEpoch, agentCount, roundInterval=60, mappingCount=4, errorRate=0.01, seed=0):
+    """
+    Generates /dns/trace elements, one per agent per round
+
+    Parameters
+    ----------
+    startEpoch : int
+        Epoch of the first round. Rounds are aligned to roundInterval.
+    endEpoch : int
+        Epoch after the last round
+    agentCount : int
+        Number of agents running the test
+    roundInterval : int
+        Test interval in seconds
+    mappingCount : int
+        Number of distinct mappings an agent can get
+    errorRate : float
+        Share of failed traces
+    seed : int
+        Random generator seed
+
+    Return
+    ------
+    generator
+        Trace elements in round order
+    """
+    generator = random.Random(seed)
+    firstRound = startEpoch + (-startEpoch % roundInterval)
+    for roundId in range(firstRound, endEpoch, roundInterval):
+        date = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(roundId))
+        for n in range(0, agentCount):
+            trace = {
+                'agentId': n + 1,
+                'agentName': 'Agent ' + str(n + 1) + ', Synthetic',
+                'date': date,
+                'roundId': roundId,
+                'permalink': 'https://app.thousandeyes.com/view/dns-trace/?roundId=' + str(roundId)
+            }
+            if generator.random() < errorRate:
+                trace['errorDetails'] = 'Timeout waiting for response'
+            else:
+                """ Mapping changes every few hours, different per agent """
+                trace['mappings'] = 'a.root-servers.net->ns.example.com->192.0.2.' + str((roundId / 10800 + n) % mappingCount + 1)
+            yield trace
+
+def alerts(alertCount, agentsPerAlert, seed=0):
+    """
+    Generates /alerts elements
+
+    Parameters
+    ----------
+    alertCount : int
+        Number of alerts
+    agentsPerAlert : int
+        Number of agents or monitors in each alert
+    seed : int
+        Random generator seed
+
+    Return
+    ------
+    alerts : list
+        List of alert elements as returned by the /alerts endpoint
+    """
+    generator = random.Random(seed)
+    return [_alert(generator, n, agentsPerAlert) for n in range(0, alertCount)]
+
+def alertsXml(output, alertCount, agentsPerAlert, seed=0):
+    """
+    Writes an XML alert result, in the format of alerts-xslt/alerts.xml
+
+    Alerts are written one at a time, so documents larger than memory can
+    be generated.
+
+    Parameters
+    ----------
+    output : file
+        File object to write to
+    alertCount : int
+        Number of alerts
+    agentsPerAlert : int
+        Number of agents in each alert
+    seed : int
+        Random generator seed
+    """
+    generator = random.Random(seed)
+    output.write('<?xml version="1.0" encoding="UTF-8" standalone="yes"?><teResults>')
+    for n in range(0, alertCount):
+        alert = _alert(generator, n, agentsPerAlert)
+        element = ElementTree.Element('alert', type=alert['type'])
+        for key in ['active', 'alertId', 'dateStart', 'permalink', 'ruleExpression', 'ruleName', 'testId',
+                    'testName', 'violationCount']:
+            ElementTree.SubElement(element, key).text = unicode(alert[key])
+        agents = ElementTree.SubElement(element, 'agents')
+        for agent in alert['agents']:
+            item = ElementTree.SubElement(agents, 'agent')
+            for key, value in sorted(agent.items()):
+                ElementTree.SubElement(item, key).text = unicode(value)
+        output.write(ElementTree.tostring(element, 'utf-8').split('?>', 1)[-1].lstrip())
+    output.write('<pages><current>1</current></pages></teResults>')
+
+def _alert(generator, n, agentsPerAlert):
+    """ Generates the n-th /alerts element. """
+    start = 1438106400 + generator.randint(0, 86400)
+    alert = {
+        'alertId': 2350415 + n,
+        'testId': 10000 + n % 40,
+        'testName': 'Synthetic test ' + str(n % 40),
+        'active': generator.randint(0, 1),
+        'ruleExpression': '((loss >= 10%) || (probDetail != ""))',
+        'dateStart': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(start)),
+        'violationCount': agentsPerAlert,
+        'ruleName': 'Default Network Alert Rule',
+        'permalink': 'https://app.thousandeyes.com/alerts/list/?alertId=' + str(2350415 + n),
+        'type': 'Network',
+        'agents': []
+    }
+    for m in range(0, agentsPerAlert):
+        agent = {
+            'agentId': m + 1,
+            'agentName': 'Agent ' + str(m + 1) + ', Synthetic',
+            'active': alert['active'],
+            'dateStart': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(start + generator.randint(0, 600))),
+            'metricsAtStart': 'Packet Loss: ' + str(round(generator.uniform(0, 40), 1)) + '%, Latency: ' +
+                              str(round(generator.uniform(5, 400), 1)) + ' ms, Error: "", Jitter: ' +
+                              str(round(generator.uniform(0, 10), 1)) + ' ms',
+            'metricsAtEnd': ''
+        }
+        if not alert['active']:
+            agent['dateEnd'] = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(start + 3600))
+            agent['metricsAtEnd'] = 'Packet Loss: 0%, Latency: 20.1 ms, Error: "", Jitter: 0.3 ms'
+        alert['agents'].append(agent)
+    return alert
@@ -0,0 +1,665 @@
+#!/usr/bin/python
+import os
+import re
+import cgi
+import csv
+import json
+import time
+import bisect
+import calendar
+import xml.etree.cElementTree as ElementTree
+from array import array
+
+"""
+
+ Alert processing helpers used by alerts-render.py.
+
+"""
+
+""" Columns of the alerts.xsl table, as (heading, alert element) tuples """
+tableColumns = [
+    ('Alert ID', 'alertId'),
+    ('Date Start', 'dateStart'),
+    ('Scope', 'violationCount'),
+    ('Test Name', 'testName'),
+]
+
+def iterAlerts(source):
+    """
+    Iterates over the alerts of a ThousandEyes XML alert result
+
+    The document is read with a streaming parser, and every teResults/alert
+    element is cleared once it has been converted, so memory use does not
+    grow with the size of the document.
+
+    Parameters
+    ----------
+    source : str or file
+        File name or file object of the XML document, such as alerts.xml
+
+    Returns
+    -------
+    generator
+        Alert dictionaries. Elements with text become strings, elements
+        with child elements, such as agents, monitors or apiLinks, become
+        lists of dictionaries, and attributes become keys.
+    """
+
+    depth = 0
+    root = None
+    for event, element in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            depth += 1
+            if root is None:
+                root = element
+            continue
+        depth -= 1
+        if depth == 1:
+            if element.tag == 'alert':
+                yield _record(element)
+            """ Drop the converted element and its reference from the root """
+            element.clear()
+            root.clear()
+
+def _record(element):
+    """ Converts an element into a dictionary of its attributes and child elements. """
+    record = dict(element.attrib)
+    for child in element:
+        if len(child):
+            record[child.tag] = [_record(item) for item in child]
+        elif child.attrib:
+            record[child.tag] = _record(child)
+        else:
+            record[child.tag] = child.text or ''
+    return record
+
+"""
+
+ HtmlTableWriter class.
+
+"""
+
+class HtmlTableWriter:
+    """
+    HtmlTableWriter class writes alerts as the HTML table of alerts.xsl.
+    Rows are written as they are received.
+
+    Methods
+    -------
+    writerecord(alert)
+        Writes a table row of the alert
+    close()
+        Writes the end of the document
+    """
+
+    def __init__(self, output, columns=tableColumns, title='Alerts'):
+
+        self.output = output
+        self.columns = columns
+        self.output.write('<html>\n<body>\n<h2>' + cgi.escape(title) + '</h2>\n<table>\n  <tr>\n')
+        for heading, key in self.columns:
+            self.output.write('    <th style="text-align:left">' + cgi.escape(heading) + '</th>\n')
+        self.output.write('  </tr>\n')
+
+
+    def writerecord(self, alert):
+        cells = ''.join('    <td>' + cgi.escape(unicode(alert.get(key, ''))).encode('utf-8') + '</td>\n'
+                        for heading, key in self.columns)
+        self.output.write('  <tr>\n' + cells + '  </tr>\n')
+
+
+    def close(self):
+        self.output.write('</table>\n</body>\n</html>\n')
+
+"""
+
+ CsvTableWriter class.
+
+"""
+
+class CsvTableWriter:
+    """
+    CsvTableWriter class writes alerts as CSV rows with the columns of the
+    alerts.xsl table.
+
+    Methods
+    -------
+    writerecord(alert)
+        Writes a row of the alert
+    close()
+        Does nothing, the output is closed by the caller
+    """
+
+    def __init__(self, output, columns=tableColumns):
+
+        self.columns = columns
+        self.writer = csv.writer(output, dialect='excel')
+        self.writer.writerow([heading for heading, key in self.columns])
+
+
+    def writerecord(self, alert):
+        self.writer.writerow([unicode(alert.get(key, '')).encode('utf-8') for heading, key in self.columns])
+
+
+    def close(self):
+        pass
+
+
+def renderTable(source, writer):
+    """
+    Streams the alerts of an XML alert result into a table writer
+
+    Parameters
+    ----------
+    source : str or file
+        File name or file object of the XML document
+    writer : HtmlTableWriter or CsvTableWriter
+        Table writer
+
+    Returns
+    -------
+    int
+        Number of alerts written
+    """
+
+    count = 0
+    for alert in iterAlerts(source):
+        writer.writerecord(alert)
+        count += 1
+    writer.close()
+    return count
+
+
+""" Metric name and value pairs, such as 'Latency: 1,203.6 ms' or 'Error: "a, b"' """
+_metricPattern = re.compile(r'\s*([A-Za-z][A-Za-z ]*?)\s*:\s*("[^"]*"|(?:[^,]|,(?=\d{3}(?!\d)))*)\s*(?:,|$)')
+_numberPattern = re.compile(r'^(-?[\d,]*\.?\d+)\s*(?:%|[A-Za-z/]+)?$')
+
+""" Parsed metrics texts. Alerts repeat the same texts, so most lookups are hits. """
+_metricsCache = {}
+metricsCacheSize = 65536
+
+def parseMetrics(text):
+    """
+    Parses the metricsAtStart or metricsAtEnd text of an alert agent or
+    monitor, such as 'Packet Loss: 18%, Latency: 203.6 ms, Error: "",
+    Jitter: 8.2 ms'
+
+    Names are converted to camelCase keys, such as 'packetLoss'. Numeric
+    values become floats without their unit, 'N/A' becomes None and other
+    values, such as errors, stay strings without quotes. Results are cached,
+    so the returned dictionary must not be modified.
+
+    Parameters
+    ----------
+    text : str
+        Metrics text
+
+    Returns
+    -------
+    dict
+        Metric values. Empty for texts without metrics, such as
+        'N/A (agent removed from test)'.
+    """
+
+    metrics = _metricsCache.get(text)
+    if metrics is not None:
+        return metrics
+
+    metrics = {}
+    for match in _metricPattern.finditer(text or ''):
+        words = match.group(1).split()
+        name = words[0].lower() + ''.join(word.capitalize() for word in words[1:])
+        value = match.group(2).strip()
+        number = _numberPattern.match(value)
+        if number:
+            metrics[name] = float(number.group(1).replace(',', ''))
+        elif value == 'N/A':
+            metrics[name] = None
+        elif len(value) >= 2 and value[0] == value[-1] == '"':
+            metrics[name] = value[1:-1]
+        else:
+            metrics[name] = value
+
+    if len(_metricsCache) >= metricsCacheSize:
+        _metricsCache.clear()
+    _metricsCache[text] = metrics
+    return metrics
+
+"""
+
+ AlertIndex class.
+
+"""
+
+class AlertIndex:
+    """
+    AlertIndex class keeps the agents and monitors of alerts as typed
+    columns, with metricsAtStart parsed into numeric columns, and indexes
+    them by alertId, agentId, monitorId and dateStart. Alerts can be added
+    from iterAlerts or from /alerts API results, and the index can be saved
+    and loaded, so queries do not require rescanning the alert data.
+
+    Missing numeric values are stored as NaN and returned as None.
+
+    Attributes
+    ----------
+    alerts : dict
+        Alert properties, without agents and monitors, by alertId
+
+    Methods
+    -------
+    add(alert)
+        Adds the agents and monitors of an alert, replacing earlier ones
+    query(alertId = None, agentId = None, monitorId = None, start = None, end = None, minimum = {}, maximum = {})
+        Returns the matching agent and monitor rows
+    save(fileName)
+        Saves the index
+    load(fileName)
+        Loads a saved index
+    """
+
+    """ Numeric metric columns parsed from metricsAtStart """
+    metricColumns = ['packetLoss', 'latency', 'jitter', 'reachability']
+    """ Integer columns; dateEnd is 0 while the agent or monitor is active """
+    integerColumns = ['alertId', 'memberId', 'dateStart', 'dateEnd', 'active']
+
+    def __init__(self):
+
+        self.alerts = {}
+        self.columns = dict((name, array('l')) for name in self.integerColumns)
+        self.columns.update((name, array('d')) for name in self.metricColumns)
+        """ 'agent' or 'monitor' per row, and the metricsAtStart error text """
+        self.columns['memberType'] = []
+        self.columns['error'] = []
+
+        self._byAlert = {}
+        self._byMember = {}
+        self._deleted = set()
+        self._dates = {}
+        self._order = None
+
+
+    def add(self, alert):
+        """
+        Adds the agents and monitors of an alert
+
+        Parameters
+        ----------
+        alert : dict
+            Alert, as returned by iterAlerts or by the /alerts endpoint
+        """
+
+        alertId = int(alert['alertId'])
+        """ Rows of an earlier version of the alert are left out of queries """
+        self._deleted.update(self._byAlert.pop(alertId, []))
+        self.alerts[alertId] = dict((key, value) for key, value in alert.items()
+                                    if key not in ('agents', 'monitors'))
+
+        rows = self._byAlert[alertId] = []
+        for memberType in ('agent', 'monitor'):
+            for member in alert.get(memberType + 's') or []:
+                row = len(self.columns['alertId'])
+                memberId = int(member[memberType + 'Id'])
+                metrics = parseMetrics(member.get('metricsAtStart', ''))
+                self.columns['alertId'].append(alertId)
+                self.columns['memberId'].append(memberId)
+                self.columns['dateStart'].append(self._epoch(member.get('dateStart')))
+                self.columns['dateEnd'].append(self._epoch(member.get('dateEnd')))
+                self.columns['active'].append(int(member.get('active') or 0))
+                for name in self.metricColumns:
+                    value = metrics.get(name)
+                    self.columns[name].append(float('nan') if value is None else value)
+                self.columns['memberType'].append(memberType)
+                self.columns['error'].append(metrics.get('error') or metrics.get('errorType') or '')
+                rows.append(row)
+                self._byMember.setdefault((memberType, memberId), []).append(row)
+        self._order = None
+
+
+    def query(self, alertId=None, agentId=None, monitorId=None, start=None, end=None, minimum={}, maximum={}):
+        """
+        Returns the agent and monitor rows matching all of the conditions
+
+        Parameters
+        ----------
+        alertId : int, optional
+            Alert ID
+        agentId : int, optional
+            Agent ID
+        monitorId : int, optional
+            BGP monitor ID
+        start : int, optional
+            Epoch of the earliest dateStart
+        end : int, optional
+            Epoch after the latest dateStart
+        minimum : dict
+            Lowest values of metric columns, such as {'packetLoss': 10}
+        maximum : dict
+            Highest values of metric columns
+
+        Returns
+        -------
+        list
+            Row dictionaries, ordered by dateStart, with the alert's testId,
+            testName and ruleName
+        """
+
+        """ Start with the most selective index """
+        candidates = None
+        if agentId is not None:
+            candidates = self._byMember.get(('agent', int(agentId)), [])
+        if monitorId is not None:
+            rows = self._byMember.get(('monitor', int(monitorId)), [])
+            candidates = rows if candidates is None else set(candidates) & set(rows)
+        if alertId is not None:
+            rows = self._byAlert.get(int(alertId), [])
+            candidates = rows if candidates is None else set(candidates) & set(rows)
+        if candidates is None:
+            order, dates = self._sorted()
+            first = 0 if start is None else bisect.bisect_left(dates, start)
+            last = len(order) if end is None else bisect.bisect_left(dates, end)
+            candidates = order[first:last]
+
+        dateStart = self.columns['dateStart']
+        result = []
+        for row in candidates:
+            if row in self._deleted:
+                continue
+            if (start is not None and dateStart[row] < start) or (end is not None and dateStart[row] >= end):
+                continue
+            """ NaN fails every comparison, so missing metrics never match """
+            if any(not self.columns[name][row] >= value for name, value in minimum.items()):
+                continue
+            if any(not self.columns[name][row] <= value for name, value in maximum.items()):
+                continue
+            result.append(self._row(row))
+        result.sort(key=lambda row: row['dateStart'])
+        return result
+
+
+    def save(self, fileName):
+        """
+        Saves the index as a JSON file
+
+        Parameters
+        ----------
+        fileName : str
+            File name
+        """
+
+        live = [row for row in range(0, len(self.columns['alertId'])) if row not in self._deleted]
+        columns = {}
+        for name, column in self.columns.items():
+            values = [column[row] for row in live]
+            if name in self.metricColumns:
+                values = [None if value != value else value for value in values]
+            columns[name] = values
+        state = {'alerts': self.alerts.values(), 'columns': columns}
+        f = open(fileName + '.tmp', 'w')
+        try:
+            json.dump(state, f)
+        finally:
+            f.close()
+        os.rename(fileName + '.tmp', fileName)
+
+
+    def load(self, fileName):
+        """
+        Loads an index saved by save, replacing the current content
+
+        Parameters
+        ----------
+        fileName : str
+            File name
+        """
+
+        f = open(fileName)
+        try:
+            state = json.load(f)
+        finally:
+            f.close()
+        self.__init__()
+        for alert in state['alerts']:
+            self.alerts[int(alert['alertId'])] = alert
+            self._byAlert[int(alert['alertId'])] = []
+        columns = state['columns']
+        for name in self.integerColumns:
+            self.columns[name].extend(columns[name])
+        for name in self.metricColumns:
+            self.columns[name].extend(float('nan') if value is None else value for value in columns[name])
+        self.columns['memberType'] = columns['memberType']
+        self.columns['error'] = columns['error']
+        for row in range(0, len(self.columns['alertId'])):
+            self._byAlert.setdefault(self.columns['alertId'][row], []).append(row)
+            self._byMember.setdefault((self.columns['memberType'][row], self.columns['memberId'][row]), []).append(row)
+
+
+    def _row(self, row):
+        """ Returns the row as a dictionary. """
+        alert = self.alerts[self.columns['alertId'][row]]
+        result = {
+            'alertId': self.columns['alertId'][row],
+            self.columns['memberType'][row] + 'Id': self.columns['memberId'][row],
+            'dateStart': self.columns['dateStart'][row],
+            'dateEnd': self.columns['dateEnd'][row] or None,
+            'active': self.columns['active'][row],
+            'error': self.columns['error'][row],
+            'testId': alert.get('testId'),
+            'testName': alert.get('testName'),
+            'ruleName': alert.get('ruleName'),
+        }
+        for name in self.metricColumns:
+            value = self.columns[name][row]
+            result[name] = None if value != value else value
+        return result
+
+
+    def _sorted(self):
+        """ Returns the live rows ordered by dateStart, and their dates. """
+        if self._order is None:
+            dateStart = self.columns['dateStart']
+            order = sorted((row for row in range(0, len(dateStart)) if row not in self._deleted),
+                           key=dateStart.__getitem__)
+            self._order = (order, [dateStart[row] for row in order])
+        return self._order
+
+
+    def _epoch(self, date):
+        """ Returns the epoch of an API date, or 0. Dates are cached, alerts share many of them. """
+        if not date:
+            return 0
+        epoch = self._dates.get(date)
+        if epoch is None:
+            epoch = self._dates[date] = calendar.timegm(time.strptime(date, '%Y-%m-%d %H:%M:%S'))
+        return epoch
+
+"""
+
+ AlertWatcher class.
+
+"""
+
+class AlertWatcher:
+    """
+    AlertWatcher class polls the /alerts endpoint and turns the results into
+    a stream of changes, so consumers handle deltas instead of the full list
+    of active alerts on every poll.
+
+    Each poll asks only for alerts active since the previous poll. A compact
+    state of the known active alerts is kept by alertId: the alert's start
+    date, violation count and, per agent or monitor, the end date. The state
+    is saved to the state file after every poll, so a restarted watcher
+    continues where it stopped.
+
+    Events are dictionaries with an 'event' key, one of 'new', 'updated' or
+    'cleared', the 'alertId', the 'alert' as returned by the API, and a list
+    of 'transitions' of its agents and monitors. A transition has 'agentId'
+    or 'monitorId', a 'transition' of 'new' or 'cleared', and the 'dateEnd'
+    of cleared ones.
+
+    Attributes
+    ----------
+    api : ThousandEyesApi
+        API object used for the requests.
+
+    stateFile : str
+        JSON file the state is kept in between runs. If not set, the state
+        is kept in memory only.
+
+    overlap : int
+        Seconds each poll reaches back before the previous one, covering
+        alerts recorded late or clock differences.
+
+    Methods
+    -------
+    poll()
+        Fetches alerts changed since the previous poll and returns events
+    watch(interval = 60)
+        Polls forever and yields events
+    """
+
+    def __init__(self, api, stateFile=None, overlap=60):
+
+        self.api = api
+        self.stateFile = stateFile
+        self.overlap = overlap
+        self.state = {'lastPoll': None, 'alerts': {}, 'cleared': {}}
+        if stateFile is not None and os.path.exists(stateFile):
+            f = open(stateFile)
+            try:
+                self.state = json.load(f)
+            finally:
+                f.close()
+
+
+    def poll(self):
+        """
+        Fetches the alerts active since the previous poll and returns the
+        changes. The first poll returns every active alert as new.
+
+        Returns
+        -------
+        list
+            List of events
+        """
+
+        now = int(time.time())
+        uriParameters = {}
+        known = self.state['alerts']
+        cleared = self.state['cleared']
+        if self.state['lastPoll'] is not None:
+            since = self.state['lastPoll'] - self.overlap
+            uriParameters['from'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(since))
+            """ Cleared alerts are remembered only while a poll can still return them """
+            for alertId in [alertId for alertId, clearedAt in cleared.items() if clearedAt < since]:
+                del cleared[alertId]
+
+        seen = set()
+        events = []
+        for alert in self.api.paginate('/alerts', uriParameters, 'alert'):
+            alertId = str(alert['alertId'])
+            seen.add(alertId)
+            if alertId in cleared:
+                continue
+            event = self._compare(alertId, alert, known.get(alertId))
+            if event is not None:
+                events.append(event)
+                if event['event'] == 'cleared':
+                    cleared[alertId] = now
+
+        """
+        Alerts active at the previous poll are returned by a poll since then,
+        unless the first poll of a fresh state left them out. Missing ones
+        have cleared without a trace in the result.
+        """
+        if uriParameters:
+            for alertId in [alertId for alertId in known if alertId not in seen]:
+                transitions = [self._transition(member, 'cleared', None) for member, dateEnd
+                               in known[alertId]['members'].items() if dateEnd is None]
+                events.append({'event': 'cleared', 'alertId': int(alertId), 'alert': None,
+                               'transitions': transitions})
+                del known[alertId]
+                cleared[alertId] = now
+
+        self.state['lastPoll'] = now
+        self._save()
+        return events
+
+
+    def watch(self, interval=60):
+        """
+        Polls the alerts every interval seconds and yields the events
+
+        Parameters
+        ----------
+        interval : int
+            Seconds between the start of two polls
+
+        Returns
+        -------
+        generator
+            Events, refer to the class description
+        """
+
+        while True:
+            start = time.time()
+            for event in self.poll():
+                yield event
+            time.sleep(max(0, interval - (time.time() - start)))
+
+
+    def _compare(self, alertId, alert, previous):
+        """ Updates the state of the alert and returns its event, or None if nothing changed. """
+
+        members = {}
+        for memberType in ('agent', 'monitor'):
+            for member in alert.get(memberType + 's') or []:
+                members[memberType + ':' + str(member[memberType + 'Id'])] = member.get('dateEnd') or None
+
+        transitions = []
+        before = previous['members'] if previous is not None else {}
+        for member, dateEnd in sorted(members.items()):
+            if member not in before or (before[member] is not None and dateEnd is None):
+                transitions.append(self._transition(member, 'new', None))
+            elif dateEnd is not None and before[member] is None:
+                transitions.append(self._transition(member, 'cleared', dateEnd))
+
+        cleared = str(alert.get('active', 1)) == '0' or bool(alert.get('dateEnd'))
+        if cleared:
+            """ Agents still open at the end of the alert end with it """
+            for member, dateEnd in sorted(members.items()):
+                if dateEnd is None and member in before and before[member] is None:
+                    transitions.append(self._transition(member, 'cleared', alert.get('dateEnd')))
+            if previous is None and not alert.get('dateEnd'):
+                return None
+            self.state['alerts'].pop(alertId, None)
+            return {'event': 'cleared', 'alertId': int(alertId), 'alert': alert, 'transitions': transitions}
+
+        compact = {'dateStart': alert.get('dateStart'), 'violationCount': alert.get('violationCount'),
+                   'members': members}
+        self.state['alerts'][alertId] = compact
+        if previous is None:
+            return {'event': 'new', 'alertId': int(alertId), 'alert': alert, 'transitions': transitions}
+        if transitions or previous['violationCount'] != compact['violationCount']:
+            return {'event': 'updated', 'alertId': int(alertId), 'alert': alert, 'transitions': transitions}
+        return None
+
+
+    def _transition(self, member, transition, dateEnd):
+        memberType, memberId = member.split(':', 1)
+        result = {memberType + 'Id': int(memberId) if memberId.isdigit() else memberId, 'transition': transition}
+        if transition == 'cleared':
+            result['dateEnd'] = dateEnd
+        return result
+
+
+    def _save(self):
+        """ Writes to a temporary file first, so an interrupted run keeps the old state. """
+        if self.stateFile is None:
+            return
+        f = open(self.stateFile + '.tmp', 'w')
+        try:
+            json.dump(self.state, f)
+        finally:
+            f.close()
+        os.rename(self.stateFile + '.tmp', self.stateFile)
@@ -1,13 +1,1069 @@
 #!/usr/bin/python
 
+import sys
+import os
 import urllib, urllib2
+import urlparse
 import json
 import httplib
+import socket
+import select
+import base64
+import hashlib
+import zlib
+import collections
+import threading
 import time
+import random
+import email.utils
+import Queue
+from multiprocessing.pool import ThreadPool
 
 """
 
- ThousandEyesApi class. 
+ Helper functions.
+
+"""
+
+def windowSeconds(window):
+    """
+    Converts an API time window, such as '2d' or '12h', to number of seconds
+
+    Parameters
+    ----------
+    window : str
+        Time window as a number followed by unit: s, m, h, d or w. Number
+        without a unit is in seconds.
+
+    Returns
+    -------
+    int
+        Length of the time window in seconds.
+    """
+
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+    window = str(window).strip()
+    if window[-1:] in units:
+        return int(window[:-1]) * units[window[-1]]
+    return int(window)
+
+
+"""
+
+ ConnectionPool class.
+
+"""
+
+class ConnectionPool:
+    """
+    ConnectionPool class keeps a thread-safe pool of persistent (keep-alive)
+    HTTP and HTTPS connections, so consecutive API requests to the same host
+    skip the TCP and TLS handshake.
+
+    Proxies are taken from the http_proxy, https_proxy and no_proxy
+    environment variables, as by urllib2. HTTPS requests are tunnelled
+    through the proxy with CONNECT. Redirects of GET and HEAD requests are
+    followed.
+
+    Attributes
+    ----------
+    maxSize : int
+        Maximum number of idle connections kept in the pool across all hosts.
+
+    maxPerHost : int
+        Maximum number of connections (idle and in use) open to a single host.
+        Callers block until a connection to the host becomes available.
+
+    idleTimeout : int
+        Number of seconds an idle connection is kept before it is discarded.
+
+    timeout : int
+        Socket timeout in seconds for each connection.
+
+    maxRedirects : int
+        Maximum number of redirects followed for a request.
+
+    Methods
+    -------
+    urlopen(method, uri, body = None, headers = {})
+        Issues a HTTP request over a pooled connection and returns a
+        PooledResponse object
+    close()
+        Closes all idle connections in the pool
+    """
+
+    """ Methods that can be sent again when a reused connection fails, as repeating them is harmless """
+    idempotentMethods = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+    redirectCodes = (301, 302, 303, 307, 308)
+
+    def __init__(self, maxSize=10, maxPerHost=4, idleTimeout=60, timeout=60, maxRedirects=5):
+
+        self.maxSize = maxSize
+        self.maxPerHost = maxPerHost
+        self.idleTimeout = idleTimeout
+        self.timeout = timeout
+        self.maxRedirects = maxRedirects
+
+        """ Idle connections per host key, as a list of (connection, lastUsed) tuples """
+        self._idle = {}
+        """ Number of open connections (idle and in use) per host key """
+        self._open = {}
+        self._idleCount = 0
+        self._condition = threading.Condition(threading.Lock())
+
+
+    def urlopen(self, method, uri, body=None, headers={}):
+        """
+        Issues a HTTP request over a pooled connection
+
+        Parameters
+        ----------
+        method : str
+            HTTP method, such as 'GET' or 'POST'
+        uri : str
+            Full URL of the request
+        body : str, optional
+            Request payload
+        headers : dict
+            Dictionary of HTTP request headers
+
+        Returns
+        -------
+        PooledResponse
+            Response object. Connection is returned to the pool once the
+            response body is read completely or the response is closed.
+        """
+
+        connectSeconds = 0.0
+        for redirect in range(0, self.maxRedirects + 1):
+            result = self._urlopen(method, uri, body, headers)
+            connectSeconds += result.connectSeconds
+            result.connectSeconds = connectSeconds
+            location = result.info().getheader('Location')
+            if method not in ('GET', 'HEAD') or result.code not in self.redirectCodes or not location:
+                return result
+            if redirect == self.maxRedirects:
+                return result
+            result.read()
+            result.close()
+            location = urlparse.urljoin(uri, location)
+            if urlparse.urlsplit(location).netloc != urlparse.urlsplit(uri).netloc:
+                """ Credentials are never passed on to another host """
+                headers = dict((name, value) for name, value in headers.items() if name.lower() != 'authorization')
+            uri = location
+
+
+    def _urlopen(self, method, uri, body, headers):
+        """ Issues a single HTTP request over a pooled connection, without following redirects. """
+
+        parsed = urlparse.urlsplit(uri)
+        proxy = self._proxy(parsed)
+        key = (parsed.scheme, parsed.hostname, parsed.port, proxy)
+        if proxy is not None and parsed.scheme != 'https':
+            """ Plain HTTP requests are sent to the proxy with the full URL """
+            path = urlparse.urlunsplit((parsed.scheme, parsed.netloc, parsed.path or '/', parsed.query, ''))
+            if proxy[2] is not None:
+                headers = dict(headers, **{'Proxy-Authorization': proxy[2]})
+        else:
+            path = parsed.path or '/'
+            if parsed.query:
+                path += '?' + parsed.query
+
+        """
+        A pooled connection may have been closed by the server while it was
+        idle. Connections the server already closed are discarded before
+        use. If a reused connection still fails, the request is repeated
+        over another connection, but only if it was not sent yet, or if
+        repeating it is harmless. A timeout means the server got the request
+        and is never repeated.
+        """
+        connectSeconds = 0.0
+        while True:
+            connection, reused = self._acquire(key)
+            if not reused:
+                connectSeconds += connection.connectSeconds
+            elif self._dropped(connection):
+                self._release(key, connection, False)
+                continue
+            sent = time.time()
+            written = False
+            try:
+                connection.request(method, path, body, headers)
+                written = True
+                response = connection.getresponse()
+            except (socket.error, httplib.HTTPException), e:
+                self._release(key, connection, False)
+                repeat = not written or method in self.idempotentMethods
+                if reused and repeat and not isinstance(e, socket.timeout):
+                    continue
+                raise
+            result = PooledResponse(self, key, connection, response)
+            result.connectSeconds = connectSeconds
+            result.ttfbSeconds = time.time() - sent
+            return result
+
+
+    def close(self):
+        """
+        Closes all idle connections in the pool
+        """
+
+        with self._condition:
+            for key in self._idle.keys():
+                for connection, lastUsed in self._idle[key]:
+                    connection.close()
+                    self._open[key] -= 1
+                self._idleCount -= len(self._idle[key])
+                del self._idle[key]
+            self._condition.notify_all()
+
+
+    def _acquire(self, key):
+        """ Returns a (connection, reused) tuple for the host key. """
+        with self._condition:
+            while True:
+                self._expire()
+                idle = self._idle.get(key)
+                if idle:
+                    """ Most recently used connection is the least likely to be stale """
+                    connection, lastUsed = idle.pop()
+                    self._idleCount -= 1
+                    return connection, True
+                if self._open.get(key, 0) < self.maxPerHost:
+                    self._open[key] = self._open.get(key, 0) + 1
+                    break
+                self._condition.wait()
+
+        scheme, host, port, proxy = key
+        if proxy is not None and scheme == 'https':
+            """ TLS to the host, tunnelled through the proxy with CONNECT """
+            connection = httplib.HTTPSConnection(proxy[0], proxy[1], timeout=self.timeout)
+            tunnelHeaders = {'Proxy-Authorization': proxy[2]} if proxy[2] is not None else None
+            connection.set_tunnel(host, port, tunnelHeaders)
+        elif proxy is not None:
+            connection = httplib.HTTPConnection(proxy[0], proxy[1], timeout=self.timeout)
+        elif scheme == 'https':
+            connection = httplib.HTTPSConnection(host, port, timeout=self.timeout)
+        else:
+            connection = httplib.HTTPConnection(host, port, timeout=self.timeout)
+        try:
+            start = time.time()
+            connection.connect()
+            connection.connectSeconds = time.time() - start
+            """
+            httplib sends the headers and the body of a POST request in separate
+            writes. Disable Nagle's algorithm, so the body does not wait for the
+            delayed ACK of the headers.
+            """
+            connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except:
+            self._release(key, connection, False)
+            raise
+        return connection, False
+
+
+    def _proxy(self, parsed):
+        """ Returns the (host, port, Proxy-Authorization) of the proxy for the URL, or None. """
+
+        proxyUri = urllib.getproxies().get(parsed.scheme)
+        if not proxyUri or urllib.proxy_bypass(parsed.hostname):
+            return None
+        if '://' not in proxyUri:
+            proxyUri = 'http://' + proxyUri
+        proxy = urlparse.urlsplit(proxyUri)
+        authorization = None
+        if proxy.username is not None:
+            credentials = urllib.unquote(proxy.username) + ':' + urllib.unquote(proxy.password or '')
+            authorization = 'Basic ' + base64.b64encode(credentials)
+        return (proxy.hostname, proxy.port or (443 if proxy.scheme == 'https' else 80), authorization)
+
+
+    def _dropped(self, connection):
+        """ Returns True if an idle connection was closed by the server, or has unexpected data. """
+
+        if connection.sock is None:
+            return True
+        try:
+            readable, writable, failed = select.select([connection.sock], [], [], 0)
+        except (select.error, socket.error, ValueError):
+            return True
+        return bool(readable)
+
+
+    def _release(self, key, connection, reusable):
+        """ Returns a connection to the pool, or closes it if it can not be reused. """
+        with self._condition:
+            if reusable and self._idleCount < self.maxSize:
+                self._idle.setdefault(key, []).append((connection, time.time()))
+                self._idleCount += 1
+            else:
+                connection.close()
+                self._open[key] -= 1
+            self._condition.notify()
+
+
+    def _expire(self):
+        """ Closes idle connections that exceeded the idle timeout. Caller holds the lock. """
+        deadline = time.time() - self.idleTimeout
+        for key in self._idle.keys():
+            fresh = []
+            for connection, lastUsed in self._idle[key]:
+                if lastUsed < deadline:
+                    connection.close()
+                    self._open[key] -= 1
+                    self._idleCount -= 1
+                else:
+                    fresh.append((connection, lastUsed))
+            self._idle[key] = fresh
+
+
+class PooledResponse:
+    """
+    PooledResponse class wraps a httplib response issued over a pooled
+    connection and returns the connection to the pool once the body is read.
+
+    Attributes
+    ----------
+    code : int
+        HTTP response status code
+
+    reason : str
+        HTTP response reason phrase
+
+    connectSeconds : float
+        Time spent opening new connections for the request, 0 if a pooled
+        connection was reused
+
+    ttfbSeconds : float
+        Time from sending the request until the response headers arrived
+
+    bytesRead : int
+        Number of body bytes read so far
+
+    onClose : callable, optional
+        Called with the response once it is closed
+
+    Methods
+    -------
+    read(amt = None)
+        Reads and returns up to amt bytes of the response body
+    info()
+        Returns the HTTP response headers
+    close()
+        Releases the underlying connection
+    """
+
+    def __init__(self, pool, key, connection, response):
+
+        self.pool = pool
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.code = response.status
+        self.reason = response.reason
+        self.connectSeconds = 0.0
+        self.ttfbSeconds = None
+        self.bytesRead = 0
+        self.onClose = None
+
+
+    def read(self, amt=None):
+        try:
+            if amt is None:
+                data = self.response.read()
+            else:
+                data = self.response.read(amt)
+        except:
+            self.close()
+            raise
+        self.bytesRead += len(data)
+        if self.response.isclosed():
+            self.close()
+        return data
+
+
+    def info(self):
+        return self.response.msg
+
+
+    def close(self):
+        if self.connection is None:
+            return
+        """ Connection can only be reused if the whole body was consumed """
+        reusable = self.response.isclosed() and not self.response.will_close
+        if not reusable:
+            self.response.close()
+        self.pool._release(self.key, self.connection, reusable)
+        self.connection = None
+        if self.onClose is not None:
+            self.onClose(self)
+
+
+"""
+
+ RateLimiter class.
+
+"""
+
+class RateLimiter:
+    """
+    RateLimiter class implements a client side token bucket that keeps API
+    requests under the per organization request limit. A single RateLimiter
+    object is safe to share between threads. To share the limit between
+    processes, for example several scripts running on the same box, point all
+    of them to the same state file.
+
+    Attributes
+    ----------
+    rate : int
+        Number of requests allowed per period. The ThousandEyes API allows 240
+        requests per minute, per organization.
+
+    period : int
+        Length of the rate limiting period in seconds.
+
+    burst : int, optional
+        Bucket size, or the number of requests that can be issued back to back.
+        Defaults to one second worth of requests.
+
+    stateFile : str, optional
+        Path of the file holding the bucket state. The file is locked on every
+        access, so all processes using it share a single bucket. If not set,
+        the bucket is kept in memory.
+
+    Methods
+    -------
+    acquire()
+        Blocks until a request can be issued and returns the number of seconds
+        spent waiting
+    pause(delay)
+        Stops issuing requests for the next delay seconds
+    """
+
+    def __init__(self, rate=240, period=60, burst=None, stateFile=None):
+
+        self.rate = rate
+        self.period = period
+        if burst is None:
+            burst = max(1, rate / period)
+        self.burst = burst
+        self.stateFile = stateFile
+
+        self._lock = threading.Lock()
+        self._state = {'tokens': float(burst), 'updated': time.time(), 'pausedUntil': 0}
+        if stateFile is not None:
+            import fcntl
+            self._fcntl = fcntl
+            self._file = open(stateFile, 'a+')
+
+
+    def acquire(self):
+        """
+        Blocks until a request can be issued
+
+        Returns
+        -------
+        float
+            Number of seconds spent waiting for the request slot.
+        """
+
+        waited = 0.0
+        while True:
+            delay = self._update(self._take)
+            if delay <= 0:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+
+    def pause(self, delay):
+        """
+        Stops issuing requests for the next delay seconds. Used when the API
+        reports the limit was exceeded.
+
+        Parameters
+        ----------
+        delay : float
+            Number of seconds to wait before the next request.
+        """
+
+        pausedUntil = time.time() + delay
+        def extend(state):
+            state['pausedUntil'] = max(state['pausedUntil'], pausedUntil)
+        self._update(extend)
+
+
+    def _take(self, state):
+        """ Takes a token from the bucket, returns the delay until one is available otherwise. """
+        now = time.time()
+        if now < state['pausedUntil']:
+            return state['pausedUntil'] - now
+        tokens = min(self.burst, state['tokens'] + (now - state['updated']) * self.rate / self.period)
+        state['updated'] = now
+        if tokens >= 1:
+            state['tokens'] = tokens - 1
+            return 0
+        state['tokens'] = tokens
+        return (1 - tokens) * self.period / self.rate
+
+
+    def _update(self, function):
+        """ Applies function to the bucket state under the thread and file locks. """
+        with self._lock:
+            if self.stateFile is None:
+                return function(self._state)
+            self._fcntl.flock(self._file, self._fcntl.LOCK_EX)
+            try:
+                self._file.seek(0)
+                content = self._file.read()
+                state = dict(self._state)
+                if content:
+                    state.update(json.loads(content))
+                result = function(state)
+                self._file.seek(0)
+                self._file.truncate()
+                self._file.write(json.dumps(state))
+                self._file.flush()
+            finally:
+                self._fcntl.flock(self._file, self._fcntl.LOCK_UN)
+            return result
+
+
+"""
+
+ JsonStream class.
+
+"""
+
+class JsonStream:
+    """
+    JsonStream class incrementally decodes a JSON document read from a
+    response and yields the elements of a single array inside it, such as
+    the 'dns.trace' list of a DNS trace page. Only one element is held in
+    memory at a time. All other values of the document are collected into
+    the metadata dictionary, which is complete once the elements have been
+    consumed.
+
+    Attributes
+    ----------
+    itemKey : str
+        Dot separated path of the streamed array, such as 'dns.trace'.
+
+    itemType : type, optional
+        Record type the array elements are decoded into, such as
+        terecords.DnsTrace. If not set, elements are dictionaries.
+
+    metadata : dict
+        Document without the streamed array, such as {'pages': {...}}.
+
+    Methods
+    -------
+    pages()
+        Returns the 'pages' metadata of the document, reading the rest of the
+        document if the elements were not consumed yet
+    close()
+        Releases the underlying response
+    """
+
+    decoder = json.JSONDecoder()
+    whitespace = ' \t\n\r'
+    """ Characters that may follow a complete value """
+    delimiters = whitespace + ',:]}'
+
+
+    def __init__(self, response, itemKey, chunkSize=65536, itemType=None):
+
+        self.response = response
+        self.itemKey = itemKey
+        self.chunkSize = chunkSize
+        self.itemType = itemType
+        self.metadata = {}
+        self._itemDecoder = self.decoder
+        if itemType is not None:
+            """ Elements are decoded straight into records, without a dictionary in between """
+            self._itemDecoder = json.JSONDecoder(object_pairs_hook=itemType.fromPairs)
+
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._items = self._parse()
+
+
+    def __iter__(self):
+        return self._items
+
+
+    def next(self):
+        return self._items.next()
+
+
+    def pages(self):
+        for item in self._items:
+            pass
+        return self.metadata.get('pages', {})
+
+
+    def close(self):
+        self._items.close()
+        self.response.close()
+
+
+    def _parse(self):
+        """ Walks the objects on the item path and yields the array elements. """
+        try:
+            path = self.itemKey.split('.')
+            for item in self._parseObject(path, self.metadata):
+                yield item
+        finally:
+            self.response.close()
+
+
+    def _parseObject(self, path, metadata):
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            if key != path[0]:
+                metadata[key] = self._value()
+            elif len(path) > 1:
+                metadata[key] = {}
+                for item in self._parseObject(path[1:], metadata[key]):
+                    yield item
+            else:
+                for item in self._parseArray():
+                    yield item
+            if self._expect(',}') == '}':
+                return
+
+
+    def _parseArray(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value(self._itemDecoder)
+            if self._expect(',]') == ']':
+                return
+
+
+    def _peek(self):
+        """ Returns the next non-whitespace character without consuming it. """
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in self.whitespace:
+                self._pos += 1
+            if self._pos < len(self._buffer) or not self._fill():
+                break
+        if self._pos >= len(self._buffer):
+            raise ValueError('Unexpected end of JSON document')
+        return self._buffer[self._pos]
+
+
+    def _expect(self, characters):
+        character = self._peek()
+        if character not in characters:
+            raise ValueError('Expecting one of "' + characters + '" at ' + repr(self._buffer[self._pos:self._pos + 20]))
+        self._pos += 1
+        return character
+
+
+    def _value(self, decoder=None):
+        """ Decodes a complete JSON value, reading more data until it is available. """
+        decoder = decoder or self.decoder
+        self._peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self._buffer, self._pos)
+                """
+                A number cut by the end of a chunk decodes as a shorter one,
+                such as '203.' for '203.6' or '20' for '203', so the value is
+                only complete when a delimiter follows it.
+                """
+                if self._eof or (end < len(self._buffer) and self._buffer[end] in self.delimiters):
+                    self._pos = end
+                    return value
+            except ValueError:
+                if self._eof:
+                    raise
+            self._fill()
+
+
+    def _fill(self):
+        """ Appends the next chunk of the response to the buffer. Returns False at the end. """
+        if self._eof:
+            return False
+        try:
+            chunk = self.response.read(self.chunkSize)
+        except socket.error, e:
+            raise Exception("API URL error: " + str(e))
+        except httplib.HTTPException, e:
+            raise Exception("API HTTP exception: " + str(e))
+        """ Drop the consumed part, so the buffer only holds the current value """
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        if not chunk:
+            self._eof = True
+            return False
+        return True
+
+
+"""
+
+ ResponseCache class.
+
+"""
+
+class ResponseCache:
+    """
+    ResponseCache class stores API responses of GET requests, so repeated
+    requests for slowly changing data, such as the agent or test inventory,
+    are served locally without touching the network or the rate limit.
+    Responses are kept in an in-memory LRU tier and, optionally, in a
+    directory of compressed files that survives between script runs.
+
+    Responses are keyed on the endpoint path, the sorted URL parameters and
+    the user account.
+    Each endpoint class gets its own time to live. Once an entry expires, it
+    is revalidated with If-None-Match/If-Modified-Since if the API provided
+    an ETag or Last-Modified header, and fetched again otherwise.
+
+    Attributes
+    ----------
+    ttls : dict
+        Time to live in seconds per endpoint prefix, such as
+        {'/agents': 3600, '/tests': 600}. The longest matching prefix wins.
+
+    defaultTtl : int
+        Time to live of endpoints not listed in ttls. Responses with a time to
+        live of 0 are not cached.
+
+    maxEntries : int
+        Number of responses kept in memory.
+
+    directory : str, optional
+        Directory of the on-disk tier. If not set, responses are only kept in
+        memory. Responses hold account data, so the directory is created
+        readable by the user only, and so are the files in it.
+
+    hits : int
+        Number of requests served from the cache.
+
+    misses : int
+        Number of requests that had to be fetched from the API.
+
+    revalidations : int
+        Number of expired entries the API confirmed as not modified.
+
+    Methods
+    -------
+    key(uri, account = '')
+        Returns the cache key of a request URL
+    get(key)
+        Returns the cache entry for the key, or None
+    put(key, entry)
+        Stores a cache entry
+    ttl(key)
+        Returns the time to live of the key in seconds
+    clear()
+        Removes all entries from both tiers
+    stats()
+        Returns the hit, miss and revalidation counters
+    """
+
+    def __init__(self, ttls={}, defaultTtl=0, maxEntries=256, directory=None):
+
+        self.ttls = ttls
+        self.defaultTtl = defaultTtl
+        self.maxEntries = maxEntries
+        self.directory = directory
+        if directory is not None and not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def key(self, uri, account=''):
+        """
+        Returns the cache key of a request URL
+
+        Parameters
+        ----------
+        uri : str
+            Full URL of the request
+        account : str
+            User account the response belongs to
+
+        Returns
+        -------
+        str
+            Endpoint path followed by the sorted URL parameters and account.
+        """
+
+        parsed = urlparse.urlsplit(uri)
+        path = '/' + parsed.path.strip('/')
+        if path.endswith('.json'):
+            path = path[:-5]
+        return path + '?' + urllib.urlencode(sorted(urlparse.parse_qsl(parsed.query))) + '#' + account
+
+
+    def ttl(self, key):
+        """
+        Returns the time to live of the key in seconds
+        """
+
+        path = key.split('?')[0]
+        match = None
+        for prefix in self.ttls:
+            if path.startswith(prefix) and (match is None or len(prefix) > len(match)):
+                match = prefix
+        if match is None:
+            return self.defaultTtl
+        return self.ttls[match]
+
+
+    def get(self, key):
+        """
+        Returns the cache entry for the key
+
+        Parameters
+        ----------
+        key : str
+            Cache key, refer to key()
+
+        Returns
+        -------
+        dict
+            Entry with 'body', 'stored', 'etag' and 'lastModified' keys, or
+            None if the key is not cached. The entry may be expired.
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                """ Move the entry to the most recently used end """
+                del self._entries[key]
+                self._entries[key] = entry
+                return entry
+
+        if self.directory is None:
+            return None
+        fileName = self._fileName(key)
+        try:
+            f = open(fileName, 'rb')
+        except IOError:
+            return None
+        try:
+            try:
+                header, body = zlib.decompress(f.read()).split('\n', 1)
+                entry = json.loads(header)
+                if not all(name in entry for name in ('key', 'stored', 'etag', 'lastModified')):
+                    raise ValueError('Incomplete cache entry header')
+            finally:
+                f.close()
+        except (zlib.error, ValueError, TypeError, AttributeError, IOError):
+            """ A corrupt or truncated entry is a miss, and is removed """
+            try:
+                os.remove(fileName)
+            except OSError:
+                pass
+            return None
+        if entry.get('key') != key:
+            return None
+        entry['body'] = body
+        self._remember(key, entry)
+        return entry
+
+
+    def put(self, key, entry):
+        """
+        Stores a cache entry in both tiers
+
+        Parameters
+        ----------
+        key : str
+            Cache key, refer to key()
+        entry : dict
+            Entry with 'body', 'stored', 'etag' and 'lastModified' keys.
+        """
+
+        self._remember(key, entry)
+        if self.directory is None:
+            return
+
+        header = dict(entry)
+        del header['body']
+        header['key'] = key
+        fileName = self._fileName(key)
+        """ Write to a temporary file first, so readers never see a partial entry """
+        temporaryName = fileName + '.' + str(os.getpid()) + '.' + str(threading.current_thread().ident)
+        f = os.fdopen(os.open(temporaryName, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0600), 'wb')
+        try:
+            f.write(zlib.compress(json.dumps(header) + '\n' + entry['body']))
+        finally:
+            f.close()
+        os.rename(temporaryName, fileName)
+
+
+    def clear(self):
+        """
+        Removes all entries from both tiers
+        """
+
+        with self._lock:
+            self._entries.clear()
+        if self.directory is not None:
+            for fileName in os.listdir(self.directory):
+                if fileName.endswith('.z'):
+                    os.remove(os.path.join(self.directory, fileName))
+
+
+    def stats(self):
+        """
+        Returns the hit, miss and revalidation counters
+
+        Returns
+        -------
+        dict
+            Counters keyed by 'hits', 'misses' and 'revalidations'.
+        """
+
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'revalidations': self.revalidations}
+
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+
+    def _remember(self, key, entry):
+        """ Stores the entry in the memory tier, evicting the least recently used one. """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+
+
+    def _fileName(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key).hexdigest() + '.z')
+
+
+"""
+
+ SingleFlight class.
+
+"""
+
+def copyJson(value):
+    """ Returns a deep copy of a decoded JSON value. """
+    if isinstance(value, dict):
+        return dict((key, copyJson(item)) for key, item in value.iteritems())
+    if isinstance(value, list):
+        return [copyJson(item) for item in value]
+    return value
+
+
+class SingleFlight:
+    """
+    SingleFlight class runs identical concurrent calls once. Callers asking
+    for a key while a call for it is in flight wait for that call and share
+    its result, or its exception.
+
+    Every caller of a shared result gets its own copy (refer to copyJson),
+    so no caller can change what the others see and results are of the
+    same types whether they were shared or not. Results of calls nobody
+    waited for are returned without copying.
+
+    Attributes
+    ----------
+    calls : int
+        Number of calls that were run.
+
+    shared : int
+        Number of callers that got the result of another caller's call.
+
+    Methods
+    -------
+    do(key, function)
+        Runs the function, or waits for the call of the same key in flight
+    """
+
+    def __init__(self):
+
+        self.calls = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._inFlight = {}
+
+
+    def do(self, key, function):
+        """
+        Returns the result of the function, running it only if no call with
+        the same key is in flight
+
+        Parameters
+        ----------
+        key : hashable
+            Identity of the call, such as the request URL
+        function : callable
+            Function without arguments that makes the call
+
+        Returns
+        -------
+        object
+            Result of the function
+        """
+
+        with self._lock:
+            call = self._inFlight.get(key)
+            if call is None:
+                call = self._inFlight[key] = {'done': threading.Event(), 'waiters': 0}
+                self.calls += 1
+                leader = True
+            else:
+                call['waiters'] += 1
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            call['done'].wait()
+            if 'error' in call:
+                raise call['error']
+            return copyJson(call['result'])
+
+        try:
+            result = function()
+        except Exception, e:
+            with self._lock:
+                del self._inFlight[key]
+                call['error'] = e
+            call['done'].set()
+            raise
+        with self._lock:
+            """ No caller can join once the call is removed, the waiter count is final """
+            del self._inFlight[key]
+            waiters = call['waiters']
+        if not waiters:
+            call['done'].set()
+            return result
+        """ The result itself is only read from now on, every caller changes a copy """
+        call['result'] = result
+        call['done'].set()
+        return copyJson(result)
+
+
+"""
+
+ ThousandEyesApi class.
 
 """
 
@@ -24,25 +1080,99 @@ class ThousandEyesApi:
         ThousandEyes platform user API token
 
     accountGroupId : str, optional
-        ThousandEyes platform account group ID. If not set, user's default
-        account group is used.
+        ThousandEyes platform account group ID, sent as the 'aid' parameter
+        of every request. If not set, user's default account group is used.
+
+    connectionPool : ConnectionPool, optional
+        Pool of keep-alive connections used for all requests. If not set, a
+        pool with default settings is created. Pass the same pool to several
+        ThousandEyesApi objects to share connections between them.
+
+    rateLimiter : RateLimiter, optional
+        Token bucket that schedules requests under the organization request
+        limit. If not set, an in-memory limiter of 240 requests per minute is
+        created. Pass the same limiter to all ThousandEyesApi objects of an
+        organization, or use a limiter with a state file to share the limit
+        between processes.
+
+    maxRetries : int
+        Number of times a throttled (429) or failed (5xx) request is retried
+        before an exception is raised.
+
+    cache : ResponseCache, optional
+        Cache of GET request responses. If not set, responses are not cached.
+
+    singleFlight : SingleFlight, optional
+        Coalesces identical GET requests made at the same time from several
+        threads into one API call, each getting a copy of its result. If not
+        set, a SingleFlight is created. Set the attribute to None to turn
+        coalescing off.
+
+    hooks : list
+        Callables called with a record of every API request once its
+        response is consumed, or once it failed. Records hold 'method',
+        'endpoint', 'status', 'retries', 'throttleSeconds' (time waiting for
+        the rate limiter, including backoff after 429 responses),
+        'connectSeconds', 'ttfbSeconds', 'bodyBytes', 'decodeSeconds' (None
+        for streamed responses), 'totalSeconds' and 'error'. Starts as a copy
+        of ThousandEyesApi.defaultHooks. Refer to temetrics.Metrics.
 
     Methods
     -------
     getRequest(endpoint, uriParameters = {})
         Performs GET HTTP request to desired API endpoint and returns JSON data
+    getPureUrlRequest(uri)
+        Performs GET HTTP request to desired API URL and returns JSON data
     postRequest(endpoint, parameters, uriParameters = {}):
         Performs POST HTTP request to desired API endpoint and returns JSON data
+    getStreamRequest(endpoint, itemKey, uriParameters = {})
+        Performs GET HTTP request and incrementally decodes the itemKey array
+    getPureUrlStreamRequest(uri, itemKey)
+        Performs GET HTTP request to desired API URL and incrementally decodes
+        the itemKey array
+    paginate(endpoint, uriParameters = {}, itemKey = None)
+        Iterates over all pages of the endpoint result, prefetching the next page
+    accountGroups()
+        Returns the account groups of the user
+    forAccountGroup(accountGroupId)
+        Returns an API object for another account group, sharing this one's state
+    fanOut(function, accountGroupIds = None, workers = 4)
+        Calls a function with the API object of every account group in parallel
+    fanOutItems(endpoint, itemKey, uriParameters = {}, accountGroupIds = None, workers = 4)
+        Returns the items of an endpoint in every account group, tagged by group
     """
 
     apiUri = 'https://api.thousandeyes.com'
 
+    """ Hooks every new API object starts with """
+    defaultHooks = []
+
+
+    """ Server errors that are retried for idempotent requests """
+    retryCodes = (500, 502, 503, 504)
+    """ Exponential backoff base and cap in seconds """
+    backoffBase = 1
+    backoffCap = 60
+
 
-    def __init__(self, email, authToken, accountGroupId=None):
+    def __init__(self, email, authToken, accountGroupId=None, connectionPool=None,
+                 rateLimiter=None, maxRetries=10, cache=None, singleFlight=None):
 
         self.email = email
         self.authToken = authToken
         self.accountGroupId = accountGroupId
+        if connectionPool is None:
+            connectionPool = ConnectionPool()
+        self.connectionPool = connectionPool
+        if rateLimiter is None:
+            rateLimiter = RateLimiter()
+        self.rateLimiter = rateLimiter
+        self.maxRetries = maxRetries
+        self.cache = cache
+        if singleFlight is None:
+            singleFlight = SingleFlight()
+        self.singleFlight = singleFlight
+        self.hooks = list(self.defaultHooks)
 
 
     def getRequest(self, endpoint, uriParameters = {}):
@@ -62,51 +1192,14 @@ class ThousandEyesApi:
         -------
         object
             ThousandEyes API result object. Refer to the API endpoint documentation
-            for return object description.
+            for return object description. If the result was shared with
+            identical requests made at the same time, it is read-only.
         """
 
-        """ Request JSON format in return """
-        uriParameters['format'] = 'json'
-
-        uri = self.apiUri.strip('/') + '/' + endpoint.strip('/') + '?' + urllib.urlencode(uriParameters)
+        uri = self._uri(endpoint, uriParameters)
         #print(uri)
 
-        passwordManager = urllib2.HTTPPasswordMgrWithDefaultRealm()
-        passwordManager.add_password(None, self.apiUri, self.email, self.authToken)
-        handler = urllib2.HTTPBasicAuthHandler(passwordManager)
-
-        director = urllib2.build_opener(handler)
-
-        req = urllib2.Request(uri)
-
-        """
-        The ThousandEyes API throttles inbound API requests using a 240 request
-        per minute, per organization limit.
-        API request is encompassed with a for loop. If request returns a 429
-        response code (Too many requests), it is repeated 10 seconds later, up
-        to 10 times.
-        """
-        for n in range(0,10):
-            try:
-                """ Issue the API request """
-                result = director.open(req)
-            except urllib2.HTTPError, e:
-                if 429 == e.code:
-                    """ Issuing too many requests. Sleep 10 seconds and retry. """
-                    time.sleep(10)
-                    continue
-                """ We cannot handle other HTTP errors """
-                raise Exception("API HTTP error: " + str(e.code) + " " + str(e.reason))
-            except urllib2.URLError, e:
-                raise Exception("API URL error: " + str(e.reason))
-            except httplib.HTTPException, e:
-                raise Exception("API HTTP exception: " + str(e.reason))
-            # result.read() will contain the data
-            # result.info() will contain the HTTP headers
-
-            return json.loads(result.read())
-
-        return
+        return self._get(uri)
 
 
     def getPureUrlRequest(self, uri):
@@ -126,44 +1219,10 @@ class ThousandEyesApi:
             for return object description.
         """
 
+        uri = self._accountUri(uri)
         #print(uri)
 
-        passwordManager = urllib2.HTTPPasswordMgrWithDefaultRealm()
-        passwordManager.add_password(None, self.apiUri, self.email, self.authToken)
-        handler = urllib2.HTTPBasicAuthHandler(passwordManager)
-
-        director = urllib2.build_opener(handler)
-
-        req = urllib2.Request(uri)
-
-        """
-        The ThousandEyes API throttles inbound API requests using a 240 request
-        per minute, per organization limit.
-        API request is encompassed with a for loop. If request returns a 429
-        response code (Too many requests), it is repeated 10 seconds later, up
-        to 10 times.
-        """
-        for n in range(0,10):
-            try:
-                """ Issue the API request """
-                result = director.open(req)
-            except urllib2.HTTPError, e:
-                if 429 == e.code:
-                    """ Issuing too many requests. Sleep 10 seconds and retry. """
-                    time.sleep(10)
-                    continue
-                """ We cannot handle other HTTP errors """
-                raise Exception("API HTTP error: " + str(e.code) + " " + str(e.reason))
-            except urllib2.URLError, e:
-                raise Exception("API URL error: " + str(e.reason))
-            except httplib.HTTPException, e:
-                raise Exception("API HTTP exception: " + str(e.reason))
-            # result.read() will contain the data
-            # result.info() will contain the HTTP headers
-
-            return json.loads(result.read())
-
-        return
+        return self._get(uri)
 
 
     def postRequest(self, endpoint, properties, uriParameters = {}):
@@ -189,47 +1248,561 @@ class ThousandEyesApi:
             for return object description.
         """
 
+        uri = self._uri(endpoint, uriParameters)
+        #print(uri)
+
+        headers = { 'Content-Type': 'application/json'}
+        postData = json.dumps(properties)
+
+        return self._request('POST', uri, postData, headers)
+
+
+    def getStreamRequest(self, endpoint, itemKey, uriParameters = {}, itemType=None):
+        """
+        Performs GET HTTP request to desired API endpoint and returns a stream
+        of the elements of a single array in the result. Use for results that
+        are too large to be decoded at once.
+
+        Parameters
+        ----------
+        endpoint : str
+            ThousandEyes API endpoint URL, such as '/dns/trace/1234'.
+        itemKey : str
+            Dot separated path of the array to stream, such as 'dns.trace'.
+        uriParameters : dict
+            Dictionary of additional URL parameters, such as 'window'.
+        itemType : type, optional
+            Record type the elements are decoded into, such as
+            terecords.DnsTrace.
+
+        Returns
+        -------
+        JsonStream
+            Iterable of the array elements. Remaining values of the result,
+            such as 'pages', are available in its metadata attribute once the
+            elements are consumed.
+        """
+
+        uri = self._uri(endpoint, uriParameters)
+
+        return JsonStream(self._openStream(uri), itemKey, itemType=itemType)
+
+
+    def getPureUrlStreamRequest(self, uri, itemKey, itemType=None):
+        """
+        Performs GET HTTP request to desired API URL and returns a stream of
+        the elements of a single array in the result. Use for pagination
+
+        Parameters
+        ----------
+        uri : str
+            ThousandEyes API endpoint URL
+        itemKey : str
+            Dot separated path of the array to stream, such as 'dns.trace'.
+        itemType : type, optional
+            Record type the elements are decoded into.
+
+        Returns
+        -------
+        JsonStream
+            Iterable of the array elements.
+        """
+
+        return JsonStream(self._openStream(self._accountUri(uri)), itemKey, itemType=itemType)
+
+
+    def paginate(self, endpoint, uriParameters = {}, itemKey=None, windowSplit=None, workers=4, prefetch=1,
+                 stream=False, itemType=None):
+        """
+        Iterates over all pages of an API endpoint result and yields the items
+        of each page. The next page is fetched in the background while the
+        caller is still consuming the current one.
+
+        Parameters
+        ----------
+        endpoint : str
+            ThousandEyes API endpoint URL, such as '/dns/trace/1234'.
+        uriParameters : dict
+            Dictionary of additional URL parameters, such as 'window'.
+        itemKey : str, optional
+            Dot separated path of the list of items in each page, such as
+            'dns.trace'. If not set, whole pages are yielded.
+        windowSplit : int, optional
+            Length of a sub-window in seconds. If set and uriParameters contain
+            a 'window', the window is split into sub-windows that are fetched
+            in parallel. Items are still yielded in chronological order.
+        workers : int
+            Maximum number of sub-windows fetched at the same time.
+        prefetch : int
+            Number of pages fetched ahead of the caller, per sub-window.
+        stream : bool
+            If set, pages are decoded incrementally and only a bounded number
+            of items is held in memory, regardless of the page size. Requires
+            itemKey.
+        itemType : type, optional
+            Record type the items are decoded into, such as
+            terecords.DnsTrace, to keep large results in less memory.
+            Requires itemKey. Most effective with stream, which decodes the
+            items straight into records.
+
+        Returns
+        -------
+        generator
+            Items of the itemKey list of every page, or pages if itemKey is
+            not set.
+        """
+
+        """ Each list of parameters describes one chain of 'next' pages """
+        chains = [dict(uriParameters)]
+        if windowSplit and 'window' in uriParameters:
+            chains = []
+            end = int(time.time())
+            start = end - windowSeconds(uriParameters['window'])
+            while start < end:
+                """ Sub-windows do not overlap, 'to' is inclusive """
+                parameters = dict(uriParameters)
+                del parameters['window']
+                parameters['from'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(start))
+                parameters['to'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(min(start + windowSplit, end) - 1))
+                chains.append(parameters)
+                start += windowSplit
+
+        """
+        A streamed chain keeps its connection open while it waits for the
+        caller, so at most maxPerHost - 1 chains are streamed at the same
+        time, and a request made by the caller always gets a connection.
+        With a single connection per host, pages are read whole instead.
+        """
+        if stream and self.connectionPool.maxPerHost < 2:
+            stream = False
+        elif stream:
+            workers = min(workers, self.connectionPool.maxPerHost - 1)
+
+        stop = threading.Event()
+        queues = [Queue.Queue(prefetch) for parameters in chains]
+        pool = ThreadPool(min(workers, len(chains)))
+        try:
+            """ Chains are started in order, the one being consumed is always running """
+            for parameters, queue in zip(chains, queues):
+                if stream:
+                    pool.apply_async(self._streamChain, (endpoint, parameters, itemKey, queue, stop, itemType))
+                else:
+                    pool.apply_async(self._fetchChain, (endpoint, parameters, queue, stop))
+            for queue in queues:
+                while True:
+                    status, page = queue.get()
+                    if status == 'done':
+                        break
+                    if status == 'error':
+                        raise page[0], page[1], page[2]
+                    if status == 'items':
+                        for item in page:
+                            yield item
+                        continue
+                    if itemKey is None:
+                        yield page
+                        continue
+                    for key in itemKey.split('.'):
+                        page = page[key]
+                    for item in page:
+                        yield item if itemType is None else itemType.fromDict(item)
+        finally:
+            """ Release workers blocked on a full queue if the caller stopped early """
+            stop.set()
+            pool.close()
+
+
+    def accountGroups(self):
+        """
+        Returns the account groups the user has access to
+
+        Returns
+        -------
+        list
+            Account group elements, with 'aid' and 'accountGroupName' keys
+        """
+
+        return self.getRequest('/account-groups').get('accountGroups', [])
+
+
+    def forAccountGroup(self, accountGroupId):
+        """
+        Returns an API object for another account group. The new object shares
+        credentials, connections, rate limiter and cache with this one, so
+        requests of all account groups stay within the organization limit.
+
+        Parameters
+        ----------
+        accountGroupId : str
+            ThousandEyes platform account group ID
+
+        Returns
+        -------
+        ThousandEyesApi
+            API object of the account group
+        """
+
+        api = ThousandEyesApi(self.email, self.authToken, accountGroupId, self.connectionPool,
+                              self.rateLimiter, self.maxRetries, self.cache, self.singleFlight)
+        """ Keep an apiUri changed on the instance, such as in the benchmarks """
+        api.apiUri = self.apiUri
+        api.hooks = self.hooks
+        return api
+
+
+    def fanOut(self, function, accountGroupIds=None, workers=4):
+        """
+        Calls the function with the API object of every account group, in
+        parallel. All calls share the rate limiter of this object.
+
+        Parameters
+        ----------
+        function : callable
+            Function taking a ThousandEyesApi object, such as
+            lambda api: api.getRequest('/tests')
+        accountGroupIds : list, optional
+            Account group IDs. If not set, all account groups of the user.
+        workers : int
+            Maximum number of account groups queried at the same time.
+
+        Returns
+        -------
+        list
+            List of (account group, result) tuples, in account group order.
+            The account group is an element with 'aid' and
+            'accountGroupName' keys.
+        """
+
+        if accountGroupIds is None:
+            groups = self.accountGroups()
+        else:
+            names = dict((str(group['aid']), group.get('accountGroupName')) for group in self.accountGroups())
+            groups = [{'aid': aid, 'accountGroupName': names.get(str(aid))} for aid in accountGroupIds]
+        if not groups:
+            return []
+
+        pool = ThreadPool(max(1, min(workers, len(groups))))
+        try:
+            results = pool.map(lambda group: function(self.forAccountGroup(group['aid'])), groups)
+        finally:
+            pool.close()
+        return zip(groups, results)
+
+
+    def fanOutItems(self, endpoint, itemKey, uriParameters = {}, accountGroupIds=None, workers=4):
+        """
+        Returns the items of an endpoint in every account group, merged into a
+        single list. Every item is tagged with the 'aid' and
+        'accountGroupName' of its account group.
+
+        Parameters
+        ----------
+        endpoint : str
+            ThousandEyes API endpoint URL, such as '/tests'.
+        itemKey : str
+            Dot separated path of the list of items in each page, such as
+            'test'.
+        uriParameters : dict
+            Dictionary of additional URL parameters, such as 'window'.
+        accountGroupIds : list, optional
+            Account group IDs. If not set, all account groups of the user.
+        workers : int
+            Maximum number of account groups queried at the same time.
+
+        Returns
+        -------
+        list
+            Items of all account groups
+        """
+
+        results = self.fanOut(lambda api: list(api.paginate(endpoint, uriParameters, itemKey)),
+                              accountGroupIds, workers)
+        items = []
+        for group, groupItems in results:
+            for item in groupItems:
+                item = dict(item)
+                item['aid'] = group['aid']
+                item['accountGroupName'] = group.get('accountGroupName')
+                items.append(item)
+        return items
+
+
+    def _fetchChain(self, endpoint, uriParameters, queue, stop):
+        """ Fetches a page and all its 'next' pages into the queue. """
+
+        put = self._chainPut(queue, stop)
+        """ Chains still queued when the consumer stopped send no request """
+        if stop.is_set():
+            return
+        try:
+            page = self.getRequest(endpoint, uriParameters)
+            while put(('page', page)):
+                if 'next' not in page.get('pages', {}):
+                    put(('done', None))
+                    return
+                if stop.is_set():
+                    return
+                """ The 'next' field provides a full URL of the next page """
+                page = self.getPureUrlRequest(page['pages']['next'])
+        except Exception:
+            put(('error', sys.exc_info()))
+
+
+    def _streamChain(self, endpoint, uriParameters, itemKey, queue, stop, itemType=None, batchSize=500):
+        """ Streams items of a page and all its 'next' pages into the queue in batches. """
+
+        put = self._chainPut(queue, stop)
+        if stop.is_set():
+            return
+        try:
+            result = self.getStreamRequest(endpoint, itemKey, uriParameters, itemType)
+            while True:
+                batch = []
+                for item in result:
+                    batch.append(item)
+                    if len(batch) == batchSize:
+                        if not put(('items', batch)):
+                            result.close()
+                            return
+                        batch = []
+                if not put(('items', batch)):
+                    return
+                pages = result.pages()
+                if 'next' not in pages:
+                    put(('done', None))
+                    return
+                if stop.is_set():
+                    return
+                result = self.getPureUrlStreamRequest(pages['next'], itemKey, itemType)
+        except Exception:
+            put(('error', sys.exc_info()))
+
+
+    def _chainPut(self, queue, stop):
+        """ Returns a function that puts into the queue until the consumer stops. """
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+        return put
+
+
+    def _uri(self, endpoint, uriParameters):
+        """ Returns the request URL of the endpoint, in JSON format and in the account group. """
+
+        uriParameters = dict(uriParameters)
         """ Request JSON format in return """
         uriParameters['format'] = 'json'
+        if self.accountGroupId is not None and 'aid' not in uriParameters:
+            uriParameters['aid'] = self.accountGroupId
 
-        uri = self.apiUri.strip('/') + '/' + endpoint.strip('/') + '?' + urllib.urlencode(uriParameters)
-        #print(uri)
+        return self.apiUri.strip('/') + '/' + endpoint.strip('/') + '?' + urllib.urlencode(uriParameters)
 
-        passwordManager = urllib2.HTTPPasswordMgrWithDefaultRealm()
-        passwordManager.add_password(None, self.apiUri, self.email, self.authToken)
-        handler = urllib2.HTTPBasicAuthHandler(passwordManager)
 
-        director = urllib2.build_opener(handler)
+    def _accountUri(self, uri):
+        """ Adds the account group to an API URL, such as a pagination URL, that has none. """
 
-        headers = { 'Content-Type': 'application/json'}
-        postData = json.dumps(properties)
+        if self.accountGroupId is None:
+            return uri
+        parsed = urlparse.urlsplit(uri)
+        if parsed.netloc != urlparse.urlsplit(self.apiUri).netloc:
+            return uri
+        if 'aid' in dict(urlparse.parse_qsl(parsed.query)):
+            return uri
+        query = (parsed.query + '&' if parsed.query else '') + urllib.urlencode({'aid': self.accountGroupId})
+        return urlparse.urlunsplit((parsed.scheme, parsed.netloc, parsed.path, query, parsed.fragment))
+
+
+    def _get(self, uri):
+        """ Serves a GET request, sharing the call with identical requests in flight. """
+
+        if self.singleFlight is None:
+            return self._cachedGet(uri)
+        return self.singleFlight.do((self.email, uri), lambda: self._cachedGet(uri))
+
+
+    def _cachedGet(self, uri):
+        """ Serves a GET request from the cache, or from the API if not cached or expired. """
+
+        if self.cache is None:
+            return self._request('GET', uri)
+        key = self.cache.key(uri, self.email)
+        ttl = self.cache.ttl(key)
+        if ttl <= 0:
+            return self._request('GET', uri)
+
+        entry = self.cache.get(key)
+        if entry is not None and time.time() - entry['stored'] < ttl:
+            self.cache._count('hits')
+            return json.loads(entry['body'])
+
+        """ Ask the API whether the expired entry is still valid """
+        headers = {}
+        if entry is not None and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry['lastModified']:
+            headers['If-Modified-Since'] = entry['lastModified']
 
-        req = urllib2.Request(uri, postData, headers)
+        result = self._open('GET', uri, None, headers)
+        data = self._read(result)
+        if 304 == result.code and entry is None:
+            """ Nothing cached to keep, ask again without conditions """
+            self._emit(result.record, len(data), None)
+            result = self._open('GET', uri)
+            data = self._read(result)
+            if 304 == result.code:
+                error = "API HTTP error: " + str(result.code) + " " + str(result.reason)
+                self._emit(result.record, None, None, error)
+                raise Exception(error)
+
+        etag = result.info().getheader('ETag')
+        lastModified = result.info().getheader('Last-Modified')
+        if 304 == result.code and entry is not None:
+            """ Not modified, keep the cached body and validators """
+            self.cache._count('revalidations')
+            data = entry['body']
+            etag = etag or entry['etag']
+            lastModified = lastModified or entry['lastModified']
+        else:
+            self.cache._count('misses')
+        self.cache.put(key, {'body': data, 'stored': time.time(), 'etag': etag, 'lastModified': lastModified})
+
+        return self._decode(result, data)
+
+
+    def _request(self, method, uri, body=None, headers={}):
+        """ Issues the API request over a pooled connection and returns JSON data. """
+
+        result = self._open(method, uri, body, headers)
+        return self._decode(result, self._read(result))
+
+
+    def _read(self, result):
+        """ Reads the whole body of the response. """
+
+        try:
+            return result.read()
+        except socket.error, e:
+            raise Exception("API URL error: " + str(e))
+        except httplib.HTTPException, e:
+            raise Exception("API HTTP exception: " + str(e))
+
+
+    def _decode(self, result, data):
+        """ Decodes the JSON body of the response and reports the request to the hooks. """
+
+        start = time.time()
+        """ Deletes are answered with 204 No Content """
+        value = json.loads(data) if data.strip() else None
+        self._emit(result.record, len(data), time.time() - start)
+        return value
+
+
+    def _openStream(self, uri):
+        """ Issues a GET request whose body is decoded as it is read, and reports it once read. """
+
+        result = self._open('GET', uri)
+        result.onClose = lambda response: self._emit(result.record, response.bytesRead, None)
+        return result
+
+
+    def _emit(self, record, bodyBytes, decodeSeconds, error=None):
+        """ Completes the request record and passes it to the hooks. """
+
+        if not self.hooks:
+            return
+        record = dict(record, bodyBytes=bodyBytes, decodeSeconds=decodeSeconds, error=error)
+        record['totalSeconds'] = time.time() - record.pop('start')
+        for hook in self.hooks:
+            hook(record)
+
+
+    def _open(self, method, uri, body=None, headers={}):
+        """ Issues the API request and returns the successful response with unread body. """
+
+        headers = dict(headers)
+        """
+        Credentials are only sent to the API host, never to any other host
+        that might appear in a pagination URL.
+        """
+        if urlparse.urlsplit(uri).netloc == urlparse.urlsplit(self.apiUri).netloc:
+            headers['Authorization'] = 'Basic ' + base64.b64encode(self.email + ':' + self.authToken)
 
         """
         The ThousandEyes API throttles inbound API requests using a 240 request
         per minute, per organization limit.
-        API request is encompassed with a for loop. If request returns a 429
-        response code (Too many requests), it is repeated 10 seconds later, up
-        to 10 times.
+        Every attempt waits for a slot from the rate limiter. If request returns
+        a 429 response code (Too many requests), or a 5xx code for a GET request,
+        the limiter is paused for the time the API asks for in the Retry-After
+        or rate limit reset headers, or for a jittered exponential backoff if
+        the headers are not present, and the request is retried.
         """
-        for n in range(0,10):
+        record = {'method': method, 'endpoint': urlparse.urlsplit(uri).path, 'status': None, 'retries': 0,
+                  'throttleSeconds': 0.0, 'connectSeconds': 0.0, 'ttfbSeconds': None, 'start': time.time()}
+        for attempt in range(0, self.maxRetries + 1):
+            record['retries'] = attempt
+            record['throttleSeconds'] += self.rateLimiter.acquire()
             try:
                 """ Issue the API request """
-                result = director.open(req)
-            except urllib2.HTTPError, e:
-                if 429 == e.code:
-                    """ Issuing too many requests. Sleep 10 seconds and retry. """
-                    time.sleep(10)
-                    continue
-                raise Exception("API HTTP error: " + str(e.code) + " " + str(e.reason))
-            except urllib2.URLError, e:
-                raise Exception("API URL error: " + str(e.reason))
+                result = self.connectionPool.urlopen(method, uri, body, headers)
+                record['connectSeconds'] += result.connectSeconds
+                record['ttfbSeconds'] = result.ttfbSeconds
+                record['status'] = result.code
+                if result.code >= 400:
+                    """ Consume the error body, so the connection can be reused """
+                    result.read()
+            except socket.error, e:
+                self._emit(record, None, None, "API URL error: " + str(e))
+                raise Exception("API URL error: " + str(e))
             except httplib.HTTPException, e:
-                raise Exception("API HTTP exception: " + str(e.reason))
+                self._emit(record, None, None, "API HTTP exception: " + str(e))
+                raise Exception("API HTTP exception: " + str(e))
             # result.read() will contain the data
             # result.info() will contain the HTTP headers
 
-            return json.loads(result.read())
+            retry = 429 == result.code or (method == 'GET' and result.code in self.retryCodes)
+            if retry and attempt < self.maxRetries:
+                """ Hold off all requests sharing the limiter, then retry. """
+                self.rateLimiter.pause(self._retryDelay(result.info(), attempt))
+                continue
+            if result.code >= 400:
+                """ We cannot handle other HTTP errors """
+                error = "API HTTP error: " + str(result.code) + " " + str(result.reason)
+                self._emit(record, None, None, error)
+                raise Exception(error)
+
+            """ Quota is used up, hold off further requests until it is reset. """
+            remaining = result.info().getheader('X-Organization-Rate-Limit-Remaining')
+            reset = result.info().getheader('X-Organization-Rate-Limit-Reset')
+            if remaining == '0' and reset and reset.strip().isdigit():
+                self.rateLimiter.pause(int(reset) - time.time())
+
+            result.record = record
+            return result
+
+
+    def _retryDelay(self, headers, attempt):
+        """ Returns the number of seconds to wait before retrying a request. """
+
+        now = time.time()
+        retryAfter = headers.getheader('Retry-After')
+        if retryAfter:
+            """ Retry-After is either a number of seconds or a HTTP date """
+            if retryAfter.strip().isdigit():
+                return int(retryAfter)
+            date = email.utils.parsedate_tz(retryAfter)
+            if date is not None:
+                return max(0, email.utils.mktime_tz(date) - now)
+
+        """ Rate limit reset time is provided as epoch """
+        reset = headers.getheader('X-Organization-Rate-Limit-Reset')
+        if reset and reset.strip().isdigit():
+            return max(0, int(reset) - now)
 
-        return
+        """ Full jitter exponential backoff """
+        return random.uniform(0, min(self.backoffCap, self.backoffBase * 2 ** attempt))
@@ -0,0 +1,212 @@
+#!/usr/bin/python
+
+from multiprocessing.pool import ThreadPool
+from teapi import ThousandEyesApi, ConnectionPool
+
+"""
+
+ AsyncThousandEyesApi class.
+
+"""
+
+class AsyncThousandEyesApi:
+    """
+    AsyncThousandEyesApi class provides the ThousandEyesApi request methods as
+    non-blocking calls. Each call is scheduled on a bounded pool of worker
+    threads and immediately returns an AsyncResult object. Call get() on the
+    result to wait for the API result object.
+
+    All requests go through a single ThousandEyesApi object, so they share
+    its connection pool, rate limiter, retries and pagination.
+
+    Attributes
+    ----------
+    email : str
+        ThousandEyes platform user account
+
+    authToken : str
+        ThousandEyes platform user API token
+
+    accountGroupId : str, optional
+        ThousandEyes platform account group ID, sent as the 'aid' parameter
+        of every request. If not set, user's default account group is used.
+
+    concurrency : int
+        Maximum number of requests in flight at the same time.
+
+    connectionPool : ConnectionPool, optional
+        Pool of keep-alive connections. If not set, a pool that allows
+        concurrency connections to the API host is created.
+
+    rateLimiter : RateLimiter, optional
+        Token bucket shared by all requests. Refer to ThousandEyesApi.
+
+    Methods
+    -------
+    getRequest(endpoint, uriParameters = {})
+        Schedules GET HTTP request to desired API endpoint
+    getPureUrlRequest(uri)
+        Schedules GET HTTP request to desired API URL
+    postRequest(endpoint, parameters, uriParameters = {}):
+        Schedules POST HTTP request to desired API endpoint
+    paginate(endpoint, uriParameters = {}, itemKey = None)
+        Schedules collection of all items of a paginated endpoint result
+    gatherTests(testIds, endpointTemplate, uriParameters = {}, itemKey = None)
+        Fetches the same endpoint for many tests concurrently
+    fanOutItems(endpoint, itemKey, uriParameters = {}, accountGroupIds = None)
+        Schedules collection of an endpoint's items in every account group
+    close()
+        Stops the worker threads once scheduled requests complete
+    """
+
+    def __init__(self, email, authToken, accountGroupId=None, concurrency=8, connectionPool=None,
+                 rateLimiter=None, maxRetries=10):
+
+        if connectionPool is None:
+            connectionPool = ConnectionPool(maxSize=concurrency, maxPerHost=concurrency)
+        self.api = ThousandEyesApi(email, authToken, accountGroupId, connectionPool, rateLimiter, maxRetries)
+        self.concurrency = concurrency
+        self._pool = ThreadPool(concurrency)
+
+
+    def getRequest(self, endpoint, uriParameters = {}):
+        """
+        Schedules GET HTTP request to desired API endpoint
+
+        Parameters
+        ----------
+        endpoint : str
+            ThousandEyes API endpoint URL, such as '/agents'.
+        uriParameters : dict
+            Dictionary of additional URL parameters, such as 'window'.
+
+        Returns
+        -------
+        AsyncResult
+            Result of ThousandEyesApi.getRequest, available through get().
+        """
+
+        return self._pool.apply_async(self.api.getRequest, (endpoint, dict(uriParameters)))
+
+
+    def getPureUrlRequest(self, uri):
+        """
+        Schedules GET HTTP request to desired API URL. Use for pagination
+
+        Parameters
+        ----------
+        uri : str
+            ThousandEyes API endpoint URL
+
+        Returns
+        -------
+        AsyncResult
+            Result of ThousandEyesApi.getPureUrlRequest, available through get().
+        """
+
+        return self._pool.apply_async(self.api.getPureUrlRequest, (uri,))
+
+
+    def postRequest(self, endpoint, properties, uriParameters = {}):
+        """
+        Schedules POST HTTP request to desired API endpoint
+
+        Parameters
+        ----------
+        endpoint : str
+            ThousandEyes API endpoint URL, such as '/tests/http-server/new'.
+        properties : dict
+            ThousandEyes API endpoint properties that will be sent as POST payload.
+        uriParameters : dict
+            Dictionary of additional URL parameters.
+
+        Returns
+        -------
+        AsyncResult
+            Result of ThousandEyesApi.postRequest, available through get().
+        """
+
+        return self._pool.apply_async(self.api.postRequest, (endpoint, properties, dict(uriParameters)))
+
+
+    def paginate(self, endpoint, uriParameters = {}, itemKey=None):
+        """
+        Schedules collection of all pages of an API endpoint result
+
+        Parameters
+        ----------
+        endpoint : str
+            ThousandEyes API endpoint URL, such as '/dns/trace/1234'.
+        uriParameters : dict
+            Dictionary of additional URL parameters, such as 'window'.
+        itemKey : str, optional
+            Dot separated path of the list of items in each page. If not set,
+            whole pages are collected.
+
+        Returns
+        -------
+        AsyncResult
+            List of items, or pages, of all result pages, available through get().
+        """
+
+        def collect():
+            return list(self.api.paginate(endpoint, uriParameters, itemKey))
+        return self._pool.apply_async(collect)
+
+
+    def fanOutItems(self, endpoint, itemKey, uriParameters = {}, accountGroupIds=None):
+        """
+        Schedules collection of the items of an endpoint in every account
+        group, tagged with 'aid' and 'accountGroupName'. Refer to
+        ThousandEyesApi.fanOutItems.
+
+        Returns
+        -------
+        AsyncResult
+            List of items of all account groups, available through get().
+        """
+
+        return self._pool.apply_async(self.api.fanOutItems, (endpoint, itemKey, uriParameters, accountGroupIds))
+
+
+    def gatherTests(self, testIds, endpointTemplate, uriParameters = {}, itemKey=None):
+        """
+        Fetches the same endpoint for many tests concurrently and waits for
+        all of them to complete
+
+        Parameters
+        ----------
+        testIds : list
+            List of test IDs.
+        endpointTemplate : str
+            Endpoint URL with a placeholder for the test ID, such as
+            '/net/metrics/{testId}' or '/dns/trace/{}'.
+        uriParameters : dict
+            Dictionary of additional URL parameters, used for every test.
+        itemKey : str, optional
+            If set, all pages of each test result are fetched and the items of
+            the itemKey list are collected. Refer to paginate.
+
+        Returns
+        -------
+        list
+            Results in the same order as testIds.
+        """
+
+        results = []
+        for testId in testIds:
+            endpoint = endpointTemplate.format(testId, testId=testId)
+            if itemKey is None:
+                results.append(self.getRequest(endpoint, uriParameters))
+            else:
+                results.append(self.paginate(endpoint, uriParameters, itemKey))
+        return [result.get() for result in results]
+
+
+    def close(self):
+        """
+        Stops the worker threads once scheduled requests complete
+        """
+
+        self._pool.close()
+        self._pool.join()
@@ -0,0 +1,1559 @@
+#!/usr/bin/python
+import sys
+import os
+import time
+import calendar
+""" Imported up front, as the first time.strptime call is not thread safe on Python 2 """
+import _strptime
+import math
+import csv
+import json
+import array
+import itertools
+import ctypes
+import multiprocessing
+import threading
+from multiprocessing.pool import ThreadPool
+from terecords import DnsServer
+
+"""
+
+ DNS trace processing functions used by api-processDNSTrace.py.
+
+"""
+
+def loadTestData(api, testId, uriParameters, showProgress=True, itemType=None, recordTypes=None, test=None):
+    """
+    Get the test data from the API for the test ID and given parameters.
+    The time window is split into days that are fetched in parallel, and
+    the next page of each day is fetched while the current one is processed.
+
+    Parameters
+    ----------
+    api : ThousandEyesApi
+        API object used for the requests
+    testId : str
+        DNS trace test ID
+    uriParameters : dict
+        Dictionary of URL parameters, such as 'window' or 'from' and 'to'
+    showProgress : bool
+        Print a dot for every page received
+    itemType : type, optional
+        Record type the traces are kept as, such as terecords.DnsTrace, to
+        hold long time windows in less memory. If not set, traces are
+        dictionaries.
+    recordTypes : list, optional
+        DNS record types the test may query, such as ['A', 'AAAA']. If not
+        set, tests of any record type are accepted.
+    test : dict, optional
+        Dictionary that receives the test element of the response, with
+        the 'domain' and 'type' of the test
+
+    Return
+    ------
+    traces : list
+        List of trace elements from the API response
+    """
+    return list(iterTestData(api, testId, uriParameters, showProgress, itemType, recordTypes, test))
+
+def iterTestData(api, testId, uriParameters, showProgress=True, itemType=None, recordTypes=None, test=None):
+    """
+    Same as loadTestData, but yields the traces in chronological order as
+    the pages arrive, so they can be processed without holding the whole
+    time window in memory.
+
+    Return
+    ------
+    generator
+        Trace elements from the API response
+    """
+    for testData in api.paginate('/dns/trace/' + str(testId) + '.json', uriParameters, windowSplit=24 * 60 * 60):
+        """ Check if we have a DNS trace test on our hands otherwise we exit. """
+        if not (testData['dns']['test']['type'] == 'dns-trace'):
+            raise Exception('This example requires a DNS trace test.')
+        """
+        Check the record type if only some are accepted. The domain field
+        specifies domain under test and record type, such as 'example.com A'.
+        """
+        if recordTypes is not None and testRecordType(testData['dns']['test']) not in recordTypes:
+            raise Exception('Test ' + str(testId) + ' is not a DNS trace test for ' + ', '.join(recordTypes) +
+                            ' records.')
+        if test is not None and not test:
+            test.update(testData['dns']['test'])
+
+        """ Show progress. """
+        if showProgress:
+            sys.stdout.write('.')
+            sys.stdout.flush()
+
+        """ Yield all traces for the test in the time window. """
+        for trace in testData['dns']['trace']:
+            yield trace if itemType is None else itemType.fromDict(trace)
+    if showProgress:
+        print '\n'
+
+def iterServerData(api, testId, uriParameters, itemType=None):
+    """
+    Yields the DNS server results of a test in chronological order, as the
+    pages arrive
+
+    Parameters
+    ----------
+    api : ThousandEyesApi
+        API object used for the requests
+    testId : str
+        DNS server test ID
+    uriParameters : dict
+        Dictionary of URL parameters, such as 'window' or 'from' and 'to'
+    itemType : type, optional
+        Record type of the results, such as terecords.DnsServer
+
+    Return
+    ------
+    generator
+        Server result elements from the API response
+    """
+    for testData in api.paginate('/dns/server/' + str(testId) + '.json', uriParameters, windowSplit=24 * 60 * 60):
+        if not (testData['dns']['test']['type'] == 'dns-server'):
+            raise Exception('Test ' + str(testId) + ' is not a DNS server test.')
+        for result in testData['dns']['server']:
+            yield result if itemType is None else itemType.fromDict(result)
+
+def testRecordType(test):
+    """ Returns the record type of a DNS test element, such as 'AAAA', from its domain field. """
+    return test.get('domain', '').rsplit(' ', 1)[-1].upper()
+
+def processTests(api, testIds, uriParameters, startWindowTimeEpoch, timePeriodSec, workers=8, recordTypes=None):
+    """
+        Fetches and processes the traces of many DNS trace tests in one run.
+        Tests are fetched concurrently and share the connections and rate
+        limit of the API object. The traces of a test are aggregated as soon
+        as they are fetched and then dropped, so at most one time window of
+        traces per worker is held in memory.
+
+        Parameters
+        ----------
+        api : ThousandEyesApi
+            API object used for the requests
+        testIds : list
+            DNS trace test IDs
+        uriParameters : dict
+            Dictionary of URL parameters, such as 'window' or 'from' and 'to'
+        startWindowTimeEpoch : int
+            Start of the time window in epoch
+        timePeriodSec : int
+            Length of the aggregation time period in seconds
+        workers : int
+            Maximum number of tests fetched at the same time
+        recordTypes : list, optional
+            DNS record types the tests may query. If not set, any.
+
+        Return
+        ------
+        results : list
+            Dictionary per test, in test ID order, with 'testId', 'domain',
+            'data' (map of mappings by agent and time period, as returned by
+            processTraces) and 'error' (message if the test failed, else None)
+    """
+    def process(testId):
+        test = {}
+        try:
+            traces = iterTestData(api, testId, uriParameters, False, None, recordTypes, test)
+            data = processTracesBatch(list(traces), startWindowTimeEpoch, timePeriodSec)
+            return {'testId': testId, 'domain': test.get('domain'), 'data': data, 'error': None}
+        except Exception, e:
+            return {'testId': testId, 'domain': test.get('domain'), 'data': {}, 'error': str(e)}
+
+    if not testIds:
+        return []
+    pool = ThreadPool(max(1, min(workers, len(testIds))))
+    try:
+        return pool.map(process, testIds)
+    finally:
+        pool.close()
+
+def testRows(results, grid, longFormat=False):
+    """
+        Generates the rows of a combined CSV of many tests, as returned by
+        processTests. The rows of wideRows or longRows of every test are
+        prefixed with the test ID and domain, under a single header.
+        Failed tests are left out.
+
+        Parameters
+        ----------
+        results : list
+            Test results, refer to processTests
+        grid : list
+            Start epoch of every time period, refer to periodGrid
+        longFormat : bool
+            Use the long format rows
+
+        Return
+        ------
+        generator
+            CSV rows
+    """
+    rowsFunction = longRows if longFormat else wideRows
+    header = rowsFunction({}, grid).next()
+    yield ['Test ID', 'Domain'] + (header if longFormat else ['Agent'] + header[1:])
+    for result in results:
+        if result['error'] is not None:
+            continue
+        for row in itertools.islice(rowsFunction(result['data'], grid), 1, None):
+            yield [result['testId'], result['domain']] + row
+
+def processTraces(traces, startWindowTimeEpoch, timePeriodSec):
+    """
+        Processes the trace elements from the test results in the time
+        window.
+        Go over the traces and split them into a new multi dimensional map where:
+        -agentName defines the key for map of agents.
+        -timeperiod defines the the key for a map containing list of mappings.
+        -mappings list will contain all the mappings received by the agent in the
+            traces that fall into a time period.
+
+        Time period is calculated in the following way:
+        (traceEpoch - startWindowTimeEpoch) / timeWindowSec
+
+        Parameters
+        ----------
+        traces : list
+            List of trace elements from the API response
+        startWindowTimeEpoch : int
+            Start of the time window in epoch
+        timePeriodSec : int
+            Length of the aggregation time period in seconds
+
+        Return
+        -------
+        data : map
+            Map of DNS trace mappings split by agent and time period
+    """
+    """ Create a data map which holds the aggregated trace data. """
+    data = {}
+
+    for trace in traces:
+
+        """ Get the date from the trace date/time in epoch. """
+        traceEpoch = calendar.timegm(time.strptime (trace['date'], '%Y-%m-%d %H:%M:%S'))
+
+        """ Calculated time period ID. """
+        timePeriodId = (traceEpoch - startWindowTimeEpoch) / timePeriodSec
+        if timePeriodId == -1:
+            """
+            Because the API returns all the rounds that are within the window, we
+            can possiblly get a round which is before our calculated window.
+            In this case we get a -1 time period ID, which we add to the first
+            period (timePeriodId = 0) for simplification.
+            """
+            timePeriodId = 0
+        """
+        Check if the agent is in the data map already and add an empty list
+        for the key if not.
+        """
+        if trace['agentName'] not in data.keys():
+            data[trace['agentName']] = {}
+        """
+        Check if the time period exists for the agent and add the current
+        mapping into a map for the period. It's a simple way to avoid duplication
+        of the mappings and avoid a flood of data if we specify larger time
+        windows.
+        """
+        if timePeriodId not in data[trace['agentName']].keys():
+            data[trace['agentName']][timePeriodId] = {}
+        """ If a trace fails, we get an errorDetails field in the JSON. """
+        if not 'errorDetails' in trace.keys():
+            data[trace['agentName']][timePeriodId][trace['mappings']] = ''
+        else:
+            """ To make it clear there was an error lets put a key in the map. """
+            data[trace['agentName']][timePeriodId]['ERROR'] = ''
+    return data
+
+def processTracesBatch(traces, startWindowTimeEpoch, timePeriodSec):
+    """
+        Batched version of processTraces with the same output, for large
+        trace lists.
+
+        Instead of handling one trace at a time, each step is done for the
+        whole list: every distinct date string is parsed only once (all agents
+        of a round share the date), time period IDs are computed in a single
+        pass, and the (agent, time period, mapping) triples are deduplicated
+        with a set before the nested map is built from the distinct triples.
+
+        Parameters
+        ----------
+        traces : list
+            List of trace elements from the API response
+        startWindowTimeEpoch : int
+            Start of the time window in epoch
+        timePeriodSec : int
+            Length of the aggregation time period in seconds
+
+        Return
+        -------
+        data : map
+            Map of DNS trace mappings split by agent and time period
+    """
+    dates = [trace['date'] for trace in traces]
+    epochs = {}
+    for date in set(dates):
+        epochs[date] = calendar.timegm(time.strptime(date, '%Y-%m-%d %H:%M:%S'))
+    """ Period ID of every distinct date, -1 is added to the first period as in processTraces """
+    periods = {}
+    for date, traceEpoch in epochs.items():
+        timePeriodId = (traceEpoch - startWindowTimeEpoch) / timePeriodSec
+        periods[date] = 0 if timePeriodId == -1 else timePeriodId
+
+    agents = [trace['agentName'] for trace in traces]
+    mappings = ['ERROR' if 'errorDetails' in trace else trace['mappings'] for trace in traces]
+    return _buildData(set(zip(agents, map(periods.__getitem__, dates), mappings)))
+
+def processColumns(columns, startWindowTimeEpoch, timePeriodSec):
+    """
+        Processes traces kept in a TraceStore, with the same output as
+        processTraces. Works directly on the integer encoded columns and only
+        decodes the distinct (agent, time period, mapping) triples.
+
+        Parameters
+        ----------
+        columns : dict
+            Columns of a test partition, refer to TraceStore.columns
+        startWindowTimeEpoch : int
+            Start of the time window in epoch
+        timePeriodSec : int
+            Length of the aggregation time period in seconds
+
+        Return
+        -------
+        data : map
+            Map of DNS trace mappings split by agent and time period
+    """
+    periods = [(traceEpoch - startWindowTimeEpoch) / timePeriodSec for traceEpoch in columns['date']]
+    periods = [0 if timePeriodId == -1 else timePeriodId for timePeriodId in periods]
+    """ Errors get code -1, which decodes to ERROR """
+    mappingCodes = [-1 if error else code for code, error in zip(columns['mappings'], columns['error'])]
+    triples = set(zip(columns['agent'], periods, mappingCodes))
+
+    agents = columns['agentDictionary']
+    mappings = columns['mappingsDictionary'] + ['ERROR']
+    return _buildData((agents[agent], timePeriodId, mappings[mapping]) for agent, timePeriodId, mapping in triples)
+
+def _buildData(triples):
+    """ Builds the processTraces map from distinct (agent, time period, mapping) triples. """
+    data = {}
+    for agent, timePeriodId, mapping in triples:
+        data.setdefault(agent, {}).setdefault(timePeriodId, {})[mapping] = ''
+    return data
+
+def processTracesParallel(traces, startWindowTimeEpoch, timePeriodSec, workers=4):
+    """
+        Parallel version of processTraces with the same output, for trace
+        lists too large for a single core.
+
+        The list is split into one range of traces per worker and each range
+        is aggregated by processTracesBatch in a worker process. Workers are
+        forked with the list, so no trace is pickled, and only return the
+        map of their range. The partial maps are merged by union of the
+        mappings of every agent and time period, which gives the same map
+        whatever the order the workers finish in. Where processes cannot be
+        forked, the traces are aggregated in this process.
+
+        Parameters
+        ----------
+        traces : list
+            List of trace elements from the API response
+        startWindowTimeEpoch : int
+            Start of the time window in epoch
+        timePeriodSec : int
+            Length of the aggregation time period in seconds
+        workers : int
+            Number of worker processes
+
+        Return
+        -------
+        data : map
+            Map of DNS trace mappings split by agent and time period
+    """
+    if workers <= 1 or len(traces) < workers or not hasattr(os, 'fork'):
+        return processTracesBatch(traces, startWindowTimeEpoch, timePeriodSec)
+    return _aggregateShards(traces, len(traces), startWindowTimeEpoch, timePeriodSec, workers)
+
+def processColumnsParallel(columns, startWindowTimeEpoch, timePeriodSec, workers=4):
+    """
+        Parallel version of processColumns with the same output.
+
+        The columns are copied once into shared memory and every worker
+        process aggregates its range of rows straight from it, so no trace
+        is pickled. The partial maps are merged as in processTracesParallel.
+
+        Parameters
+        ----------
+        columns : dict
+            Columns of a test partition, refer to TraceStore.columns
+        startWindowTimeEpoch : int
+            Start of the time window in epoch
+        timePeriodSec : int
+            Length of the aggregation time period in seconds
+        workers : int
+            Number of worker processes
+
+        Return
+        -------
+        data : map
+            Map of DNS trace mappings split by agent and time period
+    """
+    rows = len(columns['date'])
+    if workers <= 1 or rows < workers:
+        return processColumns(columns, startWindowTimeEpoch, timePeriodSec)
+
+    shared = {'agentDictionary': columns['agentDictionary'], 'mappingsDictionary': columns['mappingsDictionary']}
+    for name in ('date', 'agent', 'mappings', 'error'):
+        column = columns[name]
+        raw = multiprocessing.RawArray(column.typecode, len(column))
+        ctypes.memmove(raw, column.buffer_info()[0], len(column) * column.itemsize)
+        shared[name] = (column.typecode, raw)
+    return _aggregateShards(shared, rows, startWindowTimeEpoch, timePeriodSec, workers)
+
+def _aggregateShards(source, rows, startWindowTimeEpoch, timePeriodSec, workers):
+    """ Aggregates equal row ranges of the source in worker processes and merges the maps. """
+    boundaries = [rows * shard // workers for shard in range(0, workers + 1)]
+    pool = multiprocessing.Pool(workers, _initShards, (source, startWindowTimeEpoch, timePeriodSec))
+    try:
+        partials = pool.map(_aggregateShard, zip(boundaries[:-1], boundaries[1:]))
+    finally:
+        pool.close()
+        pool.join()
+
+    data = {}
+    for partial in partials:
+        for agent, periods in partial.iteritems():
+            agentPeriods = data.setdefault(agent, {})
+            for timePeriodId, mappings in periods.iteritems():
+                agentPeriods.setdefault(timePeriodId, {}).update(mappings)
+    return data
+
+""" Source and parameters of a worker process, inherited when it is forked """
+_shards = None
+
+def _initShards(source, startWindowTimeEpoch, timePeriodSec):
+    global _shards
+    _shards = (source, startWindowTimeEpoch, timePeriodSec)
+
+def _aggregateShard(shard):
+    """ Aggregates the (begin, end) row range of the trace list or of the shared columns. """
+    source, startWindowTimeEpoch, timePeriodSec = _shards
+    begin, end = shard
+    if isinstance(source, list):
+        return processTracesBatch(source[begin:end], startWindowTimeEpoch, timePeriodSec)
+    columns = {}
+    for name in ('date', 'agent', 'mappings', 'error'):
+        typecode, raw = source[name]
+        column = columns[name] = array.array(typecode)
+        column.fromstring(buffer(raw, begin * column.itemsize, (end - begin) * column.itemsize))
+    columns['agentDictionary'] = source['agentDictionary']
+    columns['mappingsDictionary'] = source['mappingsDictionary']
+    return processColumns(columns, startWindowTimeEpoch, timePeriodSec)
+
+def periodGrid(startWindowTimeEpoch, endWindowTimeEpoch, timePeriodSec):
+    """
+        Returns the start epoch of every time period of the time window,
+        indexed by time period ID, as in processTraces.
+
+        Parameters
+        ----------
+        startWindowTimeEpoch : int
+            Start of the time window in epoch
+        endWindowTimeEpoch : int
+            End of the time window in epoch
+        timePeriodSec : int
+            Length of the aggregation time period in seconds
+
+        Return
+        ------
+        grid : list
+            Start epoch of every time period
+    """
+    periodCount = max(1, -(-(endWindowTimeEpoch - startWindowTimeEpoch) // timePeriodSec))
+    return [startWindowTimeEpoch + timePeriodId * timePeriodSec for timePeriodId in range(0, periodCount)]
+
+def wideRows(data, grid):
+    """
+        Generates the rows of the wide CSV format: a header with the start of
+        every time period of the grid, then a row per agent, in agent name
+        order, with the semicolon separated mappings of every time period.
+        Time periods without traces are empty, time periods outside the grid
+        are left out. Each row is built when it is requested, so only one row
+        is held in memory besides the data.
+
+        Parameters
+        ----------
+        data : map or iterable
+            Map of mappings by agent and time period, as returned by
+            processTraces, or an iterable of (agent, {timePeriodId: mappings})
+            tuples, such as a generator yielding each agent once complete
+        grid : list
+            Start epoch of every time period, refer to periodGrid
+
+        Return
+        ------
+        generator
+            CSV rows
+    """
+    yield [''] + [time.strftime('%x %X', time.gmtime(periodStart)) for periodStart in grid]
+    agents = sorted(data.items()) if isinstance(data, dict) else data
+    for agent, periods in agents:
+        row = [agent] + [''] * len(grid)
+        for timePeriodId, mappings in periods.items():
+            if 0 <= timePeriodId < len(grid):
+                row[timePeriodId + 1] = ';'.join(sorted(mappings))
+        yield row
+
+def longRows(data, grid):
+    """
+        Generates the rows of the long CSV format: one (agent, time period
+        start, mapping) row per mapping, in agent and time period order.
+        Suits very wide time windows, where the wide format has too many
+        columns.
+
+        Parameters
+        ----------
+        data : map or iterable
+            Refer to wideRows
+        grid : list
+            Start epoch of every time period, refer to periodGrid
+
+        Return
+        ------
+        generator
+            CSV rows
+    """
+    yield ['Agent', 'Period Start', 'Mapping']
+    agents = sorted(data.items()) if isinstance(data, dict) else data
+    for agent, periods in agents:
+        for timePeriodId in sorted(periods):
+            if 0 <= timePeriodId < len(grid):
+                periodStart = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(grid[timePeriodId]))
+                for mapping in sorted(periods[timePeriodId]):
+                    yield [agent, periodStart, mapping]
+
+def streamLongRows(traces, startWindowTimeEpoch, endWindowTimeEpoch, timePeriodSec):
+    """
+        Generates the rows of the long CSV format straight from traces in
+        chronological order, as yielded by the paginator. The rows of a time
+        period are generated as soon as a trace of a later time period
+        arrives, so only the mappings of the current time period are held in
+        memory. A trace older than the current time period still gets its
+        row, after the rows of the time periods already generated.
+
+        Parameters
+        ----------
+        traces : iterable
+            Trace elements in chronological order
+        startWindowTimeEpoch : int
+            Start of the time window in epoch
+        endWindowTimeEpoch : int
+            End of the time window in epoch
+        timePeriodSec : int
+            Length of the aggregation time period in seconds
+
+        Return
+        ------
+        generator
+            CSV rows
+    """
+    grid = periodGrid(startWindowTimeEpoch, endWindowTimeEpoch, timePeriodSec)
+    yield ['Agent', 'Period Start', 'Mapping']
+    epochs = {}
+    current = None
+    pending = set()
+    for trace in traces:
+        date = trace['date']
+        traceEpoch = epochs.get(date)
+        if traceEpoch is None:
+            """ A round shares the date, only the dates of the current period are kept """
+            if len(epochs) > 1024:
+                epochs.clear()
+            traceEpoch = epochs[date] = calendar.timegm(time.strptime(date, '%Y-%m-%d %H:%M:%S'))
+        timePeriodId = (traceEpoch - startWindowTimeEpoch) / timePeriodSec
+        timePeriodId = 0 if timePeriodId == -1 else timePeriodId
+        if not 0 <= timePeriodId < len(grid):
+            continue
+        if current is not None and timePeriodId > current:
+            for row in _periodRows(pending, grid[current]):
+                yield row
+            pending = set()
+        if current is None or timePeriodId >= current:
+            current = timePeriodId
+            pending.add((trace['agentName'], 'ERROR' if 'errorDetails' in trace else trace['mappings']))
+        else:
+            for row in _periodRows([(trace['agentName'], 'ERROR' if 'errorDetails' in trace else trace['mappings'])],
+                                   grid[timePeriodId]):
+                yield row
+    if current is not None:
+        for row in _periodRows(pending, grid[current]):
+            yield row
+
+def _periodRows(pairs, periodStart):
+    """ Returns the long format rows of the (agent, mapping) pairs of a time period. """
+    periodStart = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(periodStart))
+    return [[agent, periodStart, mapping] for agent, mapping in sorted(pairs)]
+
+def writeCSV(fName, rows):
+    """
+        Writes CSV rows to a file as they are generated
+
+        Parameters
+        ----------
+        fName : String
+            File name of CSV to be generated.
+        rows : iterable
+            CSV rows, such as from wideRows, longRows or streamLongRows
+
+        Return
+        ------
+        count : int
+            Number of rows written, including the header
+    """
+    f = open(fName, 'wb')
+    try:
+        csvWriter = csv.writer(f)
+        count = 0
+        for row in rows:
+            csvWriter.writerow([value.encode('utf-8') if isinstance(value, unicode) else value for value in row])
+            count += 1
+        return count
+    finally:
+        f.close()
+
+def generateCSV(fName, data, startWindowTimeEpoch, timePeriodSec, endWindowTimeEpoch=None, longFormat=False):
+
+    """
+        Build the output CSV file.
+        Agents are listed in first column.
+        Each time period for each agent has column as well.
+        Each cell gets the mappings for a particular time period.
+
+        The columns are the full grid of time periods of the time window,
+        the same for every agent, and rows are written one agent at a time.
+
+        Parameters
+        ----------
+        fName : String
+            File name of CSV to be generated.
+        data : map
+            Map containing trace data to be written to the file
+        startWindowTimeEpoch : int
+            Start of the time window in epoch
+        timePeriodSec : int
+            Length of the aggregation time period in seconds
+        endWindowTimeEpoch : int, optional
+            End of the time window in epoch (Default current time)
+        longFormat : bool
+            Write one (agent, time period, mapping) row per mapping instead
+
+        Return
+        ------
+        null
+
+    """
+
+    if endWindowTimeEpoch is None:
+        endWindowTimeEpoch = calendar.timegm(time.gmtime())
+    grid = periodGrid(startWindowTimeEpoch, endWindowTimeEpoch, timePeriodSec)
+    if longFormat:
+        writeCSV(fName, longRows(data, grid))
+    else:
+        """ The first line names the output, as before """
+        writeCSV(fName, itertools.chain([['Output']], wideRows(data, grid)))
+
+
+"""
+
+ MappingChangeDetector class.
+
+"""
+
+class MappingChangeDetector:
+    """
+    MappingChangeDetector class follows the mapping every agent gets, one
+    trace at a time, and reports when it changes. It suits tracking geo load
+    balancing over time: traces are consumed as the paginator yields them,
+    in a single pass, and memory only grows with the number of agents and
+    of distinct mappings.
+
+    Mappings are kept as integer IDs of a shared mapping table. Per agent,
+    the current mapping, its start, the number of observations, changes and
+    errors, and the count of each mapping are kept.
+
+    Failed traces do not change the current mapping, they are counted as
+    errors. Traces of a round that is not newer than the last one seen for
+    the agent are ignored, so overlapping fetches can be fed again.
+
+    Attributes
+    ----------
+    mappings : list
+        Mapping table, indexed by mapping ID
+    lastEpoch : int
+        Epoch of the latest trace added, to resume fetching from
+
+    Methods
+    -------
+    add(trace)
+        Adds a trace and returns the change event, or None
+    process(traces)
+        Adds the traces and yields the change events
+    stats()
+        Returns the summary statistics of every agent
+    """
+
+    """ Positions in the per agent state list """
+    CURRENT, SINCE, FIRST, LAST, ROUND, OBSERVATIONS, CHANGES, ERRORS, COUNTS = range(0, 9)
+
+    def __init__(self):
+
+        self.mappings = []
+        self._mappingIds = {}
+        self._agents = {}
+        self._epochs = {}
+        self.lastEpoch = None
+
+
+    def add(self, trace):
+        """
+        Adds a trace
+
+        Parameters
+        ----------
+        trace : dict
+            Trace element, such as yielded by iterTestData
+
+        Return
+        ------
+        event : dict
+            Change event with 'agent', 'from' and 'to' mappings, 'date' and
+            'epoch' of the first trace with the new mapping, and 'since', the
+            epoch the previous mapping was first seen. None if the mapping
+            did not change.
+        """
+        date = trace['date']
+        traceEpoch = self._epochs.get(date)
+        if traceEpoch is None:
+            """ A round shares the date, only recent dates are kept """
+            if len(self._epochs) > 1024:
+                self._epochs.clear()
+            traceEpoch = self._epochs[date] = calendar.timegm(time.strptime(date, '%Y-%m-%d %H:%M:%S'))
+        roundId = trace.get('roundId', traceEpoch)
+        if self.lastEpoch is None or traceEpoch > self.lastEpoch:
+            self.lastEpoch = traceEpoch
+
+        agent = trace['agentName']
+        state = self._agents.get(agent)
+        if state is None:
+            state = self._agents[agent] = [None, traceEpoch, traceEpoch, traceEpoch, None, 0, 0, 0, {}]
+        elif state[self.ROUND] is not None and roundId <= state[self.ROUND]:
+            return None
+        state[self.ROUND] = roundId
+        state[self.LAST] = traceEpoch
+
+        if 'errorDetails' in trace:
+            state[self.ERRORS] += 1
+            return None
+
+        mapping = trace['mappings']
+        mappingId = self._mappingIds.get(mapping)
+        if mappingId is None:
+            mappingId = self._mappingIds[mapping] = len(self.mappings)
+            self.mappings.append(mapping)
+        state[self.OBSERVATIONS] += 1
+        counts = state[self.COUNTS]
+        counts[mappingId] = counts.get(mappingId, 0) + 1
+
+        previous = state[self.CURRENT]
+        if previous == mappingId:
+            return None
+        state[self.CURRENT] = mappingId
+        since = state[self.SINCE]
+        state[self.SINCE] = traceEpoch
+        if previous is None:
+            return None
+        state[self.CHANGES] += 1
+        return {'agent': agent, 'from': self.mappings[previous], 'to': mapping, 'date': date,
+                'epoch': traceEpoch, 'since': since}
+
+
+    def process(self, traces):
+        """
+        Adds the traces and yields the change events as they occur
+
+        Parameters
+        ----------
+        traces : iterable
+            Trace elements in chronological order
+
+        Return
+        ------
+        generator
+            Change events, refer to add
+        """
+        for trace in traces:
+            event = self.add(trace)
+            if event is not None:
+                yield event
+
+
+    def stats(self):
+        """
+        Returns the summary statistics of every agent
+
+        Return
+        ------
+        stats : dict
+            Dictionary by agent name of dictionaries with 'current' mapping,
+            'observations' (successful traces), 'errors', 'changes',
+            'flipRate' (changes per successive pair of observations),
+            'flipsPerHour', 'mappings' (number of distinct mappings) and
+            'entropy' (Shannon entropy of the mapping distribution in bits,
+            0 for an agent that always gets the same mapping)
+        """
+        stats = {}
+        for agent, state in self._agents.items():
+            observations = state[self.OBSERVATIONS]
+            hours = (state[self.LAST] - state[self.FIRST]) / 3600.0
+            entropy = 0.0
+            for count in state[self.COUNTS].values():
+                share = float(count) / observations
+                entropy -= share * math.log(share, 2)
+            stats[agent] = {
+                'current': self.mappings[state[self.CURRENT]] if state[self.CURRENT] is not None else None,
+                'observations': observations,
+                'errors': state[self.ERRORS],
+                'changes': state[self.CHANGES],
+                'flipRate': float(state[self.CHANGES]) / (observations - 1) if observations > 1 else 0.0,
+                'flipsPerHour': state[self.CHANGES] / hours if hours > 0 else 0.0,
+                'mappings': len(state[self.COUNTS]),
+                'entropy': abs(entropy),
+            }
+        return stats
+
+
+"""
+
+ ServerAvailability class.
+
+"""
+
+class ServerAvailability:
+    """
+    ServerAvailability class keeps the availability of DNS servers as
+    counters of queries and successful queries per test, agent, server and
+    time bucket, hourly and daily. Counters are updated with the rounds
+    since the previous update instead of being recomputed, and can be kept
+    in a state file between runs.
+
+    A query is successful when its result has a resolution time. Only
+    complete rounds are counted: a round is complete once results of a
+    later round arrive, or once it is older than settleSeconds. Rounds in
+    progress are left for the next update.
+
+    Attributes
+    ----------
+    stateFile : str, optional
+        JSON file the counters are kept in
+    settleSeconds : int
+        Age after which the newest round is taken as complete
+    hourlyRetention : int
+        Seconds hourly counters are kept for, daily counters are kept
+        forever
+    lastRound : dict
+        Newest counted round ID by test ID
+
+    Methods
+    -------
+    add(testId, results, now = None)
+        Counts the complete rounds of server results of a test
+    update(api, testIds, timeWindowSec = 86400, workers = 4)
+        Fetches and counts the rounds of the tests since the previous update
+    query(testId = None, agentName = None, server = None, start = None, end = None, resolution = 'hourly', groupBy = ...)
+        Returns the availability per time bucket
+    save()
+        Writes the counters to the state file
+    """
+
+    """ Bucket length in seconds of every resolution """
+    resolutions = {'hourly': 3600, 'daily': 86400}
+    dimensions = ('testId', 'agentName', 'server')
+
+    def __init__(self, stateFile=None, settleSeconds=600, hourlyRetention=31 * 86400):
+
+        self.stateFile = stateFile
+        self.settleSeconds = settleSeconds
+        self.hourlyRetention = hourlyRetention
+        self.lastRound = {}
+        """ (testId, agentName, server, bucket start) -> [queries, successful] per resolution """
+        self._counters = dict((resolution, {}) for resolution in self.resolutions)
+        self._lock = threading.Lock()
+
+        if stateFile is not None and os.path.exists(stateFile):
+            f = open(stateFile)
+            try:
+                state = json.load(f)
+            finally:
+                f.close()
+            self.lastRound = state['lastRound']
+            for resolution in self.resolutions:
+                for testId, agentName, server, bucket, queries, successful in state[resolution]:
+                    self._counters[resolution][(testId, agentName, server, bucket)] = [queries, successful]
+
+
+    def add(self, testId, results, now=None):
+        """
+        Counts the complete rounds of DNS server results of a test. Rounds
+        that were counted before are skipped.
+
+        Parameters
+        ----------
+        testId : str
+            DNS server test ID
+        results : iterable
+            Server result elements in chronological order, as yielded by
+            iterServerData
+        now : int, optional
+            Current epoch, to tell if the newest round is settled (Default
+            current time)
+
+        Return
+        ------
+        int
+            Number of counted rounds
+        """
+        testId = str(testId)
+        if now is None:
+            now = calendar.timegm(time.gmtime())
+        lastRound = self.lastRound.get(testId)
+        counted = set()
+        pending = None
+        pendingCounts = {}
+        for result in results:
+            roundId = result['roundId']
+            if lastRound is not None and roundId <= lastRound:
+                continue
+            if pending is None or roundId > pending:
+                """ A later round arrived, the pending one is complete """
+                if pending is not None:
+                    self._count(testId, pending, pendingCounts)
+                    counted.add(pending)
+                pending = roundId
+                pendingCounts = {}
+                counts = pendingCounts
+            elif roundId == pending:
+                counts = pendingCounts
+            else:
+                """ Result of an earlier round, which is complete as well """
+                counts = {}
+                counted.add(roundId)
+            key = (result['agentName'], result.get('server'))
+            current = counts.setdefault(key, [0, 0])
+            current[0] += 1
+            if 'resolutionTime' in result:
+                current[1] += 1
+            if counts is not pendingCounts:
+                self._count(testId, roundId, counts)
+        if pending is not None and pending < now - self.settleSeconds:
+            self._count(testId, pending, pendingCounts)
+            counted.add(pending)
+
+        if counted:
+            with self._lock:
+                self.lastRound[testId] = max(max(counted), self.lastRound.get(testId, 0))
+        return len(counted)
+
+
+    def update(self, api, testIds, timeWindowSec=86400, workers=4):
+        """
+        Fetches and counts the rounds of the tests since the previous update,
+        or of the time window for tests not counted before. Tests are fetched
+        concurrently and share the connections and rate limit of the API
+        object. The counters are saved to the state file afterwards.
+
+        Parameters
+        ----------
+        api : ThousandEyesApi
+            API object used for the requests
+        testIds : list
+            DNS server test IDs
+        timeWindowSec : int
+            Time window of tests not counted before, in seconds
+        workers : int
+            Maximum number of tests fetched at the same time
+
+        Return
+        ------
+        results : list
+            Dictionary per test, in test ID order, with 'testId', 'rounds'
+            (number of counted rounds) and 'error' (message if the test
+            failed, else None)
+        """
+        def update(testId):
+            lastRound = self.lastRound.get(str(testId))
+            if lastRound is not None:
+                uriParameters = {'from': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(lastRound))}
+            else:
+                uriParameters = {'window': str(timeWindowSec) + 's'}
+            try:
+                rounds = self.add(testId, iterServerData(api, testId, uriParameters, DnsServer))
+                return {'testId': testId, 'rounds': rounds, 'error': None}
+            except Exception, e:
+                return {'testId': testId, 'rounds': 0, 'error': str(e)}
+
+        if not testIds:
+            return []
+        pool = ThreadPool(max(1, min(workers, len(testIds))))
+        try:
+            results = pool.map(update, testIds)
+        finally:
+            pool.close()
+        self.save()
+        return results
+
+
+    def query(self, testId=None, agentName=None, server=None, start=None, end=None, resolution='hourly',
+              groupBy=('testId', 'agentName', 'server')):
+        """
+        Returns the availability per time bucket, summed over the dimensions
+        that are not grouped by
+
+        Parameters
+        ----------
+        testId : str or list, optional
+            Only count this test, or these tests
+        agentName, server : str, optional
+            Only count this agent or server
+        start : int, optional
+            Only buckets starting at or after this epoch
+        end : int, optional
+            Only buckets starting before this epoch
+        resolution : str
+            'hourly' or 'daily'
+        groupBy : tuple
+            Dimensions kept in the result, out of 'testId', 'agentName' and
+            'server'. An empty tuple gives the availability of all tests.
+
+        Return
+        ------
+        rows : list
+            Dictionaries with the grouped dimensions, 'start' (bucket start
+            epoch), 'queries', 'successful' and 'availability' (fraction of
+            successful queries), in dimension and start order
+        """
+        if testId is not None:
+            testIds = set(str(value) for value in testId) if isinstance(testId, (list, tuple)) else set([str(testId)])
+        filters = (agentName, server)
+        groups = {}
+        with self._lock:
+            for key, (queries, successful) in self._counters[resolution].items():
+                if testId is not None and key[0] not in testIds:
+                    continue
+                if any(value is not None and value != keyValue for value, keyValue in zip(filters, key[1:3])):
+                    continue
+                if (start is not None and key[3] < start) or (end is not None and key[3] >= end):
+                    continue
+                group = tuple(keyValue for name, keyValue in zip(self.dimensions, key) if name in groupBy) + (key[3],)
+                counts = groups.setdefault(group, [0, 0])
+                counts[0] += queries
+                counts[1] += successful
+
+        rows = []
+        names = [name for name in self.dimensions if name in groupBy]
+        for group, (queries, successful) in sorted(groups.items()):
+            row = dict(zip(names, group))
+            row.update({'start': group[-1], 'queries': queries, 'successful': successful,
+                        'availability': float(successful) / queries if queries else None})
+            rows.append(row)
+        return rows
+
+
+    def save(self):
+        """
+        Writes the counters to the state file, if set, and drops hourly
+        counters older than the retention. Writes to a temporary file first,
+        so an interrupted run keeps the old state.
+        """
+        retention = calendar.timegm(time.gmtime()) - self.hourlyRetention
+        with self._lock:
+            hourly = self._counters['hourly']
+            for key in [key for key in hourly if key[3] < retention]:
+                del hourly[key]
+            if self.stateFile is None:
+                return
+            state = {'lastRound': self.lastRound}
+            for resolution, counters in self._counters.items():
+                state[resolution] = [list(key) + counts for key, counts in sorted(counters.items())]
+            f = open(self.stateFile + '.tmp', 'w')
+            try:
+                json.dump(state, f)
+            finally:
+                f.close()
+            os.rename(self.stateFile + '.tmp', self.stateFile)
+
+
+    def _count(self, testId, roundId, counts):
+        """ Adds the (agent, server) counts of a complete round to the counters of its buckets. """
+        with self._lock:
+            for resolution, seconds in self.resolutions.items():
+                counters = self._counters[resolution]
+                bucket = roundId - roundId % seconds
+                for (agentName, server), (queries, successful) in counts.items():
+                    current = counters.get((testId, agentName, server, bucket))
+                    if current is None:
+                        current = counters[(testId, agentName, server, bucket)] = [0, 0]
+                    current[0] += queries
+                    current[1] += successful
+
+
+"""
+
+ TraceSync class.
+
+"""
+
+class TraceSync:
+    """
+    TraceSync class keeps a persisted aggregate of DNS trace mappings per
+    test, so repeated runs only fetch the rounds since the previous run
+    instead of the whole time window.
+
+    For every test ID a state file holds the high-water mark (date of the
+    newest trace seen), the start of the time window covered and the
+    mappings aggregated per agent and time period. Periods are aligned to multiples of the period length, so
+    they stay stable between runs.
+
+    Attributes
+    ----------
+    directory : str
+        Directory of the per test state files.
+
+    store : TraceStore, optional
+        If set, every newly fetched trace is also appended to the store.
+
+    Methods
+    -------
+    sync(api, testId, timeWindowSec, timePeriodSec)
+        Fetches the traces newer than the high-water mark, merges them into
+        the stored aggregate and returns it
+    load(testId)
+        Returns the stored state of the test
+    """
+
+    dateFormat = '%Y-%m-%dT%H:%M:%S'
+
+
+    def __init__(self, directory, store=None):
+
+        self.directory = directory
+        self.store = store
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+
+    def sync(self, api, testId, timeWindowSec, timePeriodSec, showProgress=True):
+        """
+        Fetches the traces newer than the high-water mark, merges them into
+        the stored aggregate and returns the aggregate for the time window
+
+        Parameters
+        ----------
+        api : ThousandEyesApi
+            API object used for the requests
+        testId : str
+            DNS trace test ID
+        timeWindowSec : int
+            Length of the time window in seconds
+        timePeriodSec : int
+            Length of the aggregation time period in seconds
+        showProgress : bool
+            Print a dot for every page received
+
+        Return
+        ------
+        (startWindowTimeEpoch, data) : tuple
+            Start of the first period of the window in epoch, and the map of
+            DNS trace mappings split by agent and time period, refer to
+            processTraces
+        """
+
+        endWindowTimeEpoch = calendar.timegm(time.gmtime())
+        """ Align the window to the period grid used by the aggregate """
+        startWindowTimeEpoch = endWindowTimeEpoch - timeWindowSec
+        startWindowTimeEpoch -= startWindowTimeEpoch % timePeriodSec
+
+        state = self.load(testId)
+        if state.get('timePeriodSec') != timePeriodSec or state.get('lastDate', 0) < startWindowTimeEpoch:
+            """ Aggregate can not be reused, start over for the whole window """
+            state = {'timePeriodSec': timePeriodSec, 'windowStart': startWindowTimeEpoch, 'lastDate': startWindowTimeEpoch,
+                     'aggregate': {}}
+        state.pop('lastRoundId', None)
+
+        """
+        Rounds are refetched starting from the last one seen, because the last
+        round may have been in progress during the previous run. If the window
+        grew since the previous run, the rounds before the covered part are
+        fetched as well (state files without a window start are refetched
+        entirely). Mappings are kept as sets, so merging a trace twice has no
+        effect.
+        """
+        ranges = []
+        windowStart = state.get('windowStart', state['lastDate'])
+        if startWindowTimeEpoch < windowStart:
+            ranges.append((startWindowTimeEpoch, windowStart))
+        ranges.append((state['lastDate'], endWindowTimeEpoch))
+        traces = []
+        for fromEpoch, toEpoch in ranges:
+            uriParameters = {}
+            uriParameters['from'] = time.strftime(self.dateFormat, time.gmtime(fromEpoch))
+            uriParameters['to'] = time.strftime(self.dateFormat, time.gmtime(toEpoch))
+            traces.extend(loadTestData(api, testId, uriParameters, showProgress))
+        if self.store is not None:
+            self.store.append(testId, traces)
+
+        aggregate = state['aggregate']
+        for trace in traces:
+            traceEpoch = calendar.timegm(time.strptime(trace['date'], '%Y-%m-%d %H:%M:%S'))
+            period = str(traceEpoch - traceEpoch % timePeriodSec)
+            mappings = aggregate.setdefault(trace['agentName'], {}).setdefault(period, {})
+            if not 'errorDetails' in trace:
+                mappings[trace['mappings']] = ''
+            else:
+                mappings['ERROR'] = ''
+            if traceEpoch >= state['lastDate']:
+                state['lastDate'] = traceEpoch
+
+        """ Drop the periods that fell out of the window """
+        for agent in aggregate.keys():
+            for period in aggregate[agent].keys():
+                if int(period) < startWindowTimeEpoch:
+                    del aggregate[agent][period]
+            if not aggregate[agent]:
+                del aggregate[agent]
+        state['windowStart'] = startWindowTimeEpoch
+
+        self._save(testId, state)
+
+        data = {}
+        for agent in aggregate:
+            data[agent] = {}
+            for period in aggregate[agent]:
+                data[agent][(int(period) - startWindowTimeEpoch) / timePeriodSec] = aggregate[agent][period]
+        return startWindowTimeEpoch, data
+
+
+    def load(self, testId):
+        """
+        Returns the stored state of the test
+
+        Parameters
+        ----------
+        testId : str
+            DNS trace test ID
+
+        Return
+        ------
+        state : dict
+            State with 'lastDate', 'windowStart', 'timePeriodSec' and
+            'aggregate' keys, or an empty dict if the test was never synced
+        """
+
+        try:
+            f = open(self._fileName(testId))
+        except IOError:
+            return {}
+        try:
+            return json.load(f)
+        finally:
+            f.close()
+
+
+    def _save(self, testId, state):
+        """ Writes to a temporary file first, so an interrupted run keeps the old state. """
+        fileName = self._fileName(testId)
+        f = open(fileName + '.tmp', 'w')
+        try:
+            json.dump(state, f)
+        finally:
+            f.close()
+        os.rename(fileName + '.tmp', fileName)
+
+
+    def _fileName(self, testId):
+        return os.path.join(self.directory, 'dnstrace-' + str(testId) + '.json')
+
+
+"""
+
+ TraceStore class.
+
+"""
+
+""" Typecode of a 64-bit signed integer array, 'q' is not available on Python 2 """
+INT64 = 'l' if array.array('l').itemsize == 8 else 'd'
+
+class TraceStore:
+    """
+    TraceStore class keeps DNS trace results on disk in a columnar layout, so
+    aggregations over weeks of history run locally instead of re-fetching
+    the data from the API.
+
+    Each test is a partition (directory) with one binary file per column:
+    trace date as int64 epoch, round ID as int64, agent and mapping as int32
+    codes into dictionaries of distinct values, and an error flag. Appending
+    only writes to the end of each file, dictionaries included.
+
+    Attributes
+    ----------
+    directory : str
+        Root directory of the store.
+
+    Methods
+    -------
+    append(testId, traces)
+        Appends trace elements from the API response to the test partition
+    columns(testId)
+        Returns the columns and dictionaries of the test partition
+    traces(testId, startEpoch = None, endEpoch = None)
+        Yields the stored traces as trace elements
+    lastDate(testId)
+        Returns the epoch of the newest stored trace
+    """
+
+    """ Column name and array typecode """
+    columnTypes = {'date': INT64, 'roundId': INT64, 'agent': 'i', 'mappings': 'i', 'error': 'b'}
+    dictionaryColumns = ('agent', 'mappings')
+
+
+    def __init__(self, directory):
+
+        self.directory = directory
+        self._lock = threading.Lock()
+
+
+    def append(self, testId, traces):
+        """
+        Appends trace elements from the API response to the test partition.
+        Traces that are already stored, such as a round refetched by an
+        incremental sync, are skipped.
+
+        Parameters
+        ----------
+        testId : str
+            DNS trace test ID
+        traces : list
+            List of trace elements from the API response
+
+        Return
+        ------
+        int
+            Number of appended traces
+        """
+
+        with self._lock:
+            partition = self._partition(testId)
+            """ Only the dictionaries and the rows of the newest date are read, not the whole history """
+            dictionaries = self._dictionaries(partition)
+            codes = dict((name, dict((value, code) for code, value in enumerate(dictionaries[name])))
+                         for name in self.dictionaryColumns)
+            lastDate, lastAgents = self._tail(partition)
+            lastAgents = set(dictionaries['agent'][code] for code in lastAgents)
+
+            new = dict((name, array.array(typecode)) for name, typecode in self.columnTypes.items())
+            newValues = dict((name, []) for name in self.dictionaryColumns)
+            for trace in traces:
+                traceEpoch = calendar.timegm(time.strptime(trace['date'], '%Y-%m-%d %H:%M:%S'))
+                """ Skip traces that are already stored, before they get dictionary codes """
+                if lastDate is not None:
+                    if traceEpoch < lastDate or (traceEpoch == lastDate and trace['agentName'] in lastAgents):
+                        continue
+                values = {'agent': trace['agentName'], 'mappings': trace.get('mappings', '')}
+                row = {}
+                for name in self.dictionaryColumns:
+                    if values[name] not in codes[name]:
+                        codes[name][values[name]] = len(codes[name])
+                        newValues[name].append(values[name])
+                    row[name] = codes[name][values[name]]
+                row['date'] = traceEpoch
+                row['roundId'] = trace.get('roundId', traceEpoch)
+                row['error'] = 1 if 'errorDetails' in trace else 0
+                for name in self.columnTypes:
+                    new[name].append(row[name])
+
+            """ Dictionaries first, so codes in the columns always resolve """
+            for name in self.dictionaryColumns:
+                f = open(os.path.join(partition, name + '.dict'), 'ab')
+                try:
+                    for value in newValues[name]:
+                        f.write(json.dumps(value) + '\n')
+                finally:
+                    f.close()
+            for name in self.columnTypes:
+                f = open(os.path.join(partition, name + '.col'), 'ab')
+                try:
+                    new[name].tofile(f)
+                finally:
+                    f.close()
+            return len(new['date'])
+
+
+    def columns(self, testId):
+        """
+        Returns the columns and dictionaries of the test partition
+
+        Parameters
+        ----------
+        testId : str
+            DNS trace test ID
+
+        Return
+        ------
+        columns : dict
+            Arrays keyed by column name ('date', 'roundId', 'agent',
+            'mappings', 'error') and lists of distinct values keyed by
+            'agentDictionary' and 'mappingsDictionary'
+        """
+
+        partition = self._partition(testId)
+        columns = {}
+        for name, typecode in self.columnTypes.items():
+            columns[name] = array.array(typecode)
+            fileName = os.path.join(partition, name + '.col')
+            if os.path.exists(fileName):
+                f = open(fileName, 'rb')
+                try:
+                    columns[name].fromstring(f.read())
+                finally:
+                    f.close()
+        """ An interrupted append may leave columns of different length """
+        rows = min(len(column) for column in columns.values())
+        for name in self.columnTypes:
+            del columns[name][rows:]
+
+        for name, dictionary in self._dictionaries(partition).items():
+            columns[name + 'Dictionary'] = dictionary
+        return columns
+
+
+    def traces(self, testId, startEpoch=None, endEpoch=None):
+        """
+        Yields the stored traces as trace elements, usable by processTraces
+
+        Parameters
+        ----------
+        testId : str
+            DNS trace test ID
+        startEpoch : int, optional
+            Only yield traces at or after this epoch
+        endEpoch : int, optional
+            Only yield traces before this epoch
+
+        Return
+        ------
+        generator
+            Trace elements with 'date', 'roundId', 'agentName', 'mappings' and,
+            for failed traces, 'errorDetails' keys
+        """
+
+        columns = self.columns(testId)
+        agents = columns['agentDictionary']
+        mappings = columns['mappingsDictionary']
+        for n in range(0, len(columns['date'])):
+            traceEpoch = columns['date'][n]
+            if startEpoch is not None and traceEpoch < startEpoch:
+                continue
+            if endEpoch is not None and traceEpoch >= endEpoch:
+                continue
+            trace = {'date': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(traceEpoch)),
+                     'roundId': columns['roundId'][n],
+                     'agentName': agents[columns['agent'][n]],
+                     'mappings': mappings[columns['mappings'][n]]}
+            if columns['error'][n]:
+                trace['errorDetails'] = ''
+            yield trace
+
+
+    def lastDate(self, testId):
+        """
+        Returns the epoch of the newest stored trace, or None if there are none
+        """
+
+        with self._lock:
+            return self._tail(self._partition(testId))[0]
+
+
+    def _dictionaries(self, partition):
+        """ Returns the lists of distinct values of the dictionary columns. """
+        dictionaries = {}
+        for name in self.dictionaryColumns:
+            dictionaries[name] = []
+            fileName = os.path.join(partition, name + '.dict')
+            if os.path.exists(fileName):
+                f = open(fileName, 'rb')
+                try:
+                    dictionaries[name] = [json.loads(line) for line in f]
+                finally:
+                    f.close()
+        return dictionaries
+
+
+    def _tail(self, partition):
+        """
+        Returns the newest date and the agent codes stored for it, reading
+        only the end of the date and agent columns. Columns left longer than
+        the others by an interrupted append are cut, so new rows stay aligned.
+        """
+        rows = None
+        for name, typecode in self.columnTypes.items():
+            fileName = os.path.join(partition, name + '.col')
+            size = os.path.getsize(fileName) if os.path.exists(fileName) else 0
+            count = size // array.array(typecode).itemsize
+            rows = count if rows is None else min(rows, count)
+        for name, typecode in self.columnTypes.items():
+            fileName = os.path.join(partition, name + '.col')
+            if os.path.exists(fileName) and os.path.getsize(fileName) > rows * array.array(typecode).itemsize:
+                f = open(fileName, 'r+b')
+                try:
+                    f.truncate(rows * array.array(typecode).itemsize)
+                finally:
+                    f.close()
+        if not rows:
+            return None, set()
+
+        """ Read backwards in blocks until a row of an older date """
+        dateFile = open(os.path.join(partition, 'date.col'), 'rb')
+        agentFile = open(os.path.join(partition, 'agent.col'), 'rb')
+        try:
+            lastDate = None
+            lastAgents = set()
+            end = rows
+            while end > 0:
+                start = max(0, end - 4096)
+                dates = array.array(self.columnTypes['date'])
+                dateFile.seek(start * dates.itemsize)
+                dates.fromfile(dateFile, end - start)
+                agents = array.array(self.columnTypes['agent'])
+                agentFile.seek(start * agents.itemsize)
+                agents.fromfile(agentFile, end - start)
+                if lastDate is None:
+                    lastDate = dates[-1]
+                for n in range(len(dates) - 1, -1, -1):
+                    if dates[n] != lastDate:
+                        return lastDate, lastAgents
+                    lastAgents.add(agents[n])
+                end = start
+            return lastDate, lastAgents
+        finally:
+            dateFile.close()
+            agentFile.close()
+
+
+    def _partition(self, testId):
+        partition = os.path.join(self.directory, 'test-' + str(testId))
+        if not os.path.isdir(partition):
+            os.makedirs(partition)
+        return partition
@@ -0,0 +1,637 @@
+#!/usr/bin/python
+import sys
+import csv
+import gzip
+import json
+import sqlite3
+import threading
+import Queue
+import cPickle
+import tempfile
+from multiprocessing.pool import ThreadPool
+from terecords import Record
+
+"""
+
+ Export helpers used by api-to-csv.py and api-export.py.
+
+"""
+
+def flatten(record, prefix=''):
+    """
+    Flattens an API result element into a single level dictionary
+
+    Nested dictionaries become dot separated keys, such as 'location.lat'.
+    Lists of plain values are joined with ', ', lists containing
+    dictionaries or lists are kept as JSON text.
+
+    Parameters
+    ----------
+    record : dict
+        API result element, such as an agent
+    prefix : str
+        Prefix of the keys, used for nested dictionaries
+
+    Returns
+    -------
+    dict
+        Flat dictionary of plain values
+    """
+
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + '.'))
+        elif isinstance(value, list):
+            if any(isinstance(item, (dict, list)) for item in value):
+                flat[prefix + key] = json.dumps(value)
+            else:
+                flat[prefix + key] = ', '.join(unicode(item) for item in value)
+        else:
+            flat[prefix + key] = value
+    return flat
+
+def openOutput(fileName):
+    """
+    Opens the export destination for writing
+
+    Parameters
+    ----------
+    fileName : str
+        File name. '-' stands for standard output, names ending with '.gz'
+        are gzip compressed.
+
+    Returns
+    -------
+    file
+        File object to write to
+    """
+
+    if fileName == '-':
+        return sys.stdout
+    if fileName.endswith('.gz'):
+        return gzip.open(fileName, 'wb')
+    return open(fileName, 'wb')
+
+
+"""
+
+ CsvWriter class.
+
+"""
+
+class CsvWriter:
+    """
+    CsvWriter class streams API result elements into a single CSV writer.
+    Elements are flattened as they arrive, so memory use does not depend on
+    the number of elements.
+
+    Columns are either declared up front, or discovered from all the
+    elements. Discovered columns are only known once the last element was
+    written, so the rows are held back until close: the first sampleSize in
+    memory, the rest in a temporary file. Keys that are not among declared
+    columns are not exported and are listed in the skippedColumns attribute.
+
+    Attributes
+    ----------
+    output : file
+        File object the CSV is written to, refer to openOutput.
+
+    columns : list, optional
+        Declared list of flattened keys to export. If not set, columns are
+        discovered.
+
+    sampleSize : int
+        Number of held back rows kept in memory before the rest are spooled
+        to a temporary file.
+
+    rows : int
+        Number of written rows.
+
+    skippedColumns : set
+        Keys that were not exported because they are not declared columns.
+
+    Methods
+    -------
+    writerecord(record)
+        Writes a single API result element
+    writerecords(records)
+        Writes all elements of an iterable
+    close()
+        Writes the held back elements and flushes the output
+    """
+
+    def __init__(self, output, columns=None, sampleSize=1000):
+
+        self.output = output
+        self.columns = columns
+        self.sampleSize = sampleSize
+        self.rows = 0
+        self.skippedColumns = set()
+
+        self._writer = csv.writer(output)
+        self._sample = []
+        self._spool = None
+        self._discovered = {}
+        if columns is not None:
+            self._writeHeader()
+
+
+    def writerecord(self, record):
+        """
+        Writes a single API result element
+
+        Parameters
+        ----------
+        record : dict
+            API result element, such as an agent
+        """
+
+        flat = flatten(record)
+        if self.columns is not None:
+            self._writeRow(flat)
+            return
+
+        """
+        Still discovering the columns, in order of first appearance. Held back
+        rows are lists of values in that order, shorter rows are padded when
+        they are written.
+        """
+        for key in flat:
+            if key not in self._discovered:
+                self._discovered[key] = len(self._discovered)
+        row = [''] * len(self._discovered)
+        for key, value in flat.iteritems():
+            row[self._discovered[key]] = value
+        if self._spool is None and len(self._sample) >= self.sampleSize:
+            self._spool = tempfile.TemporaryFile()
+            for held in self._sample:
+                cPickle.dump(held, self._spool, 2)
+            self._sample = []
+        if self._spool is None:
+            self._sample.append(row)
+        else:
+            cPickle.dump(row, self._spool, 2)
+
+
+    def writerecords(self, records):
+        """
+        Writes all elements of an iterable
+
+        Parameters
+        ----------
+        records : iterable
+            API result elements
+        """
+
+        for record in records:
+            self.writerecord(record)
+
+
+    def close(self):
+        """
+        Writes the held back elements and flushes the output
+        """
+
+        if self.columns is None:
+            self.columns = sorted(self._discovered, key=self._discovered.get)
+            self._writeHeader()
+            for row in self._heldRows():
+                row.extend([''] * (len(self.columns) - len(row)))
+                self._writer.writerow([self._encode(value) for value in row])
+                self.rows += 1
+        self.output.flush()
+
+
+    def _heldRows(self):
+        if self._spool is not None:
+            self._spool.seek(0)
+            while True:
+                try:
+                    yield cPickle.load(self._spool)
+                except EOFError:
+                    break
+            self._spool.close()
+            self._spool = None
+        for row in self._sample:
+            yield row
+        self._sample = []
+
+
+    def _writeHeader(self):
+        self._columnSet = set(self.columns)
+        self._writer.writerow([self._encode(column) for column in self.columns])
+
+
+    def _writeRow(self, flat):
+        for key in flat:
+            if key not in self._columnSet:
+                self.skippedColumns.add(key)
+        self._writer.writerow([self._encode(flat.get(column, '')) for column in self.columns])
+        self.rows += 1
+
+
+    def _encode(self, value):
+        """ The Python 2 csv module only handles byte strings """
+        if isinstance(value, unicode):
+            return value.encode('utf-8')
+        return value
+
+
+"""
+
+ Export sinks.
+
+"""
+
+class CsvSink:
+    """
+    CsvSink class writes flat records to a CSV file, refer to CsvWriter
+
+    Attributes
+    ----------
+    fileName : str
+        Output file name, refer to openOutput.
+
+    columns : list, optional
+        Declared list of columns. If not set, columns are discovered.
+
+    skippedColumns : set
+        Keys that were not exported because they are not declared columns.
+    """
+
+    def __init__(self, fileName, columns=None, sampleSize=1000):
+
+        self.fileName = fileName
+        self._output = openOutput(fileName)
+        self._writer = CsvWriter(self._output, columns, sampleSize)
+        self.skippedColumns = self._writer.skippedColumns
+
+
+    def write(self, record):
+        self._writer.writerecord(record)
+
+
+    def close(self):
+        self._writer.close()
+        if self._output is not sys.stdout:
+            self._output.close()
+
+
+class JsonLinesSink:
+    """
+    JsonLinesSink class writes one JSON document per record and line
+
+    Attributes
+    ----------
+    fileName : str
+        Output file name, refer to openOutput.
+    """
+
+    def __init__(self, fileName):
+
+        self.fileName = fileName
+        self._output = openOutput(fileName)
+
+
+    def write(self, record):
+        self._output.write(json.dumps(record, default=Record.toDict) + '\n')
+
+
+    def close(self):
+        self._output.flush()
+        if self._output is not sys.stdout:
+            self._output.close()
+
+
+class SqliteSink:
+    """
+    SqliteSink class inserts flat records into a SQLite table. The table and
+    its columns are created as they appear in the records, and inserts are
+    committed in batches.
+
+    Attributes
+    ----------
+    fileName : str
+        SQLite database file name.
+
+    table : str
+        Table name.
+
+    batchSize : int
+        Number of records inserted per transaction.
+    """
+
+    def __init__(self, fileName, table='records', batchSize=1000):
+
+        self.fileName = fileName
+        self.table = table
+        self.batchSize = batchSize
+        self._connection = sqlite3.connect(fileName)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS "' + table + '" (_rowid INTEGER PRIMARY KEY)')
+        self._columns = set(row[1] for row in self._connection.execute('PRAGMA table_info("' + table + '")'))
+        self._batch = []
+
+
+    def write(self, record):
+        self._batch.append(record)
+        if len(self._batch) >= self.batchSize:
+            self._flush()
+
+
+    def close(self):
+        self._flush()
+        self._connection.close()
+
+
+    def _flush(self):
+        if not self._batch:
+            return
+        for record in self._batch:
+            for column in record:
+                if column not in self._columns:
+                    self._connection.execute('ALTER TABLE "' + self.table + '" ADD COLUMN "' + column.replace('"', '""') + '"')
+                    self._columns.add(column)
+        """ Records with the same keys share a prepared statement """
+        groups = {}
+        for record in self._batch:
+            columns = tuple(sorted(record))
+            groups.setdefault(columns, []).append(tuple(record[column] for column in columns))
+        for columns, rows in groups.items():
+            self._connection.executemany(
+                'INSERT INTO "' + self.table + '" (' + ', '.join('"' + column.replace('"', '""') + '"' for column in columns) +
+                ') VALUES (' + ', '.join('?' * len(columns)) + ')', rows)
+        self._connection.commit()
+        self._batch = []
+
+
+class ParquetSink:
+    """
+    ParquetSink class writes flat records to a Parquet file in row groups.
+    Requires the pyarrow package.
+
+    The schema is only known once the last record was written, so records
+    are spooled to a temporary file and the Parquet file is written on
+    close, with every column seen. Columns holding only booleans, integers
+    or numbers get those types, any other column is written as text.
+
+    Attributes
+    ----------
+    fileName : str
+        Output file name.
+
+    batchSize : int
+        Number of records per row group.
+    """
+
+    def __init__(self, fileName, batchSize=10000):
+
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception('Parquet export requires the pyarrow package')
+        self._pyarrow = pyarrow
+        self.fileName = fileName
+        self.batchSize = batchSize
+        self._types = {}
+        self._spool = tempfile.TemporaryFile()
+
+
+    def write(self, record):
+        for column, value in record.iteritems():
+            types = self._types.setdefault(column, set())
+            if value is not None:
+                types.add(type(value))
+        cPickle.dump(record, self._spool, 2)
+
+
+    def close(self):
+        pyarrow = self._pyarrow
+        columns = sorted(self._types)
+        schema = pyarrow.schema([(column, self._type(column)) for column in columns])
+        writer = pyarrow.parquet.ParquetWriter(self.fileName, schema)
+        try:
+            self._spool.seek(0)
+            batch = []
+            while True:
+                try:
+                    batch.append(cPickle.load(self._spool))
+                except EOFError:
+                    break
+                if len(batch) >= self.batchSize:
+                    writer.write_table(self._table(batch, schema))
+                    batch = []
+            if batch:
+                writer.write_table(self._table(batch, schema))
+        finally:
+            writer.close()
+            self._spool.close()
+
+
+    def _type(self, column):
+        types = self._types[column]
+        if not types:
+            return self._pyarrow.string()
+        if types <= set([bool]):
+            return self._pyarrow.bool_()
+        if types <= set([int, long]):
+            return self._pyarrow.int64()
+        if types <= set([int, long, float]):
+            return self._pyarrow.float64()
+        return self._pyarrow.string()
+
+
+    def _table(self, batch, schema):
+        arrays = []
+        for field in schema:
+            values = [record.get(field.name) for record in batch]
+            if field.type == self._pyarrow.string():
+                values = [value if value is None or isinstance(value, basestring) else unicode(value) for value in values]
+            arrays.append(self._pyarrow.array(values, type=field.type))
+        return self._pyarrow.Table.from_arrays(arrays, schema=schema)
+
+def openSink(fileName):
+    """
+    Returns a sink for the file name, chosen by its extension
+
+    Parameters
+    ----------
+    fileName : str
+        Output file name: .csv or .csv.gz for CSV, .jsonl or .jsonl.gz for
+        JSON Lines, .parquet for Parquet and .db or .sqlite for SQLite.
+        '-' writes CSV to standard output.
+
+    Returns
+    -------
+    object
+        Sink with write(record) and close() methods
+    """
+
+    name = fileName[:-3] if fileName.endswith('.gz') else fileName
+    if name.endswith('.jsonl'):
+        return JsonLinesSink(fileName)
+    if name.endswith('.parquet'):
+        return ParquetSink(fileName)
+    if name.endswith('.db') or name.endswith('.sqlite'):
+        return SqliteSink(fileName)
+    return CsvSink(fileName)
+
+
+"""
+
+ Exporter class.
+
+"""
+
+class Exporter:
+    """
+    Exporter class fetches the items of several API endpoints concurrently
+    and writes them, flattened, into a single sink.
+
+    Fetching and writing run in separate stages connected by a bounded
+    queue: when the sink is slower than the API, fetch workers block instead
+    of buffering records in memory. All requests go through one
+    ThousandEyesApi object, so they share its rate limiter.
+
+    Attributes
+    ----------
+    api : ThousandEyesApi
+        API object used for the requests.
+
+    sink : object
+        Destination with write(record) and close() methods, refer to openSink.
+
+    schema : dict, optional
+        Output column name mapped to a dot separated path in the item, such as
+        {'agent': 'agentName', 'lat': 'location.lat'}. If not set, items are
+        flattened, refer to flatten.
+
+    workers : int
+        Number of endpoints fetched at the same time.
+
+    queueSize : int
+        Number of records buffered between the fetch and write stages.
+
+    sourceColumn : str, optional
+        If set, every record gets a column of this name with its endpoint.
+
+    Methods
+    -------
+    run(jobs)
+        Exports the items of all jobs and returns the number of records
+    """
+
+    def __init__(self, api, sink, schema=None, workers=4, queueSize=1000, sourceColumn=None):
+
+        self.api = api
+        self.sink = sink
+        self.schema = schema
+        self.workers = workers
+        self.queueSize = queueSize
+        self.sourceColumn = sourceColumn
+
+
+    def run(self, jobs):
+        """
+        Exports the items of all jobs. Records of different jobs may be
+        interleaved in the output.
+
+        Parameters
+        ----------
+        jobs : list
+            List of (endpoint, uriParameters, itemKey) tuples, such as
+            ('/dns/trace/1234', {'window': '1d'}, 'dns.trace'). Refer to
+            testJobs for building jobs from test IDs.
+
+        Returns
+        -------
+        int
+            Number of written records
+        """
+
+        queue = Queue.Queue(self.queueSize)
+        stop = threading.Event()
+        pool = ThreadPool(max(1, min(self.workers, len(jobs))))
+        for endpoint, uriParameters, itemKey in jobs:
+            pool.apply_async(self._fetch, (endpoint, uriParameters, itemKey, queue, stop))
+
+        written = 0
+        finished = 0
+        try:
+            while finished < len(jobs):
+                status, record = queue.get()
+                if status == 'done':
+                    finished += 1
+                elif status == 'error':
+                    raise record[0], record[1], record[2]
+                else:
+                    self.sink.write(record)
+                    written += 1
+        finally:
+            stop.set()
+            pool.close()
+        return written
+
+
+    def _fetch(self, endpoint, uriParameters, itemKey, queue, stop):
+        """ Pages through the endpoint and puts mapped records into the queue. """
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=0.1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+
+        try:
+            for item in self.api.paginate(endpoint, uriParameters, itemKey, stream=True):
+                record = self._map(item)
+                if self.sourceColumn is not None:
+                    record[self.sourceColumn] = endpoint
+                if not put(('record', record)):
+                    return
+            put(('done', None))
+        except Exception:
+            put(('error', sys.exc_info()))
+
+
+    def _map(self, item):
+        if self.schema is None:
+            return flatten(item)
+        record = {}
+        for column, path in self.schema.items():
+            value = item
+            for key in path.split('.'):
+                if not isinstance(value, (dict, Record)) or key not in value:
+                    value = None
+                    break
+                value = value[key]
+            record[column] = value
+        return record
+
+def testJobs(testIds, endpointTemplate, itemKey, uriParameters={}):
+    """
+    Builds Exporter jobs for the same endpoint of many tests
+
+    Parameters
+    ----------
+    testIds : list
+        List of test IDs
+    endpointTemplate : str
+        Endpoint URL with a placeholder for the test ID, such as
+        '/dns/trace/{testId}'
+    itemKey : str
+        Dot separated path of the items in each page, such as 'dns.trace'
+    uriParameters : dict
+        Dictionary of additional URL parameters, used for every test
+
+    Returns
+    -------
+    list
+        List of (endpoint, uriParameters, itemKey) tuples
+    """
+
+    return [(endpointTemplate.format(testId, testId=testId), dict(uriParameters), itemKey) for testId in testIds]
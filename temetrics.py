@@ -0,0 +1,378 @@
+#!/usr/bin/python
+import sys
+import os
+import re
+import time
+import bisect
+import runpy
+import resource
+import threading
+import cProfile
+import pstats
+
+"""
+
+ Instrumentation helpers for the API client and the processing scripts.
+
+"""
+
+"""
+
+ Histogram class.
+
+"""
+
+class Histogram:
+    """
+    Histogram class counts observed values in buckets with fixed upper
+    bounds, as a Prometheus histogram.
+
+    Attributes
+    ----------
+    bounds : list
+        Upper bounds of the buckets, in increasing order. Values above the
+        last bound are counted in an additional +Inf bucket.
+
+    counts : list
+        Number of values per bucket, not cumulative.
+
+    count : int
+        Number of observed values.
+
+    sum : float
+        Sum of observed values.
+
+    Methods
+    -------
+    observe(value)
+        Counts the value
+    quantile(fraction)
+        Returns the upper bound of the bucket the quantile falls in
+    """
+
+    def __init__(self, bounds):
+
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+    def quantile(self, fraction):
+        """ Returns the upper bound of the bucket holding the quantile, or None if empty. """
+        if not self.count:
+            return None
+        seen = 0
+        for bound, count in zip(self.bounds + [float('inf')], self.counts):
+            seen += count
+            if seen >= fraction * self.count:
+                return bound
+        return float('inf')
+
+"""
+
+ Metrics class.
+
+"""
+
+class Metrics:
+    """
+    Metrics class aggregates ThousandEyesApi request records into
+    histograms per method and endpoint, and exports them in the Prometheus
+    text format. Endpoint IDs are replaced by ':id', so all tests share the
+    histograms of their endpoint.
+
+    Use observe as a hook of the API object:
+
+        metrics = Metrics()
+        api.hooks.append(metrics.observe)
+        ...
+        metrics.write('teapi.prom')
+
+    Attributes
+    ----------
+    prefix : str
+        Prefix of the exported metric names
+
+    Methods
+    -------
+    observe(record)
+        Adds a request record
+    prometheus()
+        Returns the metrics in the Prometheus text format
+    write(fileName)
+        Writes the metrics to a file, such as for the node_exporter textfile
+        collector
+    summary()
+        Returns a short text table of request counts and timings
+    """
+
+    """ Histogram bounds of durations in seconds, sizes in bytes and retry counts """
+    secondsBuckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+    bytesBuckets = [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216, 67108864]
+    retriesBuckets = [0, 1, 2, 3, 5, 10]
+
+    """ (metric, record key, bounds, help text) of every histogram """
+    histograms = [
+        ('request_seconds', 'totalSeconds', secondsBuckets, 'Time from issuing the request until the body was decoded'),
+        ('connect_seconds', 'connectSeconds', secondsBuckets, 'Time spent opening connections, including TLS'),
+        ('ttfb_seconds', 'ttfbSeconds', secondsBuckets, 'Time from sending the request until the response headers arrived'),
+        ('decode_seconds', 'decodeSeconds', secondsBuckets, 'Time spent decoding the JSON body'),
+        ('throttle_seconds', 'throttleSeconds', secondsBuckets, 'Time spent waiting for the rate limiter and 429 backoff'),
+        ('response_bytes', 'bodyBytes', bytesBuckets, 'Size of the response body'),
+        ('retries', 'retries', retriesBuckets, 'Number of retries of the request'),
+    ]
+
+    def __init__(self, prefix='teapi'):
+
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._requests = {}
+
+
+    def observe(self, record):
+        """
+        Adds a request record, as passed to the ThousandEyesApi hooks
+
+        Parameters
+        ----------
+        record : dict
+            Request record
+        """
+
+        endpoint = re.sub(r'/\d+(?=/|$)', '/:id', record['endpoint'])
+        if endpoint.endswith('.json'):
+            endpoint = endpoint[:-5]
+        labels = (record['method'], endpoint)
+        status = str(record['status']) if record['status'] is not None else 'error'
+        with self._lock:
+            self._requests[labels + (status,)] = self._requests.get(labels + (status,), 0) + 1
+            for name, key, bounds, text in self.histograms:
+                if record.get(key) is None:
+                    continue
+                histogram = self._histograms.get((name,) + labels)
+                if histogram is None:
+                    histogram = self._histograms[(name,) + labels] = Histogram(bounds)
+                histogram.observe(record[key])
+
+
+    def prometheus(self):
+        """
+        Returns the metrics in the Prometheus text exposition format
+
+        Returns
+        -------
+        str
+            Metrics text
+        """
+
+        lines = []
+        with self._lock:
+            name = self.prefix + '_requests_total'
+            lines.append('# HELP ' + name + ' Number of API requests by response status')
+            lines.append('# TYPE ' + name + ' counter')
+            for (method, endpoint, status), count in sorted(self._requests.items()):
+                lines.append(name + self._labels(method=method, endpoint=endpoint, status=status) + ' ' + str(count))
+
+            for metric, key, bounds, text in self.histograms:
+                name = self.prefix + '_' + metric
+                lines.append('# HELP ' + name + ' ' + text)
+                lines.append('# TYPE ' + name + ' histogram')
+                for (histogramName, method, endpoint), histogram in sorted(self._histograms.items()):
+                    if histogramName != metric:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds + ['+Inf'], histogram.counts):
+                        cumulative += count
+                        lines.append(name + '_bucket' + self._labels(method=method, endpoint=endpoint, le=bound) +
+                                     ' ' + str(cumulative))
+                    lines.append(name + '_sum' + self._labels(method=method, endpoint=endpoint) +
+                                 ' ' + repr(histogram.sum))
+                    lines.append(name + '_count' + self._labels(method=method, endpoint=endpoint) +
+                                 ' ' + str(histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+    def write(self, fileName):
+        """
+        Writes the metrics in the Prometheus text format. The file is replaced
+        at once, so a collector never reads a partial file.
+
+        Parameters
+        ----------
+        fileName : str
+            File name, such as teapi.prom
+        """
+
+        f = open(fileName + '.tmp', 'w')
+        try:
+            f.write(self.prometheus())
+        finally:
+            f.close()
+        os.rename(fileName + '.tmp', fileName)
+
+
+    def summary(self):
+        """
+        Returns a text table with the number of requests, p50 and p99 total
+        time, and throttle time per endpoint. Percentiles are bucket bounds.
+
+        Returns
+        -------
+        str
+            Summary table
+        """
+
+        lines = ['{0:<6} {1:<40} {2:>8} {3:>9} {4:>9} {5:>11}'.format(
+            'Method', 'Endpoint', 'Requests', 'p50 (s)', 'p99 (s)', 'Throttle (s)')]
+        with self._lock:
+            for (name, method, endpoint), histogram in sorted(self._histograms.items()):
+                if name != 'request_seconds':
+                    continue
+                throttle = self._histograms.get(('throttle_seconds', method, endpoint))
+                lines.append('{0:<6} {1:<40} {2:>8} {3:>9} {4:>9} {5:>11.3f}'.format(
+                    method, endpoint, histogram.count, histogram.quantile(0.5), histogram.quantile(0.99),
+                    throttle.sum if throttle is not None else 0.0))
+        return '\n'.join(lines) + '\n'
+
+
+    def _labels(self, **labels):
+        """ Returns the label set text, such as {method="GET",endpoint="/agents"}. """
+        pairs = []
+        for name, value in sorted(labels.items()):
+            value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            pairs.append(name + '="' + value + '"')
+        return '{' + ','.join(pairs) + '}'
+
+"""
+
+ Profiler class.
+
+"""
+
+class Profiler:
+    """
+    Profiler class profiles a block of code with cProfile and reports the
+    peak memory use, as a context manager:
+
+        with Profiler('processing.prof'):
+            processTraces(traces, start, period)
+
+    Memory allocations are traced with tracemalloc where it is available
+    (Python 3). On Python 2 only the peak resident set size is reported.
+
+    Attributes
+    ----------
+    output : str, optional
+        File name of the report. Names ending with .prof receive the raw
+        cProfile statistics, for pstats or snakeviz. Other names, or standard
+        error if not set, receive a text report.
+
+    memory : bool
+        Trace memory allocations as well
+
+    limit : int
+        Number of functions and allocation sites in the text report
+    """
+
+    def __init__(self, output=None, memory=False, limit=30):
+
+        self.output = output
+        self.memory = memory
+        self.limit = limit
+        self._profile = None
+        self._tracemalloc = None
+
+
+    def __enter__(self):
+        if self.memory:
+            try:
+                import tracemalloc
+                self._tracemalloc = tracemalloc
+                tracemalloc.start()
+            except ImportError:
+                self._tracemalloc = None
+        self._start = time.time()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        return self
+
+
+    def __exit__(self, type, value, traceback):
+        self._profile.disable()
+        elapsed = time.time() - self._start
+
+        if self.output is not None and self.output.endswith('.prof'):
+            self._profile.dump_stats(self.output)
+            report = sys.stderr
+            closeReport = False
+        elif self.output is not None:
+            report = open(self.output, 'w')
+            closeReport = True
+        else:
+            report = sys.stderr
+            closeReport = False
+
+        try:
+            report.write('Elapsed {0:.3f} s\n'.format(elapsed))
+            """ ru_maxrss is in kilobytes on Linux """
+            report.write('Peak RSS {0} kB\n'.format(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+            if self._tracemalloc is not None:
+                snapshot = self._tracemalloc.take_snapshot()
+                current, peak = self._tracemalloc.get_traced_memory()
+                self._tracemalloc.stop()
+                report.write('Traced peak {0} kB\n'.format(peak / 1024))
+                for statistic in snapshot.statistics('lineno')[:self.limit]:
+                    report.write(str(statistic) + '\n')
+            if report is not sys.stderr or self.output is None:
+                stats = pstats.Stats(self._profile, stream=report)
+                stats.sort_stats('cumulative').print_stats(self.limit)
+        finally:
+            if closeReport:
+                report.close()
+        return False
+
+
+"""
+    Runs a script under the profiler and with request metrics collected from
+    every ThousandEyesApi object it creates.
+
+    Use: temetrics.py [--profile=<file>] [--memory] [--metrics=<file>] <script> [script parameters]
+"""
+
+if __name__ == '__main__':
+    options = []
+    arguments = sys.argv[1:]
+    while arguments and arguments[0].startswith('--'):
+        options.append(arguments.pop(0))
+    if not arguments:
+        sys.exit('Use: ' + sys.argv[0] + ' [--profile=<file>] [--memory] [--metrics=<file>] <script> [script parameters]')
+
+    profileFile = None
+    metricsFile = None
+    for option in options:
+        if option.startswith('--profile='):
+            profileFile = option[10:]
+        if option.startswith('--metrics='):
+            metricsFile = option[10:]
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(arguments[0])))
+    import teapi
+    metrics = Metrics()
+    teapi.ThousandEyesApi.defaultHooks.append(metrics.observe)
+
+    sys.argv = arguments
+    try:
+        with Profiler(profileFile, '--memory' in options):
+            runpy.run_path(arguments[0], run_name='__main__')
+    finally:
+        if metricsFile is not None:
+            metrics.write(metricsFile)
+        sys.stderr.write(metrics.summary())
@@ -0,0 +1,268 @@
+#!/usr/bin/python
+import time
+import random
+from multiprocessing.pool import ThreadPool
+
+"""
+
+ TestProvisioner class.
+
+"""
+
+class TestProvisioner:
+    """
+    TestProvisioner class synchronizes ThousandEyes tests with a list of test
+    definitions. The definitions are compared with the current /tests
+    inventory, and only the creates, updates and deletes that are needed are
+    sent, concurrently, through the rate limiter of the API object.
+
+    Tests are matched on testName. A definition is a dictionary of test
+    properties, as sent to /tests/{type}/new, including the 'type' of the test
+    (such as 'http-server') and its 'testName'. A definition whose name is
+    shared by several existing tests is not applied, but reported as a
+    'duplicate' action, as it is not known which of them it describes.
+
+    Attributes
+    ----------
+    api : ThousandEyesApi
+        API object used for the requests.
+
+    workers : int
+        Number of API calls in flight at the same time.
+
+    maxAttempts : int
+        Number of times a failed call is attempted before it is reported as
+        an error.
+
+    Methods
+    -------
+    plan(definitions, deleteMissing = False, managedPrefix = None)
+        Compares the definitions with the inventory and returns the actions
+    apply(actions)
+        Sends the actions to the API and returns a result per action
+    sync(definitions, deleteMissing = False, managedPrefix = None)
+        Plans and applies the actions
+    """
+
+    def __init__(self, api, workers=8, maxAttempts=3):
+
+        self.api = api
+        self.workers = workers
+        self.maxAttempts = maxAttempts
+
+
+    def plan(self, definitions, deleteMissing=False, managedPrefix=None):
+        """
+        Compares the definitions with the current inventory
+
+        Parameters
+        ----------
+        definitions : list
+            List of test definitions
+        deleteMissing : bool
+            Delete tests that have no definition
+        managedPrefix : str, optional
+            If set, only tests with names starting with the prefix are deleted
+
+        Returns
+        -------
+        list
+            List of actions, dictionaries with 'action' ('create', 'update',
+            'delete', 'unchanged' or 'duplicate'), 'testName', 'type',
+            'testId' and 'properties' keys. Duplicate actions have the
+            'testIds' of all tests with the name and an 'error' message.
+        """
+
+        inventory = {}
+        duplicates = {}
+        for test in self.api.getRequest('/tests', {}).get('test', []):
+            if test['testName'] in inventory:
+                duplicates.setdefault(test['testName'], [inventory[test['testName']]]).append(test)
+            else:
+                inventory[test['testName']] = test
+
+        """ Properties not in the inventory listing require the test details """
+        details = {}
+        incomplete = []
+        for definition in definitions:
+            test = inventory.get(definition['testName'])
+            if test is not None and definition['testName'] not in duplicates and any(key not in test for key in definition):
+                incomplete.append(test)
+        if incomplete:
+            pool = ThreadPool(max(1, min(self.workers, len(incomplete))))
+            try:
+                results = pool.map(lambda test: self.api.getRequest('/tests/' + str(test['testId']), {}), incomplete)
+            finally:
+                pool.close()
+            for test, result in zip(incomplete, results):
+                details[test['testName']] = result['test'][0]
+
+        actions = []
+        for definition in definitions:
+            test = details.get(definition['testName'], inventory.get(definition['testName']))
+            action = {'testName': definition['testName'], 'type': definition['type'], 'properties': definition}
+            if definition['testName'] in duplicates:
+                testIds = [duplicate['testId'] for duplicate in duplicates[definition['testName']]]
+                action.update({'action': 'duplicate', 'testId': None, 'testIds': testIds, 'properties': {},
+                               'error': str(len(testIds)) + ' tests have this name: ' +
+                                        ', '.join(str(testId) for testId in testIds)})
+            elif test is None:
+                action['action'] = 'create'
+                action['testId'] = None
+            else:
+                """ The update URL is of the existing test, whatever type the definition asks for """
+                action['type'] = test.get('type', definition['type'])
+                action['testId'] = test['testId']
+                changed = dict((key, value) for key, value in definition.items()
+                               if key != 'type' and not self._equal(value, test.get(key)))
+                action['action'] = 'update' if changed else 'unchanged'
+                action['properties'] = changed
+            actions.append(action)
+
+        if deleteMissing:
+            names = set(definition['testName'] for definition in definitions)
+            for name, test in inventory.items():
+                if name in names or (managedPrefix is not None and not name.startswith(managedPrefix)):
+                    continue
+                """ Every test of a name without a definition is deleted """
+                for test in duplicates.get(name, [test]):
+                    actions.append({'action': 'delete', 'testName': name, 'type': test['type'],
+                                    'testId': test['testId'], 'properties': {}})
+        return actions
+
+
+    def apply(self, actions):
+        """
+        Sends the actions to the API concurrently
+
+        Parameters
+        ----------
+        actions : list
+            List of actions, refer to plan
+
+        Returns
+        -------
+        list
+            Result per action, in the same order: dictionaries with
+            'testName', 'action', 'status' ('ok' or 'error'), 'testId',
+            'attempts' and, for errors, 'error' keys
+        """
+
+        pending = [action for action in actions if action['action'] not in ('unchanged', 'duplicate')]
+        results = {}
+        if pending:
+            pool = ThreadPool(max(1, min(self.workers, len(pending))))
+            try:
+                for action, result in zip(pending, pool.map(self._apply, pending)):
+                    results[id(action)] = result
+            finally:
+                pool.close()
+
+        report = []
+        for action in actions:
+            result = {'testName': action['testName'], 'action': action['action'], 'status': 'ok',
+                      'testId': action['testId'], 'attempts': 0}
+            if action['action'] == 'duplicate':
+                result.update(status='error', error=action['error'], testIds=action['testIds'])
+            report.append(results.get(id(action), result))
+        return report
+
+
+    def sync(self, definitions, deleteMissing=False, managedPrefix=None):
+        """
+        Plans and applies the actions needed to match the definitions
+
+        Returns
+        -------
+        list
+            Result per action, refer to apply
+        """
+
+        return self.apply(self.plan(definitions, deleteMissing, managedPrefix))
+
+
+    def _apply(self, action):
+        """ Sends a single action, retrying in a way that is safe to repeat. """
+
+        result = {'testName': action['testName'], 'action': action['action'], 'testId': action['testId']}
+        prefix = '/tests/' + action['type'] + '/'
+        for attempt in range(1, self.maxAttempts + 1):
+            result['attempts'] = attempt
+            try:
+                if action['action'] == 'create':
+                    response = self.api.postRequest(prefix + 'new', action['properties'], {})
+                    result['testId'] = response['test'][0]['testId']
+                elif action['action'] == 'update':
+                    self.api.postRequest(prefix + str(action['testId']) + '/update', action['properties'], {})
+                else:
+                    self.api.postRequest(prefix + str(action['testId']) + '/delete', {}, {})
+                result['status'] = 'ok'
+                result.pop('error', None)
+                return result
+            except Exception, e:
+                result['status'] = 'error'
+                result['error'] = str(e)
+
+            """ A test that is already gone does not need to be deleted again """
+            if action['action'] == 'delete' and result['error'].startswith('API HTTP error: 404'):
+                result['status'] = 'ok'
+                del result['error']
+                return result
+            """
+            The API object retries 429 answers for every method, as the
+            request was rejected before it was carried out. Other failures
+            of POST requests are not retried by the API object, as the
+            request may have been carried out before the connection or the
+            server failed. A failed create is looked up in the inventory before it is sent
+            again, so the test is never created twice. Updates and deletes can
+            be repeated safely. Client errors other than 429 are not retried.
+            """
+            if not self._transient(result['error']):
+                return result
+            if action['action'] == 'create':
+                try:
+                    created = self._find(action['testName'])
+                except Exception:
+                    created = None
+                if created is not None:
+                    result['status'] = 'ok'
+                    result['testId'] = created['testId']
+                    del result['error']
+                    return result
+            if attempt < self.maxAttempts:
+                time.sleep(random.uniform(0, min(self.api.backoffCap, self.api.backoffBase * 2 ** attempt)))
+        return result
+
+
+    def _transient(self, error):
+        """ Returns True if the error message is of a failure worth retrying. """
+        if error.startswith('API HTTP error: '):
+            return error[16:19] == '429' or error[16:17] == '5'
+        return error.startswith('API URL error') or error.startswith('API HTTP exception')
+
+
+    def _find(self, testName):
+        """ Returns the inventory entry of the test, or None. """
+        for test in self.api.getRequest('/tests', {}).get('test', []):
+            if test['testName'] == testName:
+                return test
+        return None
+
+
+    def _equal(self, wanted, current):
+        """ Compares a defined property with the current value of the test. """
+        if isinstance(wanted, list) and isinstance(current, list):
+            """ Agents and other object lists are compared by their IDs """
+            if all(isinstance(item, dict) for item in wanted + current):
+                key = 'agentId' if all('agentId' in item for item in wanted + current) else None
+                if key is not None:
+                    return sorted(item[key] for item in wanted) == sorted(item[key] for item in current)
+            return wanted == current
+        """ The API answers 0 and 1 for flags that may be defined as booleans """
+        if isinstance(wanted, bool):
+            wanted = int(wanted)
+        if isinstance(current, bool):
+            current = int(current)
+        if isinstance(wanted, (int, long)) or isinstance(current, (int, long)):
+            return unicode(wanted) == unicode(current)
+        return wanted == current
@@ -0,0 +1,274 @@
+#!/usr/bin/python
+
+"""
+
+ Compact record types for large API results.
+
+ A decoded JSON object keeps its key strings and a hash table per element.
+ Records store the known fields of an element in __slots__ instead, and
+ share repeated strings, such as agent names and dates, between elements.
+ They can be read like dictionaries, so code written for the decoded JSON
+ objects, such as processTraces and the exporters, works with them
+ unchanged.
+
+"""
+
+""" Shared copies of repeated strings, dropped once sharedLimit strings are kept """
+_strings = {}
+sharedLimit = 65536
+
+def share(value):
+    """
+    Returns the shared copy of a string, so equal strings are kept in memory
+    once. Other values are returned as they are.
+
+    The table of shared strings is emptied when it reaches sharedLimit, so
+    fields with ever new values, such as dates of a long running process,
+    do not grow it without bound. Strings already in records stay shared.
+
+    Parameters
+    ----------
+    value : object
+        Value to share
+
+    Returns
+    -------
+    object
+        Shared string, or the value
+    """
+    if isinstance(value, basestring):
+        if len(_strings) >= sharedLimit:
+            _strings.clear()
+        return _strings.setdefault(value, value)
+    return value
+
+"""
+
+ Record class.
+
+"""
+
+class Record(object):
+    """
+    Record class is the base of the compact record types. Subclasses list
+    their known fields in fields, and the fields holding repeated strings in
+    sharedFields. Fields that are not known are kept in a dictionary.
+
+    Records support the read and write dictionary accessors: record[key],
+    get, 'key' in record, keys, values, items, iteration, len and setting
+    items. Fields that were not present in the JSON object are missing, as
+    in a dictionary.
+
+    Methods
+    -------
+    fromPairs(pairs)
+        Builds a record from JSON object pairs, for json object_pairs_hook
+    fromDict(values)
+        Builds a record from a decoded JSON object
+    toDict()
+        Returns the record as a dictionary
+    """
+
+    __slots__ = ('_extra',)
+    fields = ()
+    sharedFields = ()
+    """ Field present in every element of the type, used to tell them from nested objects """
+    keyField = None
+
+    def __init__(self, pairs=()):
+
+        self._extra = None
+        """ Same as setting the items, without a method call per field """
+        fieldSet = self._fieldSet
+        sharedSet = self._sharedSet
+        for key, value in pairs:
+            if key not in fieldSet:
+                if self._extra is None:
+                    self._extra = {}
+                self._extra[key] = value
+                continue
+            if key in sharedSet and isinstance(value, basestring):
+                value = _strings.setdefault(value, value)
+            setattr(self, key, value)
+        if len(_strings) >= sharedLimit:
+            _strings.clear()
+
+
+    @classmethod
+    def fromPairs(cls, pairs):
+        """
+        Builds a record from JSON object pairs. Objects without the key field,
+        such as nested objects, stay dictionaries. Use as object_pairs_hook
+        of a JSON decoder to decode elements straight into records.
+
+        Parameters
+        ----------
+        pairs : list
+            List of (key, value) tuples
+
+        Returns
+        -------
+        Record or dict
+            Record of the element, or dictionary of other objects
+        """
+        for key, value in pairs:
+            if key == cls.keyField:
+                return cls(pairs)
+        return dict(pairs)
+
+
+    @classmethod
+    def fromDict(cls, values):
+        """ Builds a record from a decoded JSON object. """
+        return cls(values.iteritems())
+
+
+    def toDict(self):
+        """ Returns the record as a dictionary. """
+        return dict(self.iteritems())
+
+
+    def __getitem__(self, key):
+        if key in self._fieldSet:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+
+    def __setitem__(self, key, value):
+        if key in self._fieldSet:
+            if key in self._sharedSet:
+                value = share(value)
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+
+    def __delitem__(self, key):
+        if key in self._fieldSet:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key)
+        elif self._extra is None:
+            raise KeyError(key)
+        else:
+            del self._extra[key]
+
+
+    def __contains__(self, key):
+        if key in self._fieldSet:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+
+    def iteritems(self):
+        for key in self.fields:
+            try:
+                yield key, getattr(self, key)
+            except AttributeError:
+                pass
+        if self._extra is not None:
+            for item in self._extra.iteritems():
+                yield item
+
+
+    def items(self):
+        return list(self.iteritems())
+
+
+    def keys(self):
+        return [key for key, value in self.iteritems()]
+
+
+    def values(self):
+        return [value for key, value in self.iteritems()]
+
+
+    def __iter__(self):
+        return iter(self.keys())
+
+
+    def __len__(self):
+        return len(self.keys())
+
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.toDict() == dict(other.items())
+        return NotImplemented
+
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+
+    def __repr__(self):
+        return self.__class__.__name__ + '(' + repr(self.toDict()) + ')'
+
+
+def recordType(name, fields, sharedFields=(), keyField=None):
+    """
+    Creates a record type with the fields as __slots__
+
+    Parameters
+    ----------
+    name : str
+        Class name
+    fields : tuple
+        Known fields of the element
+    sharedFields : tuple
+        Fields with repeated strings, kept in memory once
+    keyField : str
+        Field present in every element of the type
+
+    Returns
+    -------
+    type
+        Record subclass
+    """
+    return type(name, (Record,), {
+        '__slots__': tuple(fields),
+        'fields': tuple(fields),
+        'sharedFields': tuple(sharedFields),
+        'keyField': keyField,
+        '_fieldSet': frozenset(fields),
+        '_sharedSet': frozenset(sharedFields),
+    })
+
+
+""" Element of the dns.trace list of /dns/trace/{testId} """
+DnsTrace = recordType('DnsTrace',
+                      ('agentId', 'agentName', 'date', 'roundId', 'permalink', 'mappings', 'errorDetails'),
+                      ('agentName', 'date', 'mappings', 'errorDetails'),
+                      'roundId')
+
+""" Element of the dns.server list of /dns/server/{testId} """
+DnsServer = recordType('DnsServer',
+                       ('agentId', 'agentName', 'date', 'roundId', 'permalink', 'server', 'serverIp',
+                        'resolutionTime', 'errorDetails'),
+                       ('agentName', 'date', 'server', 'serverIp', 'errorDetails'),
+                       'roundId')
+
+""" Element of the agents list of /agents """
+Agent = recordType('Agent',
+                   ('agentId', 'agentName', 'agentType', 'countryId', 'location', 'ipAddresses',
+                    'publicIpAddresses', 'prefix', 'network', 'agentState', 'enabled', 'hostname',
+                    'lastSeen', 'utilization', 'verifySslCertificates', 'keepBrowserCache', 'clusterMembers',
+                    'groups', 'accountGroups', 'tests'),
+                   ('agentType', 'countryId', 'location', 'prefix', 'network', 'agentState', 'lastSeen'),
+                   'agentId')